@@ -0,0 +1,488 @@
+#!/usr/bin/env python3
+
+# Receives Direwolf's monitor output, which dw_aprs_gui.sh broadcasts
+# on UDP port 3333, and shows the APRS messages addressed to one or
+# more callsigns. Replaces the socat | sed | grep | sed | sed chain in
+# dw_aprs_gui.sh's monitorMessages, which runs this script instead
+# when it is installed.
+
+import argparse
+import asyncio
+import collections
+import json
+import os
+import re
+import signal
+import socket
+import stat
+import subprocess
+import sys
+import threading
+import time
+
+__author__ = "Steve Magnuson AG7GN"
+__copyright__ = "Copyright 2020, Steve Magnuson"
+__credits__ = ["Steve Magnuson"]
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Steve Magnuson"
+__email__ = "ag7gn@arrl.net"
+__status__ = "Production"
+
+DEFAULT_PORT = 3333
+# Frames queued for an output before the oldest is dropped
+DEFAULT_QUEUE_SIZE = 256
+# Direwolf's -t color escape sequences
+ANSI_RE = re.compile(rb"\x1b\[[0-9;]*m")
+# [channel timestamp] SOURCE>DESTINATION,PATH:INFO. dw_aprs_gui.sh runs
+# Direwolf with -T %Y%m%dT%H:%M:%S
+HEADER_RE = re.compile(r"^\[(\S+) (\d{8}T[^\]]*)\] ([^>\s]+)>([^:]*):(.*)$")
+
+MonitorFrame = collections.namedtuple(
+    'MonitorFrame', ['channel', 'time', 'source', 'destination', 'path',
+                     'info', 'addressee', 'lines'])
+MonitorFrame.__doc__ = """\
+One packet from Direwolf's monitor output. channel and time are as
+Direwolf printed them, path is a list of digipeaters, addressee is the
+addressee of an APRS message or None, and lines are the header line and
+the decoded lines that followed it, as Direwolf printed them."""
+
+
+class MonitorParser(object):
+    """
+    Splits Direwolf monitor output into frames. A frame starts with a
+    '[channel timestamp] SOURCE>DEST...' header line and ends at the
+    next empty line. The lines between frames (audio levels and so on)
+    are skipped. Output may arrive in pieces of any size; a partial line
+    is kept until the rest of it arrives.
+    """
+
+    def __init__(self):
+        self._partial = b''
+        self._lines = None
+        self._header = None
+
+    def feed(self, data: bytes) -> list:
+        """
+        :param data: Monitor output as received
+        :return: List of the MonitorFrames completed by data
+        """
+        frames = []
+        data = self._partial + data
+        end = data.rfind(b'\n')
+        if end < 0:
+            self._partial = data
+            return frames
+        self._partial = data[end + 1:]
+        text = ANSI_RE.sub(b'', data[:end]).decode('utf-8', 'replace')
+        for line in text.split('\n'):
+            line = line.rstrip('\r')
+            if self._lines is None:
+                match = HEADER_RE.match(line)
+                if match:
+                    self._lines = [line]
+                    self._header = match
+            elif not line:
+                frames.append(self._frame())
+            else:
+                self._lines.append(line)
+        return frames
+
+    def _frame(self) -> MonitorFrame:
+        channel, _time, source, path, info = self._header.groups()
+        path = path.split(',')
+        addressee = None
+        # APRS message: ':' then a 9 character addressee then ':'
+        if len(info) > 10 and info[0] == ':' and info[10] == ':':
+            addressee = info[1:10].strip()
+        frame = MonitorFrame(channel, _time, source, path[0], path[1:], info,
+                             addressee, self._lines)
+        self._lines = None
+        self._header = None
+        return frame
+
+
+class CallsignMatcher(object):
+    """
+    Selects the APRS messages addressed to a set of callsigns. A
+    callsign with an SSID (AG7GN-7) matches only that station, and one
+    without (AG7GN) matches it with any SSID. Messages sent by one of
+    the callsigns are not selected. Matching is two set lookups.
+    """
+
+    def __init__(self, calls):
+        calls = [c.upper() for c in calls]
+        self.stations = frozenset(c for c in calls if '-' in c)
+        self.bases = frozenset(c for c in calls if '-' not in c)
+
+    def __contains__(self, call: str) -> bool:
+        call = call.upper().rstrip('*')
+        return call in self.stations or call.split('-')[0] in self.bases
+
+    def __call__(self, frame: MonitorFrame) -> bool:
+        return frame.addressee is not None and \
+            frame.addressee in self and frame.source not in self
+
+
+def format_text(frame: MonitorFrame) -> bytes:
+    """
+    :return: The frame's lines as Direwolf printed them, and an empty
+             line
+    """
+    return ('\n'.join(frame.lines) + '\n\n').encode('utf-8')
+
+
+def format_json(frame: MonitorFrame) -> bytes:
+    """
+    :return: The frame as one line of JSON, with the receive time
+    """
+    record = frame._asdict()
+    record['received'] = round(time.time(), 3)
+    return (json.dumps(record) + '\n').encode('utf-8')
+
+
+class Output(object):
+    """
+    One destination for frames: a terminal, a pipe (such as the FIFO a
+    yad --listen window reads) or a log file. Frames wait in a bounded
+    queue. Pipes and terminals are written asynchronously, so a reader
+    that stops reading only holds up its own queue; once the queue is
+    full, the oldest frame in it is dropped and counted. Regular files
+    are written directly.
+    """
+
+    def __init__(self, name: str, _path: str, formatter,
+                 queue_size: int = DEFAULT_QUEUE_SIZE):
+        self.name = name
+        self.path = _path
+        self.formatter = formatter
+        self.queue_size = queue_size
+        self.queue = None
+        self.written = 0
+        self.dropped = 0
+        self._writer = None
+        self._file = None
+        self._hold = None
+        self.closed = False
+
+    async def open(self):
+        """
+        Opens the destination. '-' is standard output.
+
+        :return: None
+        """
+        self.queue = asyncio.Queue(self.queue_size)
+        if self.path == '-':
+            fd = os.dup(sys.stdout.fileno())
+        elif stat.S_ISFIFO(_mode(self.path)):
+            # Like exec 6<> in dw_aprs_gui.sh, the FIFO is held open for
+            # reading too, so that opening it does not wait for a
+            # reader and writes do not fail while there is none
+            self._hold = os.open(self.path, os.O_RDWR)
+            fd = os.open(self.path, os.O_WRONLY)
+        else:
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                         0o644)
+        if stat.S_ISREG(os.fstat(fd).st_mode):
+            self._file = os.fdopen(fd, 'wb')
+            return
+        loop = asyncio.get_running_loop()
+        transport, protocol = await loop.connect_write_pipe(
+            asyncio.streams.FlowControlMixin, os.fdopen(fd, 'wb'))
+        self._writer = asyncio.StreamWriter(transport, protocol, None, loop)
+
+    def offer(self, data: bytes):
+        """
+        Queues data for writing, dropping the oldest queued data if the
+        queue is full.
+
+        :param data: Formatted frame
+        :return: None
+        """
+        if self.closed:
+            self.dropped += 1
+            return
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(data)
+
+    async def run(self):
+        """
+        Writes queued data until cancelled or the destination goes
+        away. Frames for a destination that went away are counted as
+        dropped.
+
+        :return: None
+        """
+        try:
+            while True:
+                data = await self.queue.get()
+                if self._file is not None:
+                    self._file.write(data)
+                    self._file.flush()
+                else:
+                    self._writer.write(data)
+                    await self._writer.drain()
+                self.written += 1
+        except OSError as e:
+            print(f"WARNING: Stopped writing to {self.name}: {e}",
+                  file=sys.stderr)
+            self.closed = True
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+        elif self._writer is not None:
+            self._writer.close()
+        if self._hold is not None:
+            os.close(self._hold)
+
+
+def _mode(_path: str) -> int:
+    try:
+        return os.stat(_path).st_mode
+    except FileNotFoundError:
+        return 0
+
+
+class AprsMonitor(asyncio.DatagramProtocol):
+    """
+    Receives Direwolf monitor output datagrams, parses them into frames
+    once, and offers the frames that match to every Output.
+    """
+
+    def __init__(self, matcher, outputs: list):
+        self.matcher = matcher
+        self.outputs = outputs
+        self.parser = MonitorParser()
+        self.datagrams = 0
+        self.frames = 0
+        self.matched = 0
+
+    def datagram_received(self, data: bytes, addr):
+        self.datagrams += 1
+        for frame in self.parser.feed(data):
+            self.frames += 1
+            if self.matcher is not None and not self.matcher(frame):
+                continue
+            self.matched += 1
+            formatted = {}
+            for output in self.outputs:
+                if output.formatter not in formatted:
+                    formatted[output.formatter] = output.formatter(frame)
+                output.offer(formatted[output.formatter])
+
+    def summary(self) -> str:
+        """
+        :return: Datagram, frame and per output write and drop counts
+        """
+        return f"{self.datagrams} datagrams, {self.frames} frames, " \
+               f"{self.matched} matched. " + \
+               ', '.join(f"{o.name}: {o.written} written, {o.dropped} "
+                         f"dropped" for o in self.outputs)
+
+
+def udp_socket(port: int, host: str = '') -> socket.socket:
+    """
+    :param port: UDP port
+    :param host: Address to bind to. The default receives Direwolf's
+                 broadcasts alongside other listeners on the port, as
+                 socat's reuseaddr option does.
+    :return: Bound socket
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    # Room for a burst of Direwolf output while the outputs catch up
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+    sock.bind((host, port))
+    return sock
+
+
+async def _clear(output: Output, minutes: float):
+    # A form feed clears a yad --text-info window
+    while True:
+        await asyncio.sleep(minutes * 60)
+        output.offer(f"\f{time.strftime('%c')} Cleared monitor window. "
+                     f"Window is cleared every {minutes:g} minutes.\n"
+                     .encode('utf-8'))
+
+
+async def serve(sock: socket.socket, monitor: AprsMonitor,
+                clear_output: Output = None, clear_minutes: float = 0,
+                stopped: asyncio.Event = None):
+    """
+    Runs the monitor until stopped is set, or SIGTERM or SIGINT is
+    received if stopped is not supplied.
+
+    :param sock: Bound UDP socket
+    :param monitor: AprsMonitor
+    :param clear_output: Output to clear every clear_minutes minutes
+    :param clear_minutes: 0 never clears
+    :param stopped: Event that stops the monitor
+    :return: None
+    """
+    loop = asyncio.get_running_loop()
+    if stopped is None:
+        stopped = asyncio.Event()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, stopped.set)
+        loop.add_signal_handler(
+            signal.SIGUSR1, lambda: print(monitor.summary(), file=sys.stderr))
+    for output in monitor.outputs:
+        await output.open()
+    tasks = [asyncio.ensure_future(o.run()) for o in monitor.outputs]
+    if clear_output is not None and clear_minutes > 0:
+        tasks.append(asyncio.ensure_future(_clear(clear_output,
+                                                  clear_minutes)))
+    transport, _ = await loop.create_datagram_endpoint(lambda: monitor,
+                                                       sock=sock)
+    try:
+        await stopped.wait()
+    finally:
+        transport.close()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for output in monitor.outputs:
+            output.close()
+
+
+def _sed_chain(capture: str, call: str) -> float:
+    """
+    Runs dw_aprs_gui.sh's filter chain over a capture file.
+
+    :return: Seconds taken
+    """
+    command = f"sed -u 's/\\x1b\\[[0-9;]*m//g' {capture} | stdbuf -o0 " \
+              f"grep -Eav '^\\[.* [0-9]{{8}}T.*\\] {call}' | sed -uEn " \
+              f"'/^\\[.* [0-9]{{8}}T.*\\] .*>/,/^$/p' | sed -uEn " \
+              f"'/^\\[.* [0-9]{{8}}T.*\\] .*>.*::{call}.*/,/^$/p' " \
+              f">/dev/null"
+    start = time.perf_counter()
+    subprocess.run(['bash', '-c', command])
+    return time.perf_counter() - start
+
+
+def benchmark(capture: str, call: str):
+    """
+    Replays a capture of Direwolf monitor output over UDP on localhost,
+    one datagram per line as Direwolf writes them, as fast as a monitor
+    with a text and an NDJSON output to /dev/null takes them. Reports
+    the rates and any datagrams the kernel dropped, and how long
+    dw_aprs_gui.sh's sed chain takes to filter the same capture from a
+    file.
+
+    :param capture: Recording of Direwolf output, e.g. from
+                    'socat -u udp-recv:3333,reuseaddr - >capture'
+    :param call: Callsign to filter on
+    :return: None
+    """
+    with open(capture, 'rb') as f:
+        datagrams = f.read().splitlines(keepends=True)
+    sock = udp_socket(0, '127.0.0.1')
+    port = sock.getsockname()[1]
+    burst = 256
+    monitor = AprsMonitor(CallsignMatcher([call]),
+                          [Output("text", os.devnull, format_text),
+                           Output("ndjson", os.devnull, format_json)])
+
+    def _send(loop, stopped):
+        # Sends in bursts, and waits for the monitor to catch up before
+        # the socket buffer could overflow, so what is measured is the
+        # monitor rather than the kernel's drops
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        for ix, data in enumerate(datagrams, 1):
+            sender.sendto(data, ('127.0.0.1', port))
+            if ix % burst == 0:
+                while monitor.datagrams < ix - burst // 2:
+                    time.sleep(0.0005)
+        sender.close()
+        time.sleep(0.2)
+        loop.call_soon_threadsafe(stopped.set)
+
+    async def _run():
+        stopped = asyncio.Event()
+        threading.Thread(target=_send,
+                         args=(asyncio.get_running_loop(), stopped),
+                         daemon=True).start()
+        await serve(sock, monitor, stopped=stopped)
+
+    start = time.perf_counter()
+    asyncio.run(_run())
+    # Less the sender's final wait
+    elapsed = time.perf_counter() - start - 0.2
+    print(f"{len(datagrams)} datagrams sent, {monitor.summary()}",
+          file=sys.stderr)
+    print(f"aprs_monitor.py: {elapsed:.3f} s, "
+          f"{monitor.datagrams / elapsed:.0f} datagrams/s. Kernel dropped "
+          f"{len(datagrams) - monitor.datagrams}", file=sys.stderr)
+    print(f"sed chain (from file): {_sed_chain(capture, call):.3f} s",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog='aprs_monitor.py',
+        description="Shows the APRS messages addressed to CALL in "
+                    "Direwolf's monitor output, received on a UDP port",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('-v', '--version', action='version',
+                        version=f"Version: {__version__}")
+    parser.add_argument("-c", "--call", action='append', metavar="CALL",
+                        help="Show messages addressed to CALL. CALL-SSID "
+                             "matches only that SSID; CALL without an SSID "
+                             "matches all of them. Messages sent by CALL "
+                             "are not shown. Can be repeated")
+    parser.add_argument("-a", "--all", action='store_true',
+                        help="Show every frame rather than only messages "
+                             "addressed to CALL")
+    parser.add_argument("-p", "--port", type=int, default=DEFAULT_PORT,
+                        help="UDP port Direwolf's output is sent to")
+    parser.add_argument("--no_terminal", action='store_true',
+                        help="Do not print frames on standard output")
+    parser.add_argument("--yad", type=str, metavar="FIFO",
+                        help="Also write frames to FIFO, e.g. the one a "
+                             "yad --text-info --listen window reads")
+    parser.add_argument("--yad_clear", type=float, default=0,
+                        metavar="MINUTES",
+                        help="Clear the --yad window every MINUTES "
+                             "minutes. 0 never clears it")
+    parser.add_argument("--log", type=str, metavar="FILE",
+                        help="Append each frame to FILE as a line of JSON")
+    parser.add_argument("--queue_size", type=int, default=DEFAULT_QUEUE_SIZE,
+                        help="Frames queued for each output. When an "
+                             "output falls this far behind, its oldest "
+                             "frames are dropped")
+    parser.add_argument("--benchmark", type=str, metavar="CAPTURE",
+                        help=argparse.SUPPRESS)
+    arg_info = parser.parse_args()
+    if arg_info.benchmark:
+        benchmark(arg_info.benchmark, (arg_info.call or ["N0CALL"])[0])
+        sys.exit(0)
+    if not arg_info.call and not arg_info.all:
+        parser.error("Supply -c/--call or -a/--all")
+    outputs = []
+    if not arg_info.no_terminal:
+        outputs.append(Output("terminal", '-', format_text,
+                              arg_info.queue_size))
+    yad = None
+    if arg_info.yad:
+        yad = Output("yad", arg_info.yad, format_text, arg_info.queue_size)
+        outputs.append(yad)
+    if arg_info.log:
+        outputs.append(Output("log", arg_info.log, format_json,
+                              arg_info.queue_size))
+    if not outputs:
+        parser.error("Nothing to write frames to")
+    matcher = None if arg_info.all else CallsignMatcher(arg_info.call)
+    monitor = AprsMonitor(matcher, outputs)
+    try:
+        sock = udp_socket(arg_info.port)
+    except OSError as e:
+        print(f"ERROR: Cannot listen on UDP port {arg_info.port}: {e}",
+              file=sys.stderr)
+        sys.exit(1)
+    asyncio.run(serve(sock, monitor, yad, arg_info.yad_clear))
+    print(monitor.summary(), file=sys.stderr)
+    sys.exit(0)
@@ -0,0 +1,770 @@
+#!/usr/bin/env python3
+
+# Hardware-free benchmarks for usb_control.py, radio-monitor.py and
+# shutdown_button.py. USB devices come from a synthetic sysfs tree,
+# sudo from a stub on PATH, the GPIOs from nexus_gpio.FakeGPIOBackend,
+# nexus_gpio.MockRPiGPIO and gpiozero's MockFactory, and the Tk widgets
+# from small stand-ins, so it runs on any Linux machine, without a Pi
+# or a display.
+#
+# Results are compared with bench/baseline.json, which is kept in the
+# repository. A run fails (exit status 1) when a benchmark's fastest
+# time is slower than its baseline fastest time by more than
+# --compare-fail percent, on a second measurement too.
+
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import usb_control
+import nexus_gpio
+import ptt_monitor
+import shutdown_button
+import gpio_supervisor
+
+__author__ = "Steve Magnuson AG7GN"
+__copyright__ = "Copyright 2020, Steve Magnuson"
+__credits__ = ["Steve Magnuson"]
+__license__ = "GPL"
+__version__ = "1.2.0"
+__maintainer__ = "Steve Magnuson"
+__email__ = "ag7gn@arrl.net"
+__status__ = "Production"
+
+BENCH_BASELINE = os.path.join(REPO_DIR, 'bench', 'baseline.json')
+DEFAULT_SIZES = (1, 10, 50, 200)
+DEFAULT_RADIOS = (2, 8)
+DEFAULT_ROUNDS = 20
+# Minimum length (ms) of a round. Fast functions are called as many
+# times per round as it takes to reach it.
+DEFAULT_MIN_TIME = 5
+DEFAULT_COMPARE_FAIL = 25
+# Ports per synthetic hub, as on a 7 port hub
+HUB_PORTS = 7
+SUDO_STUB = """#!/bin/sh
+# Stand-in for sudo: runs the command as the calling user
+exec "$@"
+"""
+LSUSB_STUB = """#!/bin/sh
+# Stand-in for lsusb, listing the synthetic tree in $NEXUS_BENCH_USB
+if [ "$1" = "-D" ]; then
+    exec cat "$NEXUS_BENCH_USB/lsusb/${2#/dev/bus/usb/}"
+fi
+exec cat "$NEXUS_BENCH_USB/lsusb/list"
+"""
+# Largest --sizes the lsusb/grep scan is timed with. It starts 2
+# pipelines per device, so bigger trees take seconds per call.
+LSUSB_MAX_SIZE = 10
+
+
+def _load_script(name: str, _file: str):
+    # radio-monitor.py cannot be imported by name
+    spec = importlib.util.spec_from_file_location(
+        name, os.path.join(REPO_DIR, _file))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+radio_monitor = _load_script('radio_monitor', 'radio-monitor.py')
+
+
+def fake_usb_sysfs(root: str, count: int) -> str:
+    """
+    Builds a synthetic /sys/bus/usb tree with a root hub, a hub for
+    every HUB_PORTS devices and count devices behind them. Each device
+    has an interface directory, a uevent file, and the identity and
+    telemetry attributes usb_control.py reads. Every third device is
+    unbound, and every other one has a serial number.
+
+    The names in usb.ids differ from the descriptor strings. Only the
+    even devices have a product name in it, and every fifth device has
+    a vendor that is not in it, so the names lsusb shows come from both.
+    The lsusb directory holds what the lsusb stub prints for the tree:
+    the device list in 'list', and each device's descriptors in
+    BUS/DEVICE.
+
+    :param root: Directory to build the tree in
+    :param count: Number of devices, hubs not included
+    :return: root
+    """
+    devices_dir = os.path.join(root, 'devices')
+    driver_dir = os.path.join(root, 'drivers', 'usb')
+    os.makedirs(devices_dir)
+    os.makedirs(driver_dir)
+    for _action in ('bind', 'unbind'):
+        open(os.path.join(driver_dir, _action), 'w').close()
+    lsusb_dir = os.path.join(root, 'lsusb', '001')
+    os.makedirs(lsusb_dir)
+    devnum = iter(range(1, 128 * 128))
+    listing = []
+    usb_ids = {'1d6b': "Linux Foundation", '1d6b:0002': "2.0 root hub",
+               '2109': "VIA Labs, Inc.", '2109:3431': "Hub",
+               '0d8c': "C-Media Electronics, Inc."}
+
+    def _device(port, attrs, bound=True):
+        _path = os.path.join(devices_dir, port)
+        os.makedirs(os.path.join(_path, 'power'))
+        attrs = dict(attrs, busnum='1', devnum=str(next(devnum)))
+        for attr, value in attrs.items():
+            with open(os.path.join(_path, attr), 'w') as f:
+                f.write(f"{value}\n")
+        _devnum = f"{int(attrs['devnum']):03d}"
+        with open(os.path.join(_path, 'uevent'), 'w') as f:
+            f.write(f"DEVTYPE=usb_device\nBUSNUM=001\nDEVNUM={_devnum}\n"
+                    f"DEVNAME=bus/usb/001/{_devnum}\n")
+        _id = f"{attrs['idVendor']}:{attrs['idProduct']}"
+        # lsusb's names: from usb.ids, else from the descriptors
+        names = [usb_ids.get(_id[:4]) or attrs.get('manufacturer'),
+                 usb_ids.get(_id) or attrs.get('product')]
+        listing.append(f"Bus 001 Device {_devnum}: ID {_id} "
+                       f"{' '.join(n for n in names if n)}\n")
+        with open(os.path.join(lsusb_dir, _devnum), 'w') as f:
+            f.write(f"Device Descriptor:\n  bDeviceClass {attrs['bDeviceClass']}"
+                    f"{' Hub' if attrs['bDeviceClass'] == '09' else ''}\n")
+        if bound:
+            os.symlink(_path, os.path.join(driver_dir, port))
+        if not port.startswith('usb'):
+            os.mkdir(os.path.join(devices_dir, f"{port}:1.0"))
+
+    hub = {'idVendor': '2109', 'idProduct': '3431', 'bDeviceClass': '09',
+           'product': 'USB2.0 Hub', 'bMaxPower': '100mA', 'speed': '480'}
+    _device('usb1', dict(hub, idVendor='1d6b', idProduct='0002',
+                         product='xHCI Host Controller'))
+    for ix in range(count):
+        hub_port, port = divmod(ix, HUB_PORTS)
+        if port == 0:
+            _device(f"1-{hub_port + 1}", hub)
+        vendor = '1209' if ix % 5 == 4 else '0d8c'
+        if ix % 2 == 0 and vendor in usb_ids:
+            usb_ids[f"{vendor}:{ix:04x}"] = f"CM108 Audio Controller {ix}"
+        attrs = {'idVendor': vendor, 'idProduct': f"{ix:04x}",
+                 'bDeviceClass': '00',
+                 'manufacturer': 'C-Media Electronics Inc.',
+                 'product': f"USB Audio Device {ix}",
+                 'bMaxPower': '100mA', 'speed': '12',
+                 'urbnum': str(ix * 1000),
+                 'power/runtime_status': 'active',
+                 'power/active_duration': str(ix * 500)}
+        if ix % 2:
+            attrs['serial'] = f"{ix:08d}"
+        _device(f"1-{hub_port + 1}.{port + 1}", attrs, bound=ix % 3 != 0)
+    with open(os.path.join(root, 'lsusb', 'list'), 'w') as f:
+        f.writelines(listing)
+    with open(os.path.join(root, 'usb.ids'), 'w') as f:
+        for _id, name in sorted(usb_ids.items()):
+            # Vendors are followed by their products
+            f.write(f"\t{_id[5:]}  {name}\n" if ':' in _id
+                    else f"{_id}  {name}\n")
+    return root
+
+
+def lsusb_get_usb_devices(sysfs_root: str) -> list:
+    """
+    usb_control.py's get_usb_devices() as it was before it read sysfs:
+    lsusb for the list, then for every device a 'sudo lsusb -D | grep'
+    pipeline to skip hubs and a 'grep -l | tail' pipeline to find its
+    sysfs directory. Only the /sys/bus/usb paths are changed, to
+    sysfs_root, and the directory is taken from the end of the uevent
+    path rather than its sixth component.
+
+    :param sysfs_root: Synthetic tree from fake_usb_sysfs()
+    :return: List of (ID, Tag, Device, State) tuples
+    """
+    device_re = re.compile("Bus\\s+(?P<bus>\\d+)\\s+"
+                           "Device\\s+(?P<device>\\d+).+"
+                           "ID\\s(?P<id>\\w+:\\w+)\\s(?P<tag>.+)$", re.I)
+    devices = []
+    try:
+        df = subprocess.check_output("lsusb").decode('utf-8')
+    except subprocess.CalledProcessError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return devices
+    for i in df.split('\n'):
+        hub = True  # Assume device is a hub
+        if i:
+            info = device_re.match(i)
+            if info:
+                dinfo = info.groupdict()
+                _bus = dinfo.pop('bus')
+                _device = dinfo.pop('device')
+                # See if the device is a hub. Ignore it if it is
+                cmd = f"sudo lsusb -D /dev/bus/usb/{_bus}/{_device} 2>/dev/null | grep -qi 'bDeviceClass.*Hub'"
+                try:
+                    subprocess.check_output(cmd, shell=True).decode('utf-8')
+                except subprocess.CalledProcessError:
+                    hub = False  # Did not find 'Hub' in 'nDeviceClass'
+                if hub:  # Device is a hub, so skip it.
+                    continue
+                cmd = f"grep -l {_bus}/{_device} {sysfs_root}/devices/*/uevent 2>/dev/null | tail -1"
+                try:
+                    product = subprocess.check_output(cmd, shell=True).decode('utf-8')
+                except subprocess.CalledProcessError as e:
+                    print(f"ERROR: {e}", file=sys.stderr)
+                    continue
+                if product:
+                    _p = os.path.basename(os.path.dirname(product.strip()))
+                    if os.path.islink(f"{sysfs_root}/drivers/usb/{_p}"):
+                        status = "Enabled"
+                    else:
+                        status = 'Disabled'
+                    devices.append((dinfo['id'], dinfo['tag'],
+                                    _p, status))
+    return devices
+
+
+def install_stubs(bin_dir: str):
+    """
+    Puts stub sudo and lsusb commands first on PATH. With the sudo
+    stub, the privileged helper UsbStateWriter starts when not running
+    as root writes to the synthetic tree without asking for a
+    password. The lsusb stub lists the tree named by $NEXUS_BENCH_USB
+    for lsusb_get_usb_devices().
+
+    :param bin_dir: Directory for the stubs
+    :return: None
+    """
+    os.makedirs(bin_dir, exist_ok=True)
+    for name, stub in (('sudo', SUDO_STUB), ('lsusb', LSUSB_STUB)):
+        _path = os.path.join(bin_dir, name)
+        with open(_path, 'w') as f:
+            f.write(stub)
+        os.chmod(_path, 0o755)
+    os.environ['PATH'] = f"{bin_dir}{os.pathsep}{os.environ['PATH']}"
+
+
+class FakeTreeview(object):
+    """
+    The part of ttk.Treeview that UsbWindow._build_tree uses, keeping
+    rows in a list and a dictionary instead of a Tk widget.
+    """
+
+    def __init__(self):
+        self.rows = {}
+        self.order = []
+        self.widths = {}
+
+    def get_children(self, _item: str = '') -> tuple:
+        return tuple(self.order)
+
+    def insert(self, _parent, _index, iid, values):
+        self.order.append(iid)
+        self.rows[iid] = {'values': tuple(values), 'tags': ''}
+
+    def delete(self, *items):
+        for iid in items:
+            self.order.remove(iid)
+            del self.rows[iid]
+
+    def item(self, iid, option=None, **kwargs):
+        if kwargs:
+            self.rows[iid].update(kwargs)
+            return None
+        return self.rows[iid][option]
+
+    def index(self, iid) -> int:
+        return self.order.index(iid)
+
+    def move(self, iid, _parent, index):
+        self.order.remove(iid)
+        self.order.insert(index, iid)
+
+    def column(self, col, width=None):
+        self.widths[col] = width
+
+    def heading(self, *_, **__):
+        pass
+
+
+class FakeFont(object):
+    """
+    tkinter.font.Font stand-in with a fixed 7 pixel character width.
+    """
+
+    def __init__(self, *_, **__):
+        pass
+
+    @staticmethod
+    def measure(text: str) -> int:
+        return len(text) * 7
+
+
+class FakeWidget(object):
+    """
+    Stand-in for the Tk, Frame, Label and Button widgets. after() and
+    createfilehandler() drop the callback; the benchmarks call the
+    handlers themselves.
+    """
+
+    def __init__(self, *_, **kwargs):
+        self.options = kwargs
+
+    def configure(self, **kwargs):
+        self.options.update(kwargs)
+
+    def after(self, _ms, _callback):
+        pass
+
+    def createfilehandler(self, _fd, _mask, _callback):
+        pass
+
+    def deletefilehandler(self, _fd):
+        pass
+
+    def pack(self, **_):
+        pass
+
+    def geometry(self, _spec=None):
+        pass
+
+    def title(self, _title):
+        pass
+
+    def destroy(self):
+        pass
+
+    def update_idletasks(self):
+        pass
+
+    @staticmethod
+    def winfo_height() -> int:
+        return 300
+
+
+# tkinter and tkinter.font as far as radio-monitor.py's StatusWindow
+# uses them
+FAKE_TKINTER = types.SimpleNamespace(
+    Tk=FakeWidget, Frame=FakeWidget, Label=FakeWidget, Button=FakeWidget,
+    TOP='top', BOTTOM='bottom', LEFT='left', X='x', READABLE=2)
+FAKE_TKFONT = types.SimpleNamespace(Font=FakeFont)
+
+
+def _usb_window(devices: list):
+    # A UsbWindow with only the state _build_tree needs
+    window = usb_control.UsbWindow.__new__(usb_control.UsbWindow)
+    window.master = FakeWidget()
+    window.tree = FakeTreeview()
+    window.header = ["ID", "Tag", "Device", "State"]
+    window.telemetry = None
+    window.pending = {}
+    window.metrics = {}
+    window._font = window._header_font = FakeFont()
+    window._text_widths = {}
+    window._header_widths = {}
+    window._col_widths = {}
+    window._window_width = None
+    window._sort_col = None
+    window._sort_descending = False
+    window.current_list = devices
+    return window
+
+
+def _toggled(devices: list, ix: int) -> list:
+    # devices with one device's state flipped, as after a click
+    d = devices[ix]
+    state = "Disabled" if d[3] == "Enabled" else "Enabled"
+    return devices[:ix] + [d[:3] + (state,)] + devices[ix + 1:]
+
+
+def usb_benchmarks(tmpdir: str, sizes) -> list:
+    """
+    :param tmpdir: Directory for the synthetic sysfs trees
+    :param sizes: Numbers of USB devices to benchmark with
+    :return: List of (name, function) tuples
+    """
+    benchmarks = []
+    for size in sizes:
+        root = fake_usb_sysfs(os.path.join(tmpdir, f"usb{size}"), size)
+        usb_control.USB_IDS_FILES = (os.path.join(root, 'usb.ids'),)
+        devices = usb_control.get_usb_devices(root)
+        inventory = usb_control.UsbInventory()
+        usb_control.get_usb_devices(root, inventory)
+        telemetry = usb_control.UsbTelemetry(root)
+        window = _usb_window(devices)
+        window._build_tree()
+        lists = [devices, _toggled(devices, len(devices) // 2)]
+
+        def build_tree(_devices=devices):
+            _usb_window(_devices)._build_tree()
+
+        def refresh_tree(_window=window, _lists=lists):
+            # Alternates between two lists differing in one device
+            _lists.reverse()
+            _window.current_list = _lists[0]
+            _window._build_tree()
+
+        if size <= LSUSB_MAX_SIZE:
+            # The scan usb_control.py used to do, for comparison
+            def lsusb_scan(_root=root):
+                os.environ['NEXUS_BENCH_USB'] = _root
+                return lsusb_get_usb_devices(_root)
+
+            if sorted(lsusb_scan()) != sorted(devices):
+                raise RuntimeError(f"The lsusb/grep and sysfs scans of "
+                                   f"{root} differ")
+            benchmarks.append((f"usb.get_usb_devices_lsusb[{size}]",
+                               lsusb_scan))
+        benchmarks += [
+            (f"usb.get_usb_devices[{size}]",
+             lambda _root=root: usb_control.get_usb_devices(_root)),
+            (f"usb.get_usb_devices_cached[{size}]",
+             lambda _root=root, _inventory=inventory:
+             usb_control.get_usb_devices(_root, _inventory)),
+            (f"usb.telemetry_sample[{size}]",
+             lambda _devices=devices, _telemetry=telemetry:
+             _telemetry.sample(_devices)),
+            (f"usb._build_tree[{size}]", build_tree),
+            (f"usb._build_tree_refresh[{size}]", refresh_tree),
+        ]
+    root = fake_usb_sysfs(os.path.join(tmpdir, "usb_batch"), 10)
+    devices = usb_control.get_usb_devices(root)
+
+    def batch():
+        usb_control.set_usb_devices_state(
+            [(d, 'unbind') for d in devices] +
+            [(d, 'bind') for d in devices], root)
+
+    benchmarks.append(("usb.set_usb_devices_state[10]", batch))
+    return benchmarks
+
+
+def _status_window(radios: int, gpio=None):
+    # A radio-monitor.py StatusWindow on Tk stand-ins, fed by gpio, a
+    # FakeGPIOBackend by default
+    radio_monitor.tkinter = FAKE_TKINTER
+    radio_monitor.tkfont = FAKE_TKFONT
+    if gpio is None:
+        gpio = nexus_gpio.FakeGPIOBackend()
+    monitor = ptt_monitor.PttMonitor(
+        gpio, [(f"Radio {ix + 1}", 2 + ix) for ix in range(radios)])
+    monitor.start()
+    window = radio_monitor.StatusWindow(
+        monitor=monitor, radio_colors=[("yellow", "green", "blue"),
+                                       ("yellow", "green", "red")])
+    return gpio, monitor, window
+
+
+def radio_benchmarks(radio_counts) -> list:
+    """
+    :param radio_counts: Numbers of radios to benchmark with
+    :return: List of (name, function) tuples
+    """
+    benchmarks = []
+    for radios in radio_counts:
+        gpio, monitor, window = _status_window(radios)
+        benchmarks.append((f"radio.status_handler_idle[{radios}]",
+                           window.status_handler))
+        gpio, monitor, window = _status_window(radios)
+        # Redraw on every edge, however close together they are
+        window.min_tx_display = 0
+        # Every radio keys up on one call and unkeys on the next
+        timeline = [[(pin, value) for pin in monitor.names]
+                    for value in (1, 0)]
+
+        def edges(_gpio=gpio, _window=window, _timeline=timeline):
+            _timeline.reverse()
+            for pin, value in _timeline[0]:
+                _gpio.set(pin, value)
+            _window.status_handler()
+
+        benchmarks.append((f"radio.status_handler_edges[{radios}]", edges))
+
+        # radio-monitor.py's default backend, with --ptt_input, on
+        # MockRPiGPIO. The edges reach the monitor from MockRPiGPIO's
+        # callback thread, so each call waits for all of them.
+        mock = nexus_gpio.MockRPiGPIO()
+        gpio, monitor, window = _status_window(
+            radios, nexus_gpio.RPiGPIOBackend(input=True, GPIO=mock))
+        window.min_tx_display = 0
+        arrived = threading.Semaphore(0)
+
+        def wakeup(_wakeup=window.wakeup, _arrived=arrived):
+            _wakeup()
+            _arrived.release()
+
+        monitor.wakeup = wakeup
+        # Reversed before use, so the first call keys up
+        timeline = [[(pin, value) for pin in monitor.names]
+                    for value in (0, 1)]
+
+        def rpi_gpio_edges(_mock=mock, _window=window, _timeline=timeline,
+                           _arrived=arrived):
+            _timeline.reverse()
+            for pin, value in _timeline[0]:
+                _mock.set(pin, value)
+            for _ in _timeline[0]:
+                if not _arrived.acquire(timeout=1):
+                    raise RuntimeError("MockRPiGPIO lost an edge")
+            _window.status_handler()
+
+        benchmarks.append((f"radio.status_handler_rpi_gpio[{radios}]",
+                           rpi_gpio_edges))
+    return benchmarks
+
+
+def _thresholds() -> list:
+    return [(shutdown_button.reboot_after, ['/sbin/reboot']),
+            (shutdown_button.poweroff_after, ['/sbin/poweroff'])]
+
+
+def button_benchmarks() -> list:
+    """
+    Every benchmark presses and releases the button after a hold
+    between the reboot and poweroff thresholds. The commands are
+    recorded, never run.
+
+    :return: List of (name, function) tuples
+    """
+    def ran(_command):
+        pass
+
+    machine = shutdown_button.ButtonStateMachine(_thresholds(),
+                                                 run=ran)
+    hold = (shutdown_button.reboot_after + shutdown_button.poweroff_after) / 2
+
+    def state_machine():
+        _now = time.monotonic()
+        machine.pressed(_now)
+        machine.released(_now + hold)
+
+    benchmarks = [("button.state_machine", state_machine)]
+
+    # gpio_supervisor.py's button, from FakeGPIOBackend edges
+    gpio = nexus_gpio.FakeGPIOBackend()
+    button = gpio_supervisor.ShutdownButton(
+        gpio, shutdown_button.use_button,
+        shutdown_button.ButtonStateMachine(
+            _thresholds(), led=gpio_supervisor.GpioLed(
+                gpio, shutdown_button.use_led), run=ran))
+    button.start(lambda pin, value, timestamp: button.edge(value,
+                                                           timestamp))
+
+    def supervisor_edges():
+        gpio.set(button.pin, 0)
+        gpio.set(button.pin, 1)
+
+    benchmarks.append(("button.supervisor_edges", supervisor_edges))
+
+    # shutdown_button.py's own gpiozero callbacks, on mock pins
+    try:
+        from gpiozero import Button, LED
+        from gpiozero.pins.mock import MockFactory
+    except ImportError:
+        print("WARNING: gpiozero is not installed. Skipping the gpiozero "
+              "button benchmark", file=sys.stderr)
+        return benchmarks
+    factory = MockFactory()
+    zero_machine = shutdown_button.ButtonStateMachine(
+        _thresholds(), LED(shutdown_button.use_led, pin_factory=factory),
+        run=ran)
+    zero_button = Button(shutdown_button.use_button, pin_factory=factory)
+    shutdown_button.attach(zero_button, zero_machine)
+    pin = factory.pin(shutdown_button.use_button)
+
+    # The default argument keeps the Button, and with it the
+    # callbacks, alive
+    def gpiozero_edges(_button=zero_button):
+        pin.drive_low()
+        pin.drive_high()
+
+    benchmarks.append(("button.gpiozero_callbacks", gpiozero_edges))
+    return benchmarks
+
+
+def measure(fn, rounds: int, min_time: float) -> dict:
+    """
+    Times fn the way pytest-benchmark does: the number of calls per
+    round is calibrated so that a round lasts at least min_time, and
+    the statistics are of the time per call over rounds rounds.
+
+    :param fn: Function to time, called without arguments
+    :param rounds: Number of timed rounds
+    :param min_time: Minimum round length in seconds
+    :return: Dictionary of statistics in seconds per call
+    """
+    iterations = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        iterations = max(iterations * 2,
+                         int(iterations * min_time / max(elapsed, 1e-9)))
+    times = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        times.append((time.perf_counter() - start) / iterations)
+    return {'min': min(times), 'max': max(times),
+            'mean': statistics.mean(times),
+            'stddev': statistics.stdev(times) if rounds > 1 else 0.0,
+            'median': statistics.median(times), 'rounds': rounds,
+            'iterations': iterations}
+
+
+def load_results(_path: str) -> dict:
+    """
+    :param _path: Results file
+    :return: Dictionary of benchmark name: statistics. Empty if the
+             file does not exist.
+    """
+    try:
+        with open(_path, 'r') as f:
+            return json.load(f).get('benchmarks', {})
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError, AttributeError) as e:
+        print(f"WARNING: Ignoring {_path}: {e}", file=sys.stderr)
+        return {}
+
+
+def save_results(_path: str, results: dict):
+    """
+    Replaces the results file, atomically.
+
+    :param _path: Results file
+    :param results: Dictionary of benchmark name: statistics
+    :return: None
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(_path)), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(_path)))
+    with os.fdopen(fd, 'w') as f:
+        json.dump({'machine': platform.node(),
+                   'python': platform.python_version(),
+                   'saved': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                   'benchmarks': results}, f, indent=1, sort_keys=True)
+    os.replace(tmp, _path)
+
+
+def _us(seconds: float) -> str:
+    return f"{seconds * 1e6:.1f}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog='nexus_bench.py',
+        description="Benchmarks usb_control.py, radio-monitor.py and "
+                    "shutdown_button.py without USB or GPIO hardware. "
+                    "Times are in microseconds per call",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('-v', '--version', action='version',
+                        version=f"Version: {__version__}")
+    parser.add_argument("-k", type=str, metavar="REGEX",
+                        help="Only run the benchmarks whose names match "
+                             "REGEX")
+    parser.add_argument("--list", action='store_true',
+                        help="List the benchmarks and exit")
+    parser.add_argument("--sizes", type=str,
+                        default=','.join(str(s) for s in DEFAULT_SIZES),
+                        help="Comma separated numbers of synthetic USB "
+                             "devices to benchmark with")
+    parser.add_argument("--radios", type=str,
+                        default=','.join(str(r) for r in DEFAULT_RADIOS),
+                        help="Comma separated numbers of radios to "
+                             "benchmark the PTT status window with")
+    parser.add_argument("--rounds", type=int, default=DEFAULT_ROUNDS,
+                        help="Timed rounds per benchmark")
+    parser.add_argument("--min-time", type=float, default=DEFAULT_MIN_TIME,
+                        metavar="MS",
+                        help="Minimum length of a round in milliseconds")
+    parser.add_argument("--results", type=str, default=BENCH_BASELINE,
+                        metavar="FILE",
+                        help="Baseline file the results are compared with "
+                             "and saved in")
+    parser.add_argument("--compare-fail", type=float,
+                        default=DEFAULT_COMPARE_FAIL, metavar="PERCENT",
+                        help="Fail when a benchmark's fastest time is more "
+                             "than PERCENT slower than its saved fastest "
+                             "time")
+    parser.add_argument("--save", action='store_true',
+                        help="Save this run's results in place of the "
+                             "saved ones, even when slower. Results of "
+                             "benchmarks without saved results are "
+                             "always saved")
+    arg_info = parser.parse_args()
+    try:
+        sizes = [int(s) for s in arg_info.sizes.split(',') if s]
+        radio_counts = [int(r) for r in arg_info.radios.split(',') if r]
+    except ValueError:
+        parser.error("--sizes and --radios take comma separated numbers")
+    if arg_info.rounds < 1:
+        parser.error("--rounds must be at least 1")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        install_stubs(os.path.join(tmpdir, 'bin'))
+        benchmarks = usb_benchmarks(tmpdir, sizes) + \
+            radio_benchmarks(radio_counts) + button_benchmarks()
+        if arg_info.k:
+            pattern = re.compile(arg_info.k)
+            benchmarks = [b for b in benchmarks if pattern.search(b[0])]
+        if arg_info.list:
+            print('\n'.join(name for name, _ in benchmarks))
+            sys.exit(0)
+        saved = load_results(arg_info.results)
+        results = {}
+        rows = []
+        regressions = []
+        for name, fn in benchmarks:
+            stats = measure(fn, arg_info.rounds, arg_info.min_time / 1000)
+            change = ''
+            if name in saved:
+                limit = saved[name]['min'] * (1 + arg_info.compare_fail / 100)
+                if stats['min'] > limit:
+                    # Measure again before calling it a regression, in
+                    # case something else was using the CPU
+                    stats = min(stats, measure(fn, arg_info.rounds,
+                                               arg_info.min_time / 1000),
+                                key=lambda _stats: _stats['min'])
+                change = f"{stats['min'] / saved[name]['min'] - 1:+.0%}"
+                if stats['min'] > limit:
+                    regressions.append(name)
+                    change += " REGRESSION"
+            results[name] = stats
+            rows.append((name, _us(stats['min']), _us(stats['median']),
+                         _us(stats['mean']), _us(stats['stddev']),
+                         f"{stats['rounds']}x{stats['iterations']}",
+                         f"{1 / stats['mean']:.0f}", change))
+            print(f"{name}: median {_us(stats['median'])} us",
+                  file=sys.stderr)
+    print(usb_control.format_table(
+        rows, ["Benchmark", "Min", "Median", "Mean", "StdDev", "Rounds",
+               "OPS", "vs Saved"]))
+    for name, stats in results.items():
+        sysfs = results.get(name.replace('_lsusb[', '['))
+        if '_lsusb[' in name and sysfs:
+            print(f"{name.replace('_lsusb', '')}: sysfs scan "
+                  f"{stats['median'] / sysfs['median']:.0f}x faster than "
+                  f"lsusb/grep")
+    # The baseline only changes when asked to, or to add benchmarks it
+    # has no results for
+    new = {name: stats for name, stats in results.items()
+           if arg_info.save or name not in saved}
+    if new:
+        saved.update(new)
+        try:
+            save_results(arg_info.results, saved)
+        except OSError as e:
+            print(f"WARNING: Cannot save results to {arg_info.results}: "
+                  f"{e}", file=sys.stderr)
+    if regressions:
+        print(f"ERROR: {len(regressions)} benchmark(s) more than "
+              f"{arg_info.compare_fail:g}% slower than saved: "
+              f"{', '.join(regressions)}", file=sys.stderr)
+        sys.exit(1)
+    sys.exit(0)
@@ -17,7 +17,7 @@
 #%
 #================================================================
 #- IMPLEMENTATION
-#-    version         ${SCRIPT_NAME} 1.2.1
+#-    version         ${SCRIPT_NAME} 1.3.0
 #-    author          Steve Magnuson, AG7GN
 #-    license         CC-BY-SA Creative Commons License
 #-    script_id       0
@@ -92,11 +92,22 @@ function GetSwitchState () {
 	P[3]=6
 	P[4]=5
 	local LEVERS=""
-	for I in 1 2 3 4
-	do
-		J=$($GPIO get ${P[$I]} | cut -d' ' -f3 | cut -d'=' -f2) # State of a switch in the piano (0 or 1)
-		(( $J == 0 )) && LEVERS="$LEVERS$I"
-	done
+	local -a V
+	# nexus_gpio.py reads all 4 switches at once through the GPIO character
+	# device. Fall back to one raspi-gpio call per switch if it can't.
+	if [[ -x $NEXUS_GPIO ]] && V=( $($NEXUS_GPIO ${P[1]} ${P[2]} ${P[3]} ${P[4]} 2>/dev/null) ) && (( ${#V[@]} == 4 ))
+	then
+		for I in 1 2 3 4
+		do
+			(( ${V[$I-1]} == 0 )) && LEVERS="$LEVERS$I"
+		done
+	else
+		for I in 1 2 3 4
+		do
+			J=$($GPIO get ${P[$I]} | cut -d' ' -f3 | cut -d'=' -f2) # State of a switch in the piano (0 or 1)
+			(( $J == 0 )) && LEVERS="$LEVERS$I"
+		done
+	fi
 	echo "$LEVERS"
 }
 
@@ -113,6 +124,7 @@ SCRIPT_HEADSIZE=$(grep -sn "^# END_OF_HEADER" ${0} | head -1 | cut -f1 -d:)
 VERSION="$(ScriptInfo version | grep version | tr -s ' ' | cut -d' ' -f 4)" 
 
 GPIO="$(command -v raspi-gpio)"
+NEXUS_GPIO="$(command -v nexus_gpio.py || echo /usr/local/bin/nexus_gpio.py)"
 
 
 #============================
@@ -16,7 +16,7 @@
 #%
 #================================================================
 #- IMPLEMENTATION
-#-    version         ${SCRIPT_NAME} 2.1.6
+#-    version         ${SCRIPT_NAME} 2.1.8
 #-    author          Steve Magnuson, AG7GN
 #-    license         CC-BY-SA Creative Commons License
 #-    script_id       0
@@ -385,15 +385,22 @@ function killDirewolf () {
 
 function monitorMessages () {
 
-	# Looks for traffic received addressed to $1
-	if [[ ! -z "${F[_LOGFILE_]}" ]]
+	# Looks for traffic received addressed to ${F[_CALL_]}
+	if [[ ! -z "${F[_CALL_]}" ]]
 	then
 		local TITLE="Monitor APRS Messages to ${F[_CALL_]}"
 		(( ${F[_SSID_]} == 0 )) && MYCALL="${F[_CALL_]}" || MYCALL="${F[_CALL_]}-${F[_SSID_]}"
 		#local CMD="tail -F ${F[_LOGFILE_]} | grep -Eav '^[0-9]+,[0-9]+,.*,${MYCALL}' | grep '${F[_CALL_]}'"
 		#local CMD="tail -F ${F[_LOGFILE_]} | grep --line-buffered '${F[_CALL_]}'"
 
-		local CMD="socat -u udp-recv:3333,reuseaddr >(sed -u 's/\x1b\[[0-9;]*m//g' | stdbuf -o0 grep -Eav '^\[.* [0-9]{8}T.*\] ${F[_CALL_]}' | sed -uEn '/^\[.* [0-9]{8}T.*\] .*>/,/^$/p' | sed -uEn '/^\[.* [0-9]{8}T.*\] .*>.*::${F[_CALL_]}.*/,/^$/p')"
+		# Runs under 'bash -c', where $0 is bash, so APRS_MONITOR_PY is
+		# resolved and exported by the script itself.
+		if [[ -x $APRS_MONITOR_PY ]]
+		then # Same frames, parsed once in one process
+			local CMD="$APRS_MONITOR_PY -p $SOCAT_PORT -c ${F[_CALL_]}"
+		else
+			local CMD="socat -u udp-recv:$SOCAT_PORT,reuseaddr >(sed -u 's/\x1b\[[0-9;]*m//g' | stdbuf -o0 grep -Eav '^\[.* [0-9]{8}T.*\] ${F[_CALL_]}' | sed -uEn '/^\[.* [0-9]{8}T.*\] .*>/,/^$/p' | sed -uEn '/^\[.* [0-9]{8}T.*\] .*>.*::${F[_CALL_]}.*/,/^$/p')"
+		fi
 		lxterminal --geometry=80x15 -t "$TITLE" -e "$CMD" &
 	fi
 
@@ -621,6 +628,9 @@ WIDTH=1000
 
 # Other settings
 SOCAT_PORT=3333
+APRS_MONITOR_PY="$SCRIPT_DIR/aprs_monitor.py"
+# Clear the messages in the Direwolf Status tab this often (minutes)
+APRS_MONITOR_CLEAR=15
 AUDIO_STATS_INTERVAL=120
 TIME_FORMAT="%Y%m%dT%H:%M:%S"
 # Have direwolf allocate a pty
@@ -735,7 +745,7 @@ fi
 
 #export -f setDefaults loadAPRSDefaults killDirewolf browseCustomFile
 export -f setDefaults killDirewolf browseCustomFile sendMessage monitorMessages
-export MSGPATH
+export MSGPATH SOCAT_PORT APRS_MONITOR_PY
 export click_browse_custom_file='@bash -c "browseCustomFile"'
 
 #export load_aprs_defaults_cmd='@bash -c "setDefaults; loadAPRSDefaults"'
@@ -758,6 +768,7 @@ $SYNTAX && set -n
 $DEBUG && set -x 
 
 clearTextInfo_PID=""
+aprs_monitor_PID=""
 direwolf_PID=""
 kissutil_PID=""
 YAD_PIDs=()
@@ -769,7 +780,7 @@ do
 	pkill -f "APRS Message"
 	killDirewolf $direwolf_PID
 #   for P in ${YAD_PIDs[@]} $clearTextInfo_PID
-   for P in $clearTextInfo_PID $socat_PID $kissutil_PID ${YAD_PIDs[@]} 
+   for P in $clearTextInfo_PID $aprs_monitor_PID $socat_PID $kissutil_PID ${YAD_PIDs[@]}
 	do
 		kill $P >/dev/null 2>&1
 	done
@@ -777,6 +788,7 @@ do
 	#clearTextInfo_PID=""
 	#direwolf_PID=""
 	kissutil_PID=""
+	aprs_monitor_PID=""
 	YAD_PIDs=()
 
 	# Retrieve saved settings or defaults if there are no saved settings
@@ -882,6 +894,13 @@ do
 				done
 				[[ -z $kissutil_PID ]] && echo -e "\nkissutil did not start!" >&6 || echo -e "\nkissutil running. PID=$kissutil_PID" >&6
 				#echo "Received messages are in $RECEIVED_MESSAGES_PATH" >&6
+				if [[ -x $APRS_MONITOR_PY ]]
+				then # Show messages addressed to us in the Direwolf Status tab
+					$APRS_MONITOR_PY -p $SOCAT_PORT -c ${F[_CALL_]} --no_terminal \
+						--yad $PIPE --yad_clear $APRS_MONITOR_CLEAR 2>/dev/null &
+					aprs_monitor_PID=$!
+					echo -e "\nShowing messages to ${F[_CALL_]} here. PID=$aprs_monitor_PID" >&6
+				fi
 			fi
 			if [[ $socat_PID != "" ]]
 			then
@@ -1012,6 +1031,7 @@ do
   		--tab="Configure APRS" \
   		--button="<b>Stop Direwolf APRS &#x26; Exit</b>":1 \
   		--button="<b>Stop Direwolf APRS</b>":"bash -c 'killDirewolf $direwolf_PID'" \
+		--button="<b>Monitor Messages</b>":"bash -c 'source $CONFIG_FILE; monitorMessages'" \
   		--button="<b>Save &#x26; [Re]start Direwolf APRS</b>":0 
 
 	RETURN_CODE=$?
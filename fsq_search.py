@@ -0,0 +1,503 @@
+#!/usr/bin/env python3
+
+# Searches for text in messages logged in Fldigi's fsq_audit_log.txt
+# files, prints the matching messages and optionally runs a command on
+# a match. Python replacement for the tail/tr/sed/date pipeline in
+# fsq_search.sh, which runs this script instead when it is installed.
+
+import argparse
+import fcntl
+import json
+import os
+import re
+import shlex
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+__author__ = "Steve Magnuson AG7GN"
+__copyright__ = "Copyright 2020, Steve Magnuson"
+__credits__ = ["Steve Magnuson"]
+__license__ = "GPL"
+__version__ = "2.0.0"
+__maintainer__ = "Steve Magnuson"
+__email__ = "ag7gn@arrl.net"
+__status__ = "Production"
+
+FSQ_AUDIT_FILE = "fsq_audit_log.txt"
+FLDIGI_DIRS = (".fldigi-left", ".fldigi-right", ".fldigi")
+DEFAULT_CHECKPOINT = os.path.join(os.path.expanduser("~"), ".cache",
+                                  "fsq_search.json")
+MIN_WAIT = 0
+MAX_WAIT = 300
+# Format used by 'date' with no arguments
+DEFAULT_DATE_FORMAT = "%a %b %e %H:%M:%S %Z %Y"
+# Start Of Message Regular Expression
+SOM_RE = re.compile(r"^[a-z]{1,2}[0-9][a-z].*:..([a-z]{1,2}[0-9][a-z]|allcall)")
+# End Of Message. FSQ messages end in '<BS>', and the frames are split
+# on '>'.
+EOM = "<BS"
+# Everything but tab, CR and printable ASCII is dropped from the log,
+# like tr -cd '\11\12\15\40-\176' | tr -d '\n' did
+_DELETE_BYTES = bytes(b for b in range(256)
+                      if not (b in (9, 13) or 32 <= b <= 126))
+
+
+class FsqFramer(object):
+    """
+    Reassembles FSQ messages from the raw bytes of one audit log. The
+    log is split on '>' and the pieces are put back together exactly
+    as fsq_search.sh did: a piece that starts like a message and ends
+    in '<BS' is a complete message, and a piece that only starts like
+    one collects the following pieces until one ends in '<BS'.
+
+    Offsets are counted in raw bytes, so resume_offset is always a
+    place in the file from which reading again loses nothing and
+    repeats no complete message.
+    """
+    # Longest partial message kept while waiting for its end
+    max_message = 65536
+
+    def __init__(self, offset: int = 0):
+        self.offset = offset
+        self._buffer = b''
+        self._partial = None
+        self._partial_offset = offset
+
+    @property
+    def resume_offset(self) -> int:
+        return self._partial_offset if self._partial is not None \
+            else self.offset
+
+    def feed(self, _data: bytes) -> list:
+        """
+        :param _data: Bytes read from the log after those already fed
+        :return: List of complete messages, '<BS' included
+        """
+        messages = []
+        pieces = (self._buffer + _data).split(b'>')
+        self._buffer = pieces.pop()
+        for raw in pieces:
+            start = self.offset
+            self.offset += len(raw) + 1
+            piece = raw.translate(None, _DELETE_BYTES).decode('ascii')
+            if SOM_RE.search(piece):
+                if piece.endswith(EOM):
+                    messages.append(piece)
+                    self._partial = None
+                else:
+                    # Start of a message with a '>' in it. Restore the
+                    # '>' the split removed.
+                    if self._partial is None:
+                        self._partial_offset = start
+                        self._partial = piece + '>'
+                    else:
+                        self._partial += piece + '>'
+            elif self._partial is not None:
+                if piece.endswith(EOM):
+                    message = self._partial + piece
+                    if SOM_RE.search(message):
+                        messages.append(message)
+                    self._partial = None
+                elif len(self._partial) > self.max_message:
+                    self._partial = None
+                else:
+                    self._partial += piece + '>'
+        return messages
+
+
+class AuditLogFollower(object):
+    """
+    Follows one audit log like tail -F, but by inode. When Fldigi
+    replaces the file, the rest of the old one is read before the new
+    one is opened, and the new one is read from its beginning rather
+    than its end, so no message is lost across a Fldigi restart. The
+    checkpoint, (device, inode, offset), lets a later run carry on
+    where this one stopped.
+    """
+    chunk_size = 65536
+
+    def __init__(self, _path: str, checkpoint: list = None,
+                 from_start: bool = False):
+        """
+        :param _path: Audit log path
+        :param checkpoint: [device, inode, offset] saved by a previous
+                           run, or None
+        :param from_start: Read existing content rather than starting
+                           at the end of the file
+        """
+        self.path = _path
+        self.saved = checkpoint
+        self.from_start = from_start
+        self.file = None
+        self.ident = None
+        self.framer = None
+        self._started = False
+
+    def _open(self):
+        try:
+            self.file = open(self.path, 'rb')
+        except OSError:
+            return
+        st = os.fstat(self.file.fileno())
+        self.ident = [st.st_dev, st.st_ino]
+        if self.saved and self.saved[:2] == self.ident and \
+                self.saved[2] <= st.st_size:
+            offset = self.saved[2]
+        elif self._started or self.from_start:
+            # The file appeared while we were watching
+            offset = 0
+        else:
+            offset = st.st_size
+        self.saved = None
+        self.file.seek(offset)
+        self.framer = FsqFramer(offset)
+
+    def _read(self) -> list:
+        messages = []
+        while True:
+            _data = self.file.read(self.chunk_size)
+            if not _data:
+                return messages
+            messages.extend(self.framer.feed(_data))
+
+    def poll(self) -> list:
+        """
+        Reads whatever has been added to the log.
+
+        :return: List of complete messages
+        """
+        messages = []
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            st = None
+        if self.file is not None:
+            same = st is not None and [st.st_dev, st.st_ino] == self.ident
+            if same and st.st_size < self.file.tell():
+                # Truncated in place
+                self.file.seek(0)
+                self.framer = FsqFramer(0)
+            messages.extend(self._read())
+            if not same:
+                # Replaced or removed. The rest of it was just read.
+                self.file.close()
+                self.file = None
+        if self.file is None and st is not None:
+            self._open()
+            if self.file is not None:
+                messages.extend(self._read())
+        self._started = True
+        return messages
+
+    def checkpoint(self):
+        """
+        :return: [device, inode, offset] to resume from, or None
+        """
+        if self.file is None:
+            return self.saved
+        return self.ident + [self.framer.resume_offset]
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+class FsqSearch(object):
+    """
+    Handles complete messages: prints the ones that match with an
+    optional timestamp and runs the command, at most once every wait
+    seconds.
+    """
+
+    def __init__(self, patterns=(), command: list = None, wait: int = 0,
+                 date_format: str = None, output=sys.stdout):
+        """
+        :param patterns: Regular expressions. A message matches if any
+                         of them is found in it. No patterns match
+                         every message.
+        :param command: Command to run on a match, as an argument list
+        :param wait: Minimum seconds between command runs
+        :param date_format: strftime() format of the timestamp printed
+                            before each message, None for no timestamp
+        :param output: Where matching messages are printed
+        """
+        self.matcher = re.compile('|'.join(f"(?:{p})" for p in patterns)) \
+            if patterns else None
+        self.command = command
+        self.wait = wait
+        self.date_format = date_format
+        self.output = output
+        self.last_run = time.monotonic() - wait
+        self.matches = 0
+
+    def handle(self, message: str):
+        if self.matcher and not self.matcher.search(message):
+            return
+        self.matches += 1
+        # fsq_search.sh echoed the message unquoted, which collapses
+        # whitespace
+        line = ' '.join(message[:-len(EOM)].split())
+        if self.date_format:
+            line = f"{time.strftime(self.date_format)} {line}"
+        print(line, file=self.output, flush=True)
+        if self.command:
+            _now = time.monotonic()
+            if _now - self.last_run >= self.wait:
+                try:
+                    subprocess.Popen(self.command)
+                except OSError as e:
+                    print(f"ERROR: Cannot run {self.command[0]}: {e}",
+                          file=sys.stderr)
+                self.last_run = _now
+
+
+def fldigi_running() -> bool:
+    """
+    :return: True if any process has 'fldigi' in its name, as
+             'pgrep fldigi' would find
+    """
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f"/proc/{pid}/comm") as comm:
+                if 'fldigi' in comm.read():
+                    return True
+        except OSError:
+            pass
+    return False
+
+
+def load_checkpoints(_path: str) -> dict:
+    try:
+        with open(_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_checkpoints(_path: str, followers):
+    """
+    Atomically writes the followers' checkpoints to _path.
+
+    :param _path: Checkpoint file
+    :param followers: AuditLogFollower objects
+    :return: None
+    """
+    checkpoints = {f.path: f.checkpoint() for f in followers
+                   if f.checkpoint() is not None}
+    tmp = f"{_path}.tmp"
+    try:
+        with open(tmp, 'w') as f:
+            json.dump(checkpoints, f)
+        os.replace(tmp, _path)
+    except OSError as e:
+        print(f"WARNING: Cannot save {_path}: {e}", file=sys.stderr)
+
+
+def follow(search: FsqSearch, files, checkpoint_file: str,
+           poll_interval: float, fldigi_interval: float):
+    """
+    Follows the audit logs until no Fldigi is running.
+
+    :param search: FsqSearch for the messages
+    :param files: Audit log paths
+    :param checkpoint_file: Where offsets are saved between runs
+    :param poll_interval: Seconds between checks for new log content
+    :param fldigi_interval: Seconds between checks for Fldigi
+    :return: None
+    """
+    saved = load_checkpoints(checkpoint_file)
+    followers = [AuditLogFollower(p, saved.get(p)) for p in files]
+    last = [f.checkpoint() for f in followers]
+    next_fldigi_check = 0.0
+    try:
+        while True:
+            for follower in followers:
+                for message in follower.poll():
+                    search.handle(message)
+            current = [f.checkpoint() for f in followers]
+            if current != last:
+                save_checkpoints(checkpoint_file, followers)
+                last = current
+            _now = time.monotonic()
+            if _now >= next_fldigi_check:
+                if not fldigi_running():
+                    break
+                next_fldigi_check = _now + fldigi_interval
+            time.sleep(poll_interval)
+    finally:
+        save_checkpoints(checkpoint_file, followers)
+        for follower in followers:
+            follower.close()
+
+
+def replay(search: FsqSearch, files):
+    """
+    Searches the audit logs from beginning to end and returns.
+
+    :param search: FsqSearch for the messages
+    :param files: Audit log paths
+    :return: None
+    """
+    for _path in files:
+        follower = AuditLogFollower(_path, from_start=True)
+        for message in follower.poll():
+            search.handle(message)
+        follower.close()
+
+
+def _synthetic_audit_log(_file, messages: int):
+    # Audit log content similar to what Fldigi writes during a busy FSQ
+    # net: headers, noise, ordinary messages and messages with '>' in
+    # them
+    calls = ["ag7gn", "w7ecg", "wc7hq", "n7bel", "k7abc", "kf7xyz"]
+    header = "=" * 50 + "\n"
+    for n in range(messages):
+        if n % 50 == 0:
+            _file.write(f"{header}Audit log: 20200203, {n % 240000:06d}\n"
+                        f"{header}")
+        sender = calls[n % len(calls)]
+        called = "allcall" if n % 7 == 0 else calls[(n * 5 + 1) % len(calls)]
+        text = f"message {n} check in > net control" if n % 10 == 0 \
+            else f"message {n} from {sender} QSL 73"
+        _file.write(f"\x01<SOH>{sender}:{n % 100:02d}{called} {text}<BS>\n")
+        if n % 5 == 0:
+            _file.write("<BS> ~~ noise \x7f\x80 <SOH> garbled\n")
+
+
+def benchmark(messages: int):
+    """
+    Times replay() over a synthetic audit log.
+
+    :param messages: Number of messages in the log
+    :return: None
+    """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        _path = os.path.join(tmpdir, FSQ_AUDIT_FILE)
+        with open(_path, 'w', encoding='latin-1') as f:
+            _synthetic_audit_log(f, messages)
+        size = os.path.getsize(_path)
+        with open(os.devnull, 'w') as devnull:
+            search = FsqSearch(["ag7gn|wc7hq|n7bel"], output=devnull)
+            start = time.perf_counter()
+            replay(search, [_path])
+            elapsed = time.perf_counter() - start
+    print(f"{messages} messages, {size / 1e6:.1f} MB, {search.matches} "
+          f"matches in {elapsed:.3f} s: {messages / elapsed:,.0f} "
+          f"messages/s, {size / 1e6 / elapsed:.1f} MB/s")
+
+
+def date_format_spec(spec):
+    """
+    argparse type for -t: 'default' or a date(1) style '+FORMAT'
+
+    :param spec: Option argument
+    :return: strftime() format
+    """
+    if spec == "default":
+        return DEFAULT_DATE_FORMAT
+    if not spec.startswith('+'):
+        raise argparse.ArgumentTypeError(
+            "Invalid timestamp date format. Use 'default' or +FORMAT, "
+            "e.g. +%Y%m%dT%H%M%S. See 'man date'")
+    return spec[1:]
+
+
+def wait_spec(spec):
+    try:
+        wait = int(spec)
+    except ValueError:
+        wait = -1
+    if not MIN_WAIT <= wait <= MAX_WAIT:
+        raise argparse.ArgumentTypeError(
+            f"Wait time must be between {MIN_WAIT} and {MAX_WAIT}")
+    return wait
+
+
+if __name__ == "__main__":
+    home = os.path.expanduser("~")
+    default_files = [os.path.join(home, d, "temp", FSQ_AUDIT_FILE)
+                     for d in FLDIGI_DIRS]
+    parser = argparse.ArgumentParser(
+        prog='fsq_search.py',
+        description="Searches for text in messages logged in "
+                    f"{FSQ_AUDIT_FILE}. Matching messages are printed, "
+                    "with an optional timestamp, and a command can be "
+                    "run on a match. Only one instance runs at a time, "
+                    "and only while Fldigi is running.",
+        epilog="Example: play a WAV file when the called station is "
+               "ag7gn, wc7hq or n7bel: fsq_search.py -c \"aplay -q "
+               "alert.wav\" \":..(ag7gn|wc7hq|n7bel)\" >/dev/null",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('-v', '--version', action='version',
+                        version=f"Version: {__version__}")
+    parser.add_argument("-c", "--command", type=shlex.split,
+                        help="Launch COMMAND in the background if a match "
+                             "is found. Wrap in double quotes if arguments "
+                             "to the command are supplied")
+    parser.add_argument("-t", "--timestamp", type=date_format_spec,
+                        metavar="DATE_FORMAT|default",
+                        help="Precede each message printed with a "
+                             "timestamp in date(1) format DATE_FORMAT, "
+                             "e.g. +%%Y%%m%%dT%%H%%M%%S, or in the "
+                             "default date format")
+    parser.add_argument("-w", "--wait", type=wait_spec, default=0,
+                        metavar="SECONDS",
+                        help="Minimum time in seconds between -c command "
+                             f"executions. Range: {MIN_WAIT}-{MAX_WAIT}")
+    parser.add_argument("-f", "--file", action='append', metavar="FILE",
+                        help="Audit log to search. Can be repeated. "
+                             f"Default: {', '.join(default_files)}")
+    parser.add_argument("-r", "--replay", action='store_true',
+                        help="Search the whole of each log once and exit, "
+                             "rather than following new messages")
+    parser.add_argument("--checkpoint", type=str, metavar="FILE",
+                        default=DEFAULT_CHECKPOINT,
+                        help="Where the position in each log is saved, so "
+                             "that messages logged while this script was "
+                             "not running are still searched")
+    parser.add_argument("--poll_interval", type=float, default=0.25,
+                        help="Seconds between checks for new messages")
+    parser.add_argument("--benchmark", type=int, metavar="MESSAGES",
+                        help=argparse.SUPPRESS)
+    parser.add_argument("search_string", nargs='*',
+                        help="Regular expression to search for. Several "
+                             "can be given; a message matches if any of "
+                             "them is found. If none is given, all "
+                             "messages match")
+    arg_info = parser.parse_args()
+    if arg_info.benchmark:
+        benchmark(arg_info.benchmark)
+        sys.exit(0)
+    try:
+        search = FsqSearch(arg_info.search_string, command=arg_info.command,
+                           wait=arg_info.wait, date_format=arg_info.timestamp)
+    except re.error as e:
+        parser.error(f"Invalid search_string: {e}")
+    files = arg_info.file or default_files
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    # Commands run on a match are not waited for
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    try:
+        if arg_info.replay:
+            replay(search, files)
+            sys.exit(0)
+        if not fldigi_running():
+            sys.exit(0)
+        os.makedirs(os.path.dirname(arg_info.checkpoint) or '.',
+                    exist_ok=True)
+        lock = open(f"{arg_info.checkpoint}.lock", 'w')
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            # Already running
+            sys.exit(0)
+        follow(search, files, arg_info.checkpoint,
+               poll_interval=arg_info.poll_interval, fldigi_interval=2.0)
+    except (KeyboardInterrupt, BrokenPipeError):
+        pass
+    sys.exit(0)
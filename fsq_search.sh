@@ -78,7 +78,7 @@
 #%
 #================================================================
 #- IMPLEMENTATION
-#-    version         ${SCRIPT_NAME} 1.2.9
+#-    version         ${SCRIPT_NAME} 1.3.1
 #-    author          Steve Magnuson, AG7GN
 #-    license         CC-BY-SA Creative Commons License
 #-    script_id       0
@@ -86,6 +86,7 @@
 #================================================================
 #  HISTORY
 #     20200203 : Steve Magnuson : Script creation
+#     20201018 : Steve Magnuson : Run fsq_search.py instead if installed
 # 
 #================================================================
 #  DEBUG OPTION
@@ -96,6 +97,10 @@
 # END_OF_HEADER
 #================================================================
 
+# fsq_search.py follows the audit logs by inode, so a Fldigi restart loses no messages
+FSQ_SEARCH_PY="$(dirname "$0")/fsq_search.py"
+[[ -x $FSQ_SEARCH_PY ]] && exec "$FSQ_SEARCH_PY" "$@"
+
 SYNTAX=false
 DEBUG=false
 Optnum=$#
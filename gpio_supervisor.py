@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+
+# Owns the Nexus DR-X GPIOs: the shutdown button and LED, and the radio
+# PTT lines. One process with one event loop replaces running
+# shutdown_button.py and a radio-monitor.py per user, and publishes
+# everything it sees on a Unix domain socket.
+
+import argparse
+import asyncio
+import json
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from nexus_gpio import RPiGPIOBackend, GpioChipBackend, GpioChip, \
+    FakeGPIOBackend, DEFAULT_SAMPLE_INTERVAL, GPIO_SUPERVISOR_SOCKET
+from nexus_socket import listen_socket
+from ptt_monitor import PttMonitor, PttStatsFile, radio_spec, \
+    STUCK_CHECK_INTERVAL
+import shutdown_button
+
+__author__ = "Steve Magnuson AG7GN"
+__copyright__ = "Copyright 2020, Steve Magnuson"
+__credits__ = ["Steve Magnuson"]
+__license__ = "GPL"
+__version__ = "1.1.1"
+__maintainer__ = "Steve Magnuson"
+__email__ = "ag7gn@arrl.net"
+__status__ = "Production"
+
+default_radios = [("Left Radio", 12), ("Right Radio", 23)]
+
+
+def _epoch(timestamp: float) -> float:
+    """
+    :param timestamp: time.monotonic() value
+    :return: The same moment in epoch seconds, rounded to ms
+    """
+    return round(time.time() - (time.monotonic() - timestamp), 3)
+
+
+class GpioLed(object):
+    """
+    LED on an output pin of a nexus_gpio backend, with the on()/off()
+    interface ButtonStateMachine expects.
+    """
+
+    def __init__(self, gpio, pin: int):
+        self.gpio = gpio
+        self.pin = pin
+        gpio.setup([pin], input=False)
+        self.off()
+
+    def on(self):
+        self.gpio.write(self.pin, 1)
+
+    def off(self):
+        self.gpio.write(self.pin, 0)
+
+
+class ShutdownButton(object):
+    """
+    Feeds a shutdown_button.ButtonStateMachine from the edges of the
+    button GPIO, which the button pulls low while it is pressed, and
+    reports each press and release to its subscribers:
+
+        {"time": epoch seconds, "button": "shutdown", "pin": BCM pin,
+         "state": "PRESSED" | "RELEASED", "held": seconds,
+         "action": command}
+
+    held is only present on RELEASED events, and action only when
+    the hold ran a command.
+    """
+
+    def __init__(self, gpio, pin: int, machine):
+        self.gpio = gpio
+        self.pin = pin
+        self.machine = machine
+        self.is_pressed = False
+        self.subscribers = []
+
+    def start(self, callback):
+        """
+        Sets up the button GPIO and starts watching it.
+
+        :param callback: Called as callback(pin, value, timestamp) from
+                         the GPIO backend's thread on every edge
+        :return: None
+        """
+        self.gpio.setup([self.pin], input=True, pull_up=True)
+        self.is_pressed = not self.gpio.read(self.pin)
+        if self.is_pressed:
+            self.machine.pressed()
+        self.gpio.watch([self.pin], callback)
+
+    def edge(self, value: int, timestamp: float):
+        """
+        Handles one edge of the button GPIO.
+
+        :param value: GPIO level, 0 while the button is pressed
+        :param timestamp: time.monotonic() of the edge
+        :return: None
+        """
+        is_pressed = not value
+        if is_pressed == self.is_pressed:
+            # Contact bounce
+            return
+        self.is_pressed = is_pressed
+        event = {"time": _epoch(timestamp), "button": "shutdown",
+                 "pin": self.pin}
+        if is_pressed:
+            self.machine.pressed(timestamp)
+            event["state"] = "PRESSED"
+        else:
+            held = timestamp - self.machine.pressed_at
+            command = self.machine.released(timestamp)
+            event["state"] = "RELEASED"
+            event["held"] = round(held, 3)
+            if command:
+                event["action"] = ' '.join(command)
+        for callback in self.subscribers:
+            callback(event)
+
+
+def _run_detached(command):
+    # Button actions must not block the event loop
+    threading.Thread(target=subprocess.call, args=(command,),
+                     daemon=True).start()
+
+
+class GpioSupervisor(object):
+    """
+    Runs the PTT monitor and the shutdown button in one asyncio event
+    loop. The GPIO backend reports edges from its own thread, and
+    call_soon_threadsafe() hands them to the loop, so the loop sleeps
+    until a line changes. The button raises interrupts, but PTT pins
+    driven as outputs cannot, so unless --ptt_input is used the
+    backend's thread wakes up every --sample_interval (100 ms by
+    default) to sample them. Events from both are published to
+    the clients of a Unix domain socket, one JSON object per line.
+    A new client first gets the current state:
+
+        {"radios": [{"radio": name, "pin": BCM pin, "value": 0|1},
+                    ...],
+         "button": {"pin": BCM pin, "pressed": true|false} or null}
+
+    and then every PttMonitor and ShutdownButton event as it happens.
+    Clients only listen; anything they send is ignored.
+    """
+    # Bytes queued for a client before it is considered stuck and
+    # disconnected
+    max_backlog = 65536
+
+    def __init__(self, gpio, listener: socket.socket,
+                 monitor: PttMonitor = None, button: ShutdownButton = None):
+        self.gpio = gpio
+        self.listener = listener
+        self.monitor = monitor
+        self.button = button
+        # StreamWriter: handler task
+        self.clients = {}
+        self.loop = None
+        self._stopped = None
+
+    def run(self):
+        """
+        Runs until SIGTERM or SIGINT.
+
+        :return: None
+        """
+        asyncio.run(self._main())
+
+    async def _main(self):
+        self.loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            self.loop.add_signal_handler(sig, self._stopped.set)
+        if self.monitor:
+            self.monitor.wakeup = \
+                lambda: self.loop.call_soon_threadsafe(self.monitor.process)
+            self.monitor.subscribe(self.publish)
+            self.monitor.start()
+            if self.monitor.stuck_ptt:
+                self._check_stuck()
+        if self.button:
+            self.button.subscribers.append(self.publish)
+            self.button.start(
+                lambda pin, value, timestamp: self.loop.call_soon_threadsafe(
+                    self.button.edge, value, timestamp))
+        server = await asyncio.start_unix_server(self._client,
+                                                 sock=self.listener)
+        try:
+            await self._stopped.wait()
+        finally:
+            server.close()
+            tasks = list(self.clients.values())
+            for writer in list(self.clients):
+                writer.transport.abort()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if self.monitor:
+                # The button shares the GPIOs, so they are only
+                # released below
+                self.monitor.stop(cleanup=False)
+            self.gpio.cleanup()
+
+    def _check_stuck(self):
+        # A PTT can only get stuck while nothing happens, so stuck
+        # PTTs are checked for on a timer
+        self.monitor.process()
+        self.loop.call_later(STUCK_CHECK_INTERVAL, self._check_stuck)
+
+    def _greeting(self) -> bytes:
+        radios = []
+        if self.monitor:
+            radios = [{"radio": name, "pin": pin,
+                       "value": self.monitor.state.get(pin, 0)}
+                      for pin, name in self.monitor.names.items()]
+        button = {"pin": self.button.pin,
+                  "pressed": self.button.is_pressed} \
+            if self.button else None
+        return (json.dumps({"radios": radios, "button": button}) +
+                '\n').encode('utf-8')
+
+    async def _client(self, reader: asyncio.StreamReader,
+                      writer: asyncio.StreamWriter):
+        writer.write(self._greeting())
+        self.clients[writer] = asyncio.current_task()
+        try:
+            while await reader.read(4096):
+                pass
+        except ConnectionError:
+            pass
+        finally:
+            self.clients.pop(writer, None)
+            writer.close()
+
+    def publish(self, event: dict):
+        """
+        Sends an event to every client. A client that has stopped
+        reading is disconnected rather than allowed to use up memory.
+
+        :param event: PttMonitor or ShutdownButton event
+        :return: None
+        """
+        data = (json.dumps(event) + '\n').encode('utf-8')
+        for writer in list(self.clients):
+            if writer.transport.get_write_buffer_size() > self.max_backlog:
+                self.clients.pop(writer, None)
+                writer.transport.abort()
+            else:
+                writer.write(data)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog='gpio_supervisor.py',
+        description="Watch the shutdown button and radio PTT GPIOs and "
+                    "publish their state",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('-v', '--version', action='version',
+                        version=f"Version: {__version__}")
+    parser.add_argument("-s", "--socket", type=str,
+                        default=GPIO_SUPERVISOR_SOCKET,
+                        help="Unix domain socket to publish events on")
+    parser.add_argument("-g", "--group", type=str, default="gpio",
+                        help="group allowed to use the socket")
+    parser.add_argument("--radio", type=radio_spec, action='append',
+                        metavar="NAME=PIN",
+                        help="Monitor the radio NAME with its PTT on GPIO "
+                             "PIN (BCM numbering). Can be repeated. "
+                             "Default: " +
+                             ', '.join(f"{name}={pin}"
+                                       for name, pin in default_radios))
+    parser.add_argument("--no_ptt", action='store_true',
+                        help="Do not monitor any radio PTT")
+    parser.add_argument("--no_button", action='store_true',
+                        help="Do not watch the shutdown button")
+    parser.add_argument("--ptt_input", action='store_true',
+                        help="Configure the PTT GPIOs as inputs and use "
+                             "interrupt edge detection. Only use this if "
+                             "the PTT signals are wired to GPIOs that no "
+                             "other application drives")
+    parser.add_argument("--sample_interval", type=float,
+                        default=DEFAULT_SAMPLE_INTERVAL * 1000,
+                        help="PTT GPIO sampling interval in milliseconds "
+                             "when --ptt_input is not used. Shorter "
+                             "intervals report TX sooner and catch shorter "
+                             "keyups, at the cost of more CPU wakeups")
+    parser.add_argument("--gpiochip", type=str, nargs='?', const='',
+                        metavar="DEVICE",
+                        help="Read the GPIOs through GPIO character device "
+                             "DEVICE (the Raspberry Pi's GPIO controller if "
+                             "DEVICE is omitted), all of them with one "
+                             "read, instead of through RPi.GPIO. The PTT "
+                             "GPIOs must not be exported by other "
+                             "applications")
+    parser.add_argument("--fake_gpio", type=argparse.FileType('r'),
+                        metavar="FILE",
+                        help="Simulate the GPIOs, replaying 'delay pin "
+                             "value' lines from FILE. For testing "
+                             "without hardware")
+    parser.add_argument("--stats_file", type=str, metavar="FILE",
+                        help="Append a CSV record (epoch time at keyup, "
+                             "radio, TX seconds) to FILE for every "
+                             "transmission")
+    parser.add_argument("--stuck_ptt", type=float, default=0,
+                        metavar="SECONDS",
+                        help="Publish a STUCK event when a radio transmits "
+                             "continuously for more than SECONDS. 0 "
+                             "disables the check")
+    shutdown_button.add_arguments(parser)
+    arg_info = parser.parse_args()
+    if arg_info.no_ptt and arg_info.no_button:
+        parser.error("Nothing to supervise")
+    radios = [] if arg_info.no_ptt else arg_info.radio or default_radios
+    if not arg_info.no_button:
+        for name, pin in radios:
+            if pin in (arg_info.button, arg_info.led):
+                parser.error(f"GPIO {pin} is assigned to both '{name}' and "
+                             f"the shutdown button")
+    if arg_info.fake_gpio:
+        gpio = FakeGPIOBackend.from_file(arg_info.fake_gpio)
+    elif arg_info.gpiochip is not None:
+        try:
+            gpio = GpioChipBackend(
+                GpioChip(arg_info.gpiochip or None), input=arg_info.ptt_input,
+                sample_interval=arg_info.sample_interval / 1000)
+        except OSError as e:
+            print(f"ERROR: {e}", file=sys.stderr)
+            sys.exit(1)
+    else:
+        gpio = RPiGPIOBackend(input=arg_info.ptt_input,
+                              sample_interval=arg_info.sample_interval / 1000)
+    monitor = None
+    if radios:
+        try:
+            monitor = PttMonitor(gpio, radios,
+                                 stats_file=PttStatsFile(arg_info.stats_file)
+                                 if arg_info.stats_file else None,
+                                 stuck_ptt=arg_info.stuck_ptt)
+        except ValueError as e:
+            parser.error(str(e))
+    button = None
+    try:
+        if not arg_info.no_button:
+            machine = shutdown_button.ButtonStateMachine(
+                shutdown_button.thresholds_from_args(arg_info),
+                GpioLed(gpio, arg_info.led), run=_run_detached)
+            button = ShutdownButton(gpio, arg_info.button, machine)
+        supervisor = GpioSupervisor(gpio,
+                                    listen_socket(arg_info.socket,
+                                                  arg_info.group),
+                                    monitor=monitor, button=button)
+        supervisor.run()
+    except OSError as e:
+        # GPIOs the GPIO character device could not request
+        print(f"ERROR: {e}", file=sys.stderr)
+        sys.exit(1)
+    sys.exit(0)
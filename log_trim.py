@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+
+# Trims the Fldigi, Flmsg and Flrig logs and files older than a given
+# date. Python engine behind the trim-*.sh scripts, which run this
+# script instead when it is installed.
+
+import argparse
+import calendar
+import collections
+import glob
+import mmap
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+__author__ = "Steve Magnuson AG7GN"
+__copyright__ = "Copyright 2020, Steve Magnuson"
+__credits__ = ["Steve Magnuson"]
+__license__ = "GPL"
+__version__ = "1.1.0"
+__maintainer__ = "Steve Magnuson"
+__email__ = "ag7gn@arrl.net"
+__status__ = "Production"
+
+SEPARATOR = b"=" * 50 + b"\n"
+_RELATIVE_DATE_RE = re.compile(
+    r"^(\d+)\s+(sec|second|min|minute|hour|day|week|fortnight|month|year)s?"
+    r"\s+ago$")
+_UNIT_SECONDS = {"sec": 1, "second": 1, "min": 60, "minute": 60,
+                 "hour": 3600, "day": 86400, "week": 7 * 86400,
+                 "fortnight": 14 * 86400}
+
+
+def parse_date(spec: str, now: float = None) -> float:
+    """
+    Converts a date(1) style date reference to epoch seconds. 'now',
+    'today', 'yesterday' and 'N units ago' (seconds up to years) are
+    handled here; anything else is passed to 'date -u --date' once.
+
+    :param spec: Date reference, e.g. '10 days ago' or '1 hour ago'
+    :param now: Epoch seconds to count back from, defaults to now
+    :return: Epoch seconds
+    :raise ValueError: If the date reference is not valid
+    """
+    if now is None:
+        now = time.time()
+    text = ' '.join(spec.lower().split())
+    if text in ("now", "today"):
+        return now
+    if text == "yesterday":
+        return now - 86400
+    match = _RELATIVE_DATE_RE.match(text)
+    if match:
+        count, unit = int(match.group(1)), match.group(2)
+        if unit in _UNIT_SECONDS:
+            return now - count * _UNIT_SECONDS[unit]
+        # Calendar months and years, like date(1)
+        t = time.gmtime(now)
+        months = t.tm_year * 12 + t.tm_mon - 1 - \
+            (count if unit == "month" else count * 12)
+        year, month = divmod(months, 12)
+        # date(1) lets e.g. March 31 - 1 month overflow into March
+        return calendar.timegm((year, month + 1, t.tm_mday, t.tm_hour,
+                                t.tm_min, t.tm_sec)) + now % 1
+    try:
+        result = subprocess.run(["date", "-u", f"--date={spec}", "+%s"],
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL,
+                                universal_newlines=True)
+    except OSError:
+        result = None
+    if result is None or result.returncode != 0:
+        raise ValueError(f"Invalid date requested: '{spec}'")
+    return float(result.stdout)
+
+
+def _utc_stamp(epoch: float) -> bytes:
+    # Timestamps in the FSQ logs are UTC 'YYYYMMDD, HHMMSS'
+    return time.strftime("%Y%m%d%H%M%S", time.gmtime(epoch)).encode()
+
+
+class TimestampedLog(object):
+    """
+    A log made of records in chronological order, each starting with a
+    line that carries its UTC timestamp. Lines between records belong
+    to the record before them.
+
+    The first record newer than the cutoff is found by binary search
+    in the memory-mapped file, so only a few pages are read however
+    old the log is. The records from there on are copied to a new file
+    in one sendfile() call, which then atomically replaces the log.
+    """
+    # Matches a record line, with the date and time as groups 1 and 2
+    record_re = None
+
+    def header(self, cutoff: float) -> bytes:
+        """
+        :param cutoff: Epoch seconds records were trimmed at
+        :return: Text that starts the trimmed log
+        """
+        return b""
+
+    def _record(self, mm, pos: int):
+        # First record starting at or after pos, or None
+        return self.record_re.search(mm, pos)
+
+    def find_cutoff(self, mm, cutoff: float) -> int:
+        """
+        :param mm: Memory-mapped log
+        :param cutoff: Epoch seconds
+        :return: Offset of the first record newer than cutoff, or the
+                 file size if there is none
+        """
+        target = _utc_stamp(cutoff)
+        lo, hi = 0, len(mm)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            record = self._record(mm, mid)
+            if record is None or \
+                    record.group(1) + record.group(2) > target:
+                hi = mid
+            else:
+                # No record starting at or before this one is newer
+                lo = record.start() + 1
+        record = self._record(mm, lo)
+        return record.start() if record else len(mm)
+
+    def copy(self, mm, offset: int, in_fd: int, out_fd: int):
+        """
+        Copies the log from offset to the end.
+
+        :return: None
+        """
+        count = len(mm) - offset
+        while count > 0:
+            sent = os.sendfile(out_fd, in_fd, offset, count)
+            if sent == 0:
+                break
+            offset += sent
+            count -= sent
+
+    def trim(self, _path: str, cutoff: float, dry_run: bool = False) -> int:
+        """
+        Removes the records older than cutoff from a log.
+
+        :param _path: Log file
+        :param cutoff: Epoch seconds
+        :param dry_run: Only work out how much would be removed
+        :return: Bytes reclaimed
+        """
+        with open(_path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return 0
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                offset = self.find_cutoff(mm, cutoff)
+                first = self._record(mm, 0)
+                if first is not None and first.start() == offset:
+                    # Nothing older than the cutoff
+                    return 0
+                header = self.header(cutoff)
+                if dry_run:
+                    return offset - len(header)
+                fd, tmp = tempfile.mkstemp(dir=os.path.dirname(_path),
+                                           prefix=".log_trim.")
+                try:
+                    os.write(fd, header)
+                    self.copy(mm, offset, f.fileno(), fd)
+                    os.fchmod(fd, 0o644)
+                    new_size = os.fstat(fd).st_size
+                    os.close(fd)
+                    fd = None
+                    os.replace(tmp, _path)
+                except BaseException:
+                    if fd is not None:
+                        os.close(fd)
+                    os.unlink(tmp)
+                    raise
+        return size - new_size
+
+
+class FsqAuditLog(TimestampedLog):
+    """
+    fsq_audit_log.txt. Each Fldigi session starts with
+
+        ==================================================
+        Audit log: 20200203, 142500
+        ==================================================
+
+    and everything from the first session newer than the cutoff is
+    kept, as trim-fsq-audit.sh did.
+    """
+    record_re = re.compile(rb"^[ \t]*Audit log:[ \t]+(\d{8}),?[ \t]+(\d{6})",
+                           re.M)
+
+    def header(self, cutoff: float) -> bytes:
+        return SEPARATOR
+
+
+class FsqHeardLog(TimestampedLog):
+    """
+    fsq_heard_log.txt: one 'YYYYMMDD, HHMMSS, ...' line per station
+    heard. Lines newer than the cutoff are kept under a new 'Heard log'
+    header and the old session headers are dropped, as
+    trim-fsq-heard.sh did.
+    """
+    record_re = re.compile(rb"^[ \t]*(\d{8}),?[ \t]+(\d{6})", re.M)
+    _session_re = re.compile(rb"^(?:Heard|===)", re.M)
+
+    def header(self, cutoff: float) -> bytes:
+        stamp = time.strftime("%Y%m%d, %H%M%S", time.gmtime(cutoff))
+        return SEPARATOR + f"Heard log: {stamp}\n".encode() + SEPARATOR
+
+    def copy(self, mm, offset: int, in_fd: int, out_fd: int):
+        if not self._session_re.search(mm, offset):
+            super().copy(mm, offset, in_fd, out_fd)
+            return
+        with os.fdopen(os.dup(out_fd), 'wb') as out:
+            for line in mm[offset:].splitlines(keepends=True):
+                if not self._session_re.match(line):
+                    out.write(line)
+
+
+LogKind = collections.namedtuple('LogKind', ['app', 'log', 'patterns',
+                                             'exclude'])
+LogKind.__doc__ = """\
+A kind of log to trim. app is the program that writes it, which must
+not be running. log is the TimestampedLog that trims inside the files,
+or None to delete whole files whose modification time is older than
+the cutoff. patterns are globs relative to the home folder, and files
+whose name contains exclude are left alone."""
+
+_NBEMS_DIRS = ("log_files/*", "temp_files/*", "ICS/*.htm", "ICS/*.csv",
+               "ICS/messages/*", "ICS/messages/archive/*", "ICS/log_files/*",
+               "WRAP/auto/*", "WRAP/recv/*", "WRAP/send/*", "TRANSFERS/*",
+               "FLAMP/*log*", "FLAMP/rx/*", "FLAMP/tx/*", "ARQ/files/*",
+               "ARQ/mail/*", "ARQ/recv/*", "ARQ/send/*")
+
+LOG_KINDS = collections.OrderedDict([
+    ("fsq-audit", LogKind("fldigi", FsqAuditLog(),
+                          [".fldigi*/temp/fsq_audit_log.txt"], None)),
+    ("fsq-heard", LogKind("fldigi", FsqHeardLog(),
+                          [".fldigi*/temp/fsq_heard_log.txt"], None)),
+    ("fldigi", LogKind("fldigi", None, [".fldigi*/*log*"], "logbook")),
+    ("flmsg", LogKind("flmsg", None,
+                      [f".nbems*/{d}" for d in _NBEMS_DIRS], None)),
+    ("flrig", LogKind("flrig", None, [".flrig*/*txt*"], None)),
+])
+
+
+def running(app: str) -> bool:
+    """
+    :param app: Program name
+    :return: True if any process has app in its name, as 'pgrep app'
+             would find
+    """
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f"/proc/{pid}/comm") as comm:
+                if app in comm.read():
+                    return True
+        except OSError:
+            pass
+    return False
+
+
+def trim_kind(kind: LogKind, cutoff: float, home: str,
+              dry_run: bool = False, report=None) -> int:
+    """
+    Trims every log of one kind.
+
+    :param kind: LogKind
+    :param cutoff: Epoch seconds
+    :param home: Home folder the patterns are relative to
+    :param dry_run: Only work out how much would be removed
+    :param report: Called as report(path, bytes reclaimed, deleted)
+                   for every file changed
+    :return: Bytes reclaimed
+    """
+    reclaimed = 0
+    seen = set()
+    for pattern in kind.patterns:
+        for _path in sorted(glob.glob(os.path.join(home, pattern))):
+            if _path in seen or (kind.exclude and
+                                 kind.exclude in os.path.basename(_path)):
+                continue
+            seen.add(_path)
+            try:
+                st = os.lstat(_path)
+                if not os.path.isfile(_path) or os.path.islink(_path):
+                    continue
+                if kind.log is None:
+                    if st.st_mtime >= cutoff:
+                        continue
+                    if not dry_run:
+                        os.unlink(_path)
+                    freed, deleted = st.st_size, True
+                else:
+                    freed, deleted = kind.log.trim(_path, cutoff,
+                                                   dry_run=dry_run), False
+                    if not freed:
+                        continue
+            except OSError as e:
+                print(f"ERROR: {_path}: {e}", file=sys.stderr)
+                continue
+            reclaimed += freed
+            if report:
+                report(_path, freed, deleted)
+    return reclaimed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog='log_trim.py',
+        description="Trims Fldigi, Flmsg and Flrig logs and files older "
+                    "than DATE in every ~/.fldigi*, ~/.nbems* and "
+                    "~/.flrig* folder. Logs of an application that is "
+                    "running are left alone.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('-v', '--version', action='version',
+                        version=f"Version: {__version__}")
+    parser.add_argument("-k", "--kind", choices=list(LOG_KINDS),
+                        action='append',
+                        help="Kind of log to trim. Can be repeated. "
+                             "Default: all of them")
+    parser.add_argument("-n", "--dry_run", action='store_true',
+                        help="Report what would be trimmed without "
+                             "changing anything")
+    parser.add_argument("--verbose", action='store_true',
+                        help="Report every file changed and the bytes "
+                             "reclaimed. Otherwise only errors are "
+                             "reported, unless -n is given")
+    parser.add_argument("date", nargs='?', default="",
+                        help="Date reference, e.g. \"10 days ago\" or "
+                             "\"1 hour ago\"")
+    arg_info = parser.parse_args()
+    if not arg_info.date:
+        print("Supply a date reference, e.g. \"10 days ago\" or \"1 hour "
+              "ago\"", file=sys.stderr)
+        sys.exit(1)
+    now = time.time()
+    try:
+        cutoff = parse_date(arg_info.date, now)
+    except ValueError as e:
+        print(f"ERROR: {e}. Supply a date reference, e.g. \"10 days ago\" "
+              f"or \"1 hour ago\"", file=sys.stderr)
+        sys.exit(1)
+    if cutoff > now:
+        print("Date requested is in the future.  No changes made.",
+              file=sys.stderr)
+        sys.exit(1)
+
+    verbose = arg_info.verbose or arg_info.dry_run
+
+    def _report(_path, freed, deleted):
+        if verbose:
+            print(f"{'Deleted' if deleted else 'Trimmed'} {_path}: "
+                  f"{freed} bytes")
+
+    total = 0
+    home = os.path.expanduser("~")
+    for name in arg_info.kind or LOG_KINDS:
+        kind = LOG_KINDS[name]
+        if running(kind.app):
+            if verbose:
+                print(f"{kind.app} is running. {name} logs not trimmed.",
+                      file=sys.stderr)
+            continue
+        total += trim_kind(kind, cutoff, home, dry_run=arg_info.dry_run,
+                           report=_report)
+    if verbose:
+        print(f"{total} bytes {'would be ' if arg_info.dry_run else ''}"
+              f"reclaimed")
+    sys.exit(0)
@@ -0,0 +1,1017 @@
+#!/usr/bin/env python3
+
+# GPIO backends shared by radio-monitor.py, gpio_supervisor.py and
+# shutdown_button.py. Run on its own, it prints the values of GPIO pins
+# read in one go through the GPIO character device (see
+# check-piano.sh).
+
+import argparse
+import ctypes
+import errno
+import fcntl
+import glob
+import json
+import os
+import re
+import select
+import socket
+import sys
+import threading
+import time
+
+__author__ = "Steve Magnuson AG7GN"
+__copyright__ = "Copyright 2020, Steve Magnuson"
+__credits__ = ["Steve Magnuson"]
+__license__ = "GPL"
+__version__ = "1.2.1"
+__maintainer__ = "Steve Magnuson"
+__email__ = "ag7gn@arrl.net"
+__status__ = "Production"
+
+# Interval (s) at which pins that cannot raise interrupts are sampled.
+# Those are the PTT pins Direwolf and Fldigi drive as outputs, since
+# the kernel only does edge detection on inputs. This is the rate
+# radio-monitor.py used to poll at, so the sampling thread wakes up no
+# more often than the window used to. A change is seen up to this long
+# after it happens, and keyups shorter than this can be missed; packet
+# keyups last several times longer. Inputs never wait for it.
+DEFAULT_SAMPLE_INTERVAL = 0.1
+GPIO_SUPERVISOR_SOCKET = "/run/gpio_supervisor.sock"
+# Interval (s) at which GpioChipBackend's watcher looks for new pins or
+# a stop request when all its pins raise edge events
+EDGE_WAIT_INTERVAL = 0.1
+
+
+# GPIO character device uAPI v2 (linux/gpio.h, Linux 5.10 and later)
+def _iowr(nr: int, size: int) -> int:
+    return (3 << 30) | (size << 16) | (0xB4 << 8) | nr
+
+
+class _ChipInfo(ctypes.Structure):
+    _fields_ = [("name", ctypes.c_char * 32),
+                ("label", ctypes.c_char * 32),
+                ("lines", ctypes.c_uint32)]
+
+
+class _LineValues(ctypes.Structure):
+    _fields_ = [("bits", ctypes.c_uint64),
+                ("mask", ctypes.c_uint64)]
+
+
+class _LineAttribute(ctypes.Structure):
+    # The value is a union of the flags, output values and debounce
+    # period, of which only the first two are used here
+    _fields_ = [("id", ctypes.c_uint32),
+                ("padding", ctypes.c_uint32),
+                ("value", ctypes.c_uint64)]
+
+
+class _LineConfigAttribute(ctypes.Structure):
+    _fields_ = [("attr", _LineAttribute),
+                ("mask", ctypes.c_uint64)]
+
+
+class _LineConfig(ctypes.Structure):
+    _fields_ = [("flags", ctypes.c_uint64),
+                ("num_attrs", ctypes.c_uint32),
+                ("padding", ctypes.c_uint32 * 5),
+                ("attrs", _LineConfigAttribute * 10)]
+
+
+class _LineRequest(ctypes.Structure):
+    _fields_ = [("offsets", ctypes.c_uint32 * 64),
+                ("consumer", ctypes.c_char * 32),
+                ("config", _LineConfig),
+                ("num_lines", ctypes.c_uint32),
+                ("event_buffer_size", ctypes.c_uint32),
+                ("padding", ctypes.c_uint32 * 5),
+                ("fd", ctypes.c_int32)]
+
+
+GPIO_GET_CHIPINFO_IOCTL = (2 << 30) | (ctypes.sizeof(_ChipInfo) << 16) | \
+                          (0xB4 << 8) | 0x01
+GPIO_V2_GET_LINE_IOCTL = _iowr(0x07, ctypes.sizeof(_LineRequest))
+GPIO_V2_LINE_GET_VALUES_IOCTL = _iowr(0x0E, ctypes.sizeof(_LineValues))
+GPIO_V2_LINE_SET_VALUES_IOCTL = _iowr(0x0F, ctypes.sizeof(_LineValues))
+GPIO_V2_LINE_FLAG_INPUT = 1 << 2
+GPIO_V2_LINE_FLAG_OUTPUT = 1 << 3
+GPIO_V2_LINE_FLAG_EDGE_RISING = 1 << 4
+GPIO_V2_LINE_FLAG_EDGE_FALLING = 1 << 5
+GPIO_V2_LINE_FLAG_BIAS_PULL_UP = 1 << 8
+GPIO_V2_LINE_ATTR_ID_FLAGS = 1
+GPIO_V2_LINE_ATTR_ID_OUTPUT_VALUES = 2
+GPIO_V2_LINES_MAX = 64
+GPIO_V2_LINE_EVENT_SIZE = 48
+
+
+class RPiGPIOBackend(object):
+    """
+    GPIO access through RPi.GPIO.
+
+    PTT pins on the Nexus DR-X are outputs driven by Direwolf, Fldigi
+    and friends. RPi.GPIO only does edge detection on inputs, and
+    reconfiguring a PTT pin as an input would stop the other
+    application from keying the radio. So watch() uses interrupt edge
+    detection on every pin set up as an input (such as the shutdown
+    button, or PTT pins with --ptt_input), and samples the others from
+    a background thread (a memory-mapped register read), reporting
+    only the transitions.
+    """
+
+    def __init__(self, input: bool = False,
+                 sample_interval: float = DEFAULT_SAMPLE_INTERVAL,
+                 GPIO=None):
+        """
+        :param input: Default of setup()'s input argument
+        :param sample_interval: Interval (s) at which pins that are
+                                not inputs are sampled
+        :param GPIO: RPi.GPIO module, or a MockRPiGPIO. None imports
+                     RPi.GPIO.
+        """
+        if GPIO is None:
+            from RPi import GPIO
+        self.GPIO = GPIO
+        self.input = input
+        self.sample_interval = sample_interval
+        self._inputs = set()
+        # Last value reported for each pin with edge detection
+        self._last = {}
+        self._stop = threading.Event()
+
+    def setup(self, pins, input: bool = None, pull_up: bool = False):
+        """
+        Configures pins for monitoring.
+
+        :param pins: BCM pin numbers
+        :param input: Configure the pins as inputs, which can raise
+                      interrupts. None uses the input argument given
+                      to the constructor.
+        :param pull_up: Enable the internal pull-up on input pins
+        :return: None
+        """
+        if input is None:
+            input = self.input
+        self.GPIO.setmode(self.GPIO.BCM)
+        self.GPIO.setwarnings(False)
+        for pin in pins:
+            if input:
+                self.GPIO.setup(pin, self.GPIO.IN,
+                                pull_up_down=self.GPIO.PUD_UP if pull_up
+                                else self.GPIO.PUD_OFF)
+                self._inputs.add(pin)
+            else:
+                self.GPIO.setup(pin, self.GPIO.OUT)
+                self._inputs.discard(pin)
+
+    def read(self, pin: int) -> int:
+        return 1 if self.GPIO.input(pin) else 0
+
+    def write(self, pin: int, value: int):
+        self.GPIO.output(pin, 1 if value else 0)
+
+    def watch(self, pins, callback):
+        """
+        Calls callback(pin, value, timestamp) from a background thread
+        every time one of the pins changes state. timestamp is
+        time.monotonic() at the moment the change was seen.
+
+        :param pins: BCM pin numbers
+        :param callback: Function to call on every transition
+        :return: None
+        """
+        sampled = []
+        for pin in pins:
+            if pin in self._inputs:
+                self._last[pin] = self.read(pin)
+                self.GPIO.add_event_detect(
+                    pin, self.GPIO.BOTH,
+                    callback=lambda p: self._edge(p, callback))
+            else:
+                sampled.append(pin)
+        if sampled:
+            threading.Thread(target=self._sample, args=(sampled, callback),
+                             daemon=True).start()
+
+    def _edge(self, pin, callback):
+        # Called from RPi.GPIO's thread. Edges that arrive before it
+        # gets to run are reported once, so a pulse that is already
+        # over by then reads as no change: report both of its edges.
+        _now = time.monotonic()
+        value = self.read(pin)
+        if value == self._last[pin]:
+            callback(pin, 1 - value, _now)
+        self._last[pin] = value
+        callback(pin, value, _now)
+
+    def _sample(self, pins, callback):
+        last = {pin: self.read(pin) for pin in pins}
+        while not self._stop.wait(self.sample_interval):
+            for pin in pins:
+                value = self.read(pin)
+                if value != last[pin]:
+                    last[pin] = value
+                    callback(pin, value, time.monotonic())
+
+    def cleanup(self):
+        self._stop.set()
+        self.GPIO.cleanup()
+
+
+def find_gpiochip() -> str:
+    """
+    :return: Path of the character device of the Raspberry Pi's own
+             GPIO controller (the chip labelled pinctrl-...), or of the
+             first GPIO chip if none is
+    """
+    chips = sorted(glob.glob("/dev/gpiochip*"),
+                   key=lambda p: int(re.sub(r'\D', '', p) or 0))
+    if not chips:
+        raise OSError(errno.ENOENT, "No GPIO character device",
+                      "/dev/gpiochip*")
+    for _path in chips:
+        try:
+            chip = GpioChip(_path)
+        except OSError:
+            continue
+        chip.close()
+        if chip.label.startswith("pinctrl-"):
+            return _path
+    return chips[0]
+
+
+class GpioChip(object):
+    """
+    GPIO controller opened through its character device
+    (/dev/gpiochipN). On the Raspberry Pi's own controller, line
+    offsets are the BCM pin numbers.
+    """
+
+    def __init__(self, _path: str = None):
+        """
+        :param _path: Character device. None finds the Raspberry Pi's
+                      GPIO controller.
+        """
+        self.path = _path or find_gpiochip()
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CLOEXEC)
+        info = _ChipInfo()
+        try:
+            fcntl.ioctl(self.fd, GPIO_GET_CHIPINFO_IOCTL, info, True)
+        except OSError:
+            os.close(self.fd)
+            raise
+        self.name = info.name.decode()
+        self.label = info.label.decode()
+        self.lines = info.lines
+
+    def request(self, pins, inputs=(), pull_ups=(), outputs=None,
+                edges: bool = False, consumer: str = "nexus_gpio",
+                sample_interval: float = DEFAULT_SAMPLE_INTERVAL):
+        """
+        Requests pins from the chip, all of them in one line request.
+        See GpioLines for the arguments.
+
+        :return: GpioLines
+        """
+        return GpioLines(self, pins, inputs, pull_ups, outputs, edges,
+                         consumer, sample_interval)
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class _Lines(object):
+    # Pin to bit mapping shared by GpioLines and MockGpioLines. Bit n
+    # of the values holds pins[n].
+
+    def __init__(self, pins):
+        self.pins = list(pins)
+        if not 0 < len(self.pins) <= GPIO_V2_LINES_MAX or \
+                len(set(self.pins)) != len(self.pins):
+            raise ValueError(f"Between 1 and {GPIO_V2_LINES_MAX} different "
+                             f"pins can be requested at once")
+        self.bits = {pin: 1 << n for n, pin in enumerate(self.pins)}
+        self.all = (1 << len(self.pins)) - 1
+
+    def mask(self, pins) -> int:
+        """
+        :param pins: Some of the requested pins
+        :return: The bits holding those pins
+        """
+        _mask = 0
+        for pin in pins:
+            _mask |= self.bits[pin]
+        return _mask
+
+    def values(self, bits: int = None) -> dict:
+        """
+        :param bits: Values returned by read() or wait(). None reads
+                     them.
+        :return: Dictionary of pin: value (0 or 1)
+        """
+        if bits is None:
+            bits = self.read()
+        return {pin: 1 if bits & bit else 0 for pin, bit in
+                self.bits.items()}
+
+    def read(self) -> int:
+        raise NotImplementedError
+
+
+class GpioLines(_Lines):
+    """
+    Pins of a GpioChip requested together, so that one ioctl reads the
+    values of all of them at the same moment. Pins that are neither
+    inputs nor outputs are left as they are, which is what PTT pins
+    driven by another application need.
+
+    The kernel lets a pin be requested only once, so requesting a pin
+    that another application has requested through the character
+    device, or exported through /sys/class/gpio, fails with EBUSY.
+    """
+
+    def __init__(self, chip: GpioChip, pins, inputs=(), pull_ups=(),
+                 outputs=None, edges: bool = False,
+                 consumer: str = "nexus_gpio",
+                 sample_interval: float = DEFAULT_SAMPLE_INTERVAL):
+        """
+        :param chip: GpioChip
+        :param pins: BCM pin numbers, at most 64
+        :param inputs: Pins to configure as inputs
+        :param pull_ups: Inputs to enable the internal pull-up on
+        :param outputs: Dictionary of pins to configure as outputs and
+                        their initial values
+        :param edges: Detect edges on the inputs, so that wait() gets
+                      woken up by them instead of sampling them
+        :param consumer: Label the kernel shows for the pins
+        :param sample_interval: Interval (s) at which wait() samples the
+                                pins without edge detection
+        """
+        super().__init__(pins)
+        inputs = set(inputs) | set(pull_ups)
+        outputs = outputs or {}
+        self.sample_interval = sample_interval
+        self.edges = bool(edges and inputs)
+        self.sampled = not self.edges or set(self.pins) != inputs
+        request = _LineRequest()
+        for n, pin in enumerate(self.pins):
+            request.offsets[n] = pin
+        request.num_lines = len(self.pins)
+        request.consumer = consumer.encode()[:31]
+        # Pins without an attribute keep their direction
+        edge_flags = GPIO_V2_LINE_FLAG_EDGE_RISING | \
+            GPIO_V2_LINE_FLAG_EDGE_FALLING if self.edges else 0
+        attrs = [(GPIO_V2_LINE_ATTR_ID_FLAGS, flags, self.mask(_pins))
+                 for flags, _pins in
+                 ((GPIO_V2_LINE_FLAG_INPUT | edge_flags,
+                   inputs - set(pull_ups)),
+                  (GPIO_V2_LINE_FLAG_INPUT | edge_flags |
+                   GPIO_V2_LINE_FLAG_BIAS_PULL_UP, set(pull_ups)),
+                  (GPIO_V2_LINE_FLAG_OUTPUT, set(outputs))) if _pins]
+        if outputs:
+            attrs.append((GPIO_V2_LINE_ATTR_ID_OUTPUT_VALUES,
+                          self.mask(p for p, v in outputs.items() if v),
+                          self.mask(outputs)))
+        for n, (_id, value, mask) in enumerate(attrs):
+            request.config.attrs[n].attr.id = _id
+            request.config.attrs[n].attr.value = value
+            request.config.attrs[n].mask = mask
+        request.config.num_attrs = len(attrs)
+        try:
+            fcntl.ioctl(chip.fd, GPIO_V2_GET_LINE_IOCTL, request, True)
+        except OSError as e:
+            reason = "needs Linux 5.10 or later" \
+                if e.errno == errno.ENOTTY else e.strerror
+            raise OSError(e.errno, f"Cannot request GPIO "
+                                   f"{', '.join(map(str, self.pins))}: "
+                                   f"{reason}", chip.path) from None
+        self.fd = request.fd
+
+    def read(self) -> int:
+        """
+        :return: The values of all the pins, read with one ioctl
+        """
+        values = _LineValues(0, self.all)
+        fcntl.ioctl(self.fd, GPIO_V2_LINE_GET_VALUES_IOCTL, values, True)
+        return values.bits
+
+    def write(self, values: dict):
+        """
+        :param values: Dictionary of output pin: value
+        :return: None
+        """
+        _values = _LineValues(self.mask(p for p, v in values.items() if v),
+                              self.mask(values))
+        fcntl.ioctl(self.fd, GPIO_V2_LINE_SET_VALUES_IOCTL, _values, True)
+
+    def wait(self, last: int, timeout: float = None) -> int:
+        """
+        Waits for any of the pins to differ from last.
+
+        :param last: Values returned by read()
+        :param timeout: Seconds to wait at most. None waits forever.
+        :return: The current values, which are last if the timeout
+                 expired
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            bits = self.read()
+            if bits != last:
+                return bits
+            delay = None if deadline is None else deadline - time.monotonic()
+            if delay is not None and delay <= 0:
+                return bits
+            if self.sampled:
+                delay = self.sample_interval if delay is None \
+                    else min(delay, self.sample_interval)
+            if not self.edges:
+                time.sleep(delay)
+            elif select.select([self.fd], [], [], delay)[0]:
+                # Only the values matter, not the queued events
+                os.read(self.fd, GPIO_V2_LINE_EVENT_SIZE * 16)
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class MockGpioChip(object):
+    """
+    Hardware-free stand-in for GpioChip. Pin values come from set(),
+    and lines requested from it behave as a real chip's would,
+    including EBUSY for pins that are already requested.
+    """
+
+    path = "mock"
+    name = "mock"
+    label = "mock"
+
+    def __init__(self, values=None, lines: int = 54):
+        """
+        :param values: Dictionary of pin: initial value
+        :param lines: Number of pins on the chip
+        """
+        self.values = dict(values or {})
+        self.lines = lines
+        self.requested = set()
+        self.changed = threading.Condition()
+
+    def request(self, pins, inputs=(), pull_ups=(), outputs=None,
+                edges: bool = False, consumer: str = "nexus_gpio",
+                sample_interval: float = DEFAULT_SAMPLE_INTERVAL):
+        return MockGpioLines(self, pins, pull_ups, outputs)
+
+    def set(self, pin: int, value: int):
+        """
+        Changes a pin, waking up waiting lines as a real edge would.
+
+        :param pin: BCM pin number
+        :param value: 0 or 1
+        :return: None
+        """
+        with self.changed:
+            self.values[pin] = value
+            self.changed.notify_all()
+
+    def close(self):
+        pass
+
+
+class MockGpioLines(_Lines):
+    """
+    Pins requested from a MockGpioChip.
+    """
+
+    def __init__(self, chip: MockGpioChip, pins, pull_ups=(), outputs=None):
+        super().__init__(pins)
+        with chip.changed:
+            for pin in self.pins:
+                if pin in chip.requested:
+                    raise OSError(errno.EBUSY, f"Cannot request GPIO {pin}: "
+                                               f"{os.strerror(errno.EBUSY)}",
+                                  chip.path)
+                if not 0 <= pin < chip.lines:
+                    raise OSError(errno.EINVAL, f"Cannot request GPIO {pin}: "
+                                                f"{os.strerror(errno.EINVAL)}",
+                                  chip.path)
+            chip.requested.update(self.pins)
+            for pin in pull_ups:
+                chip.values.setdefault(pin, 1)
+            chip.values.update(outputs or {})
+        self.chip = chip
+        self.outputs = set(outputs or {})
+
+    def read(self) -> int:
+        with self.chip.changed:
+            return self.mask(pin for pin in self.pins
+                             if self.chip.values.get(pin))
+
+    def write(self, values: dict):
+        if not set(values) <= self.outputs:
+            raise OSError(errno.EPERM, os.strerror(errno.EPERM))
+        with self.chip.changed:
+            self.chip.values.update(values)
+            self.chip.changed.notify_all()
+
+    def wait(self, last: int, timeout: float = None) -> int:
+        with self.chip.changed:
+            self.chip.changed.wait_for(lambda: self.read() != last, timeout)
+            return self.read()
+
+    def close(self):
+        with self.chip.changed:
+            self.chip.requested.difference_update(self.pins)
+
+
+class GpioChipBackend(object):
+    """
+    GPIO access through the GPIO character device. All the pins set up
+    are requested as one set of GpioLines, so the watcher reads every
+    one of them with a single ioctl per sample instead of one read per
+    pin, and the transitions it reports were all seen at the same
+    moment. Inputs (such as the shutdown button) wake the watcher up
+    with edge events; PTT pins, which keep their direction, are
+    sampled.
+
+    See GpioLines about pins used by other applications: PTT pins that
+    Direwolf or Fldigi have exported cannot be watched this way, and
+    need RPiGPIOBackend.
+    """
+
+    def __init__(self, chip=None, input: bool = False,
+                 sample_interval: float = DEFAULT_SAMPLE_INTERVAL):
+        """
+        :param chip: GpioChip or MockGpioChip. None opens the Raspberry
+                     Pi's GPIO controller.
+        :param input: Default of setup()'s input argument
+        :param sample_interval: Interval (s) at which pins that are
+                                not inputs are sampled
+        """
+        self.chip = chip or GpioChip()
+        self.input = input
+        self.sample_interval = sample_interval
+        self._pins = []
+        self._inputs = set()
+        self._pull_ups = set()
+        self._outputs = {}
+        self._lines = None
+        self._requested_values = {}
+        self._callbacks = []
+        self._lock = threading.Lock()
+        # The lines the watcher is waiting on without the lock, the
+        # number of threads waiting to release the lines, and the
+        # condition notified when either goes down
+        self._waiting = None
+        self._releasing = 0
+        self._idle = threading.Condition(self._lock)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def setup(self, pins, input: bool = None, pull_up: bool = False):
+        """
+        Configures pins for monitoring. The pins already set up are
+        requested again along with them.
+
+        :param pins: BCM pin numbers
+        :param input: Configure the pins as inputs. None uses the input
+                      argument given to the constructor. Other pins
+                      keep their direction until they are written to.
+        :param pull_up: Enable the internal pull-up on input pins
+        :return: None
+        """
+        if input is None:
+            input = self.input
+        with self._lock:
+            for pin in pins:
+                if pin not in self._pins:
+                    self._pins.append(pin)
+                self._inputs.discard(pin)
+                self._pull_ups.discard(pin)
+                self._outputs.pop(pin, None)
+                if input:
+                    (self._pull_ups if pull_up else self._inputs).add(pin)
+            self._request()
+
+    def _release(self):
+        # Called with the lock held. The kernel only lets the pins be
+        # requested again once they are released, so this waits for
+        # the watcher to stop waiting on them, at most
+        # EDGE_WAIT_INTERVAL.
+        self._releasing += 1
+        try:
+            self._idle.wait_for(lambda: self._waiting is None or
+                                self._waiting is not self._lines)
+        finally:
+            self._releasing -= 1
+            self._idle.notify_all()
+        if self._lines:
+            self._lines.close()
+            self._lines = None
+
+    def _request(self):
+        # Called with the lock held
+        self._release()
+        self._lines = self.chip.request(
+            self._pins, inputs=self._inputs, pull_ups=self._pull_ups,
+            outputs=self._outputs, edges=True,
+            sample_interval=self.sample_interval)
+        self._requested_values = self._lines.values()
+
+    def read(self, pin: int) -> int:
+        with self._lock:
+            return 1 if self._lines.read() & self._lines.bits[pin] else 0
+
+    def read_all(self) -> dict:
+        """
+        :return: Dictionary of pin: value of all the pins set up, read
+                 at the same moment
+        """
+        with self._lock:
+            return self._lines.values()
+
+    def write(self, pin: int, value: int):
+        value = 1 if value else 0
+        with self._lock:
+            if pin in self._outputs:
+                self._outputs[pin] = value
+                self._lines.write({pin: value})
+            else:
+                # The pin becomes an output
+                if pin not in self._pins:
+                    self._pins.append(pin)
+                self._inputs.discard(pin)
+                self._pull_ups.discard(pin)
+                self._outputs[pin] = value
+                self._request()
+
+    def watch(self, pins, callback):
+        """
+        Calls callback(pin, value, timestamp) from a background thread
+        every time one of the pins changes state. timestamp is
+        time.monotonic() at the moment the change was seen.
+
+        :param pins: BCM pin numbers, which must have been set up
+        :param callback: Function to call on every transition
+        :return: None
+        """
+        with self._lock:
+            self._callbacks.append((set(pins), callback))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._watch,
+                                                daemon=True)
+                self._thread.start()
+
+    def _watch(self):
+        last = {}
+        lines = None
+        while True:
+            with self._lock:
+                # Otherwise the watcher could take the lock back before
+                # a thread waiting in _release() gets it
+                self._idle.wait_for(lambda: not self._releasing)
+                if self._stop.is_set():
+                    return
+                if lines is not self._lines:
+                    # Pins set up since the last wait start from the
+                    # value they had when requested, so a change made
+                    # right after setup() is reported
+                    for pin, value in self._requested_values.items():
+                        last.setdefault(pin, value)
+                lines = self._waiting = self._lines
+                _last = lines.mask(p for p, v in last.items()
+                                   if v and p in lines.bits)
+            # Waits without the lock, so read() and write() are not
+            # held up. setup() waits for this to return before it
+            # releases the lines.
+            try:
+                bits = lines.wait(_last, EDGE_WAIT_INTERVAL)
+            finally:
+                with self._lock:
+                    self._waiting = None
+                    self._idle.notify_all()
+                    requested = lines is not self._lines
+                    callbacks = list(self._callbacks)
+            if requested:
+                # The pins were requested again while waiting. Start
+                # over with the new lines.
+                continue
+            values = lines.values(bits)
+            _now = time.monotonic()
+            for pin, value in values.items():
+                if pin in last and value != last[pin]:
+                    for pins, callback in callbacks:
+                        if pin in pins:
+                            callback(pin, value, _now)
+            last = values
+
+    def cleanup(self):
+        self._stop.set()
+        with self._lock:
+            self._release()
+        self.chip.close()
+
+
+class MockRPiGPIO(object):
+    """
+    Hardware-free stand-in for the RPi.GPIO module, for running
+    RPiGPIOBackend without a Pi. Input pins are driven with set(). As
+    with RPi.GPIO, edge detection is only allowed on inputs, and the
+    callbacks run in a thread of their own, which is told about edges
+    that arrive while it is busy only once.
+    """
+
+    BCM = 11
+    IN = 1
+    OUT = 0
+    PUD_OFF = 20
+    PUD_UP = 22
+    BOTH = 33
+
+    def __init__(self, values=None):
+        """
+        :param values: Dictionary of pin: initial value
+        """
+        self.values = dict(values or {})
+        self.directions = {}
+        self.callbacks = {}
+        self._pending = set()
+        self._changed = threading.Condition()
+        self._thread = None
+
+    def setmode(self, _mode):
+        pass
+
+    def setwarnings(self, _warnings: bool):
+        pass
+
+    def setup(self, pin: int, direction: int, pull_up_down: int = PUD_OFF):
+        with self._changed:
+            self.directions[pin] = direction
+            if pull_up_down == self.PUD_UP:
+                self.values.setdefault(pin, 1)
+
+    def input(self, pin: int) -> int:
+        with self._changed:
+            return self.values.get(pin, 0)
+
+    def output(self, pin: int, value: int):
+        if self.directions.get(pin) != self.OUT:
+            raise RuntimeError("The GPIO channel has not been set up as an "
+                               "OUTPUT")
+        self.set(pin, value)
+
+    def add_event_detect(self, pin: int, _edge: int, callback=None,
+                         bouncetime: int = None):
+        if self.directions.get(pin) != self.IN:
+            raise RuntimeError("You must setup() the GPIO channel as an "
+                               "input first")
+        with self._changed:
+            self.callbacks[pin] = callback
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._dispatch,
+                                                daemon=True)
+                self._thread.start()
+
+    def set(self, pin: int, value: int):
+        """
+        Changes a pin as the outside world would.
+
+        :param pin: BCM pin number
+        :param value: 0 or 1
+        :return: None
+        """
+        with self._changed:
+            if self.values.get(pin, 0) != value and pin in self.callbacks:
+                self._pending.add(pin)
+                self._changed.notify_all()
+            self.values[pin] = value
+
+    def _dispatch(self):
+        while True:
+            with self._changed:
+                self._changed.wait_for(lambda: self._pending or
+                                       not self.callbacks)
+                if not self.callbacks:
+                    self._thread = None
+                    return
+                pin = self._pending.pop()
+                callback = self.callbacks[pin]
+            if callback:
+                callback(pin)
+
+    def cleanup(self):
+        with self._changed:
+            self.callbacks = {}
+            self.directions = {}
+            self._pending = set()
+            self._changed.notify_all()
+
+
+class FakeGPIOBackend(object):
+    """
+    Hardware-free stand-in for the GPIO backends. Pin changes come
+    from a scripted timeline of (delay, pin, value) entries, where
+    delay is the number of seconds after the previous entry, or from
+    calls to set().
+    """
+
+    def __init__(self, timeline=()):
+        self.timeline = list(timeline)
+        self.values = {}
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_file(cls, _file):
+        """
+        Builds a FakeGPIOBackend from a file with one entry per line:
+        'delay pin value', e.g. '0.25 12 1'. Blank lines and lines
+        starting with '#' are ignored.
+
+        :param _file: Open text file
+        :return: FakeGPIOBackend
+        """
+        timeline = []
+        for line in _file:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            delay, pin, value = line.split()[:3]
+            timeline.append((float(delay), int(pin), int(value)))
+        return cls(timeline)
+
+    def setup(self, pins, input: bool = None, pull_up: bool = False):
+        for pin in pins:
+            self.values.setdefault(pin, 1 if pull_up else 0)
+
+    def read(self, pin: int) -> int:
+        return self.values.get(pin, 0)
+
+    def write(self, pin: int, value: int):
+        self.set(pin, value)
+
+    def set(self, pin: int, value: int):
+        """
+        Changes a pin, notifying watchers as a real edge would.
+
+        :param pin: BCM pin number
+        :param value: 0 or 1
+        :return: None
+        """
+        with self._lock:
+            changed = self.values.get(pin, 0) != value
+            self.values[pin] = value
+            callbacks = list(self._callbacks)
+        if changed:
+            _now = time.monotonic()
+            for pins, callback in callbacks:
+                if pin in pins:
+                    callback(pin, value, _now)
+
+    def watch(self, pins, callback):
+        with self._lock:
+            self._callbacks.append((set(pins), callback))
+        if self._thread is None and self.timeline:
+            self._thread = threading.Thread(target=self._replay, daemon=True)
+            self._thread.start()
+
+    def _replay(self):
+        for delay, pin, value in self.timeline:
+            if self._stop.wait(delay):
+                return
+            self.set(pin, value)
+
+    def cleanup(self):
+        self._stop.set()
+
+
+class SocketGPIOBackend(object):
+    """
+    Read-only backend that gets PTT states from gpio_supervisor.py
+    instead of the hardware, so that several monitors can share the
+    GPIOs owned by one supervisor process. The supervisor's greeting
+    line lists its radios and their current states; after that every
+    TX/RX event is turned into a transition.
+    """
+
+    def __init__(self, _path: str = GPIO_SUPERVISOR_SOCKET, on_close=None):
+        """
+        :param _path: gpio_supervisor.py socket
+        :param on_close: Called from the receiving thread if the
+                         supervisor goes away
+        """
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.sock.connect(_path)
+        except OSError:
+            self.sock.close()
+            raise
+        self._file = self.sock.makefile('r', encoding='utf-8')
+        self.on_close = on_close
+        self._closing = False
+        hello = json.loads(self._file.readline() or '{}')
+        self.radios = [(r["radio"], r["pin"]) for r in hello.get("radios", [])]
+        self.values = {r["pin"]: r["value"] for r in hello.get("radios", [])}
+
+    def setup(self, pins, input: bool = None, pull_up: bool = False):
+        for pin in pins:
+            if pin not in self.values:
+                print(f"WARNING: gpio_supervisor.py is not watching GPIO "
+                      f"{pin}", file=sys.stderr)
+
+    def read(self, pin: int) -> int:
+        return self.values.get(pin, 0)
+
+    def watch(self, pins, callback):
+        threading.Thread(target=self._receive, args=(set(pins), callback),
+                         daemon=True).start()
+
+    def _receive(self, pins, callback):
+        try:
+            for line in self._file:
+                event = json.loads(line)
+                if event.get("pin") not in pins or \
+                        event.get("state") not in ("TX", "RX"):
+                    continue
+                value = 1 if event["state"] == "TX" else 0
+                self.values[event["pin"]] = value
+                # Event times are epoch seconds
+                callback(event["pin"], value,
+                         time.monotonic() - (time.time() - event["time"]))
+        except (OSError, ValueError):
+            pass
+        if not self._closing:
+            print("WARNING: Lost connection to gpio_supervisor.py",
+                  file=sys.stderr)
+            if self.on_close:
+                self.on_close()
+
+    def cleanup(self):
+        self._closing = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog='nexus_gpio.py',
+        description="Prints the values of GPIO pins, all read at the same "
+                    "moment through the GPIO character device",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('-v', '--version', action='version',
+                        version=f"Version: {__version__}")
+    parser.add_argument("pins", type=int, nargs='+', metavar="PIN",
+                        help="GPIO (BCM numbering)")
+    parser.add_argument("-c", "--chip", type=str,
+                        help="GPIO character device. The Raspberry Pi's "
+                             "GPIO controller is used if omitted")
+    parser.add_argument("-m", "--mask", action='store_true',
+                        help="Print the values as one number, the first "
+                             "PIN being bit 0")
+    parser.add_argument("-w", "--wait", action='store_true',
+                        help="Wait for one of the pins to change before "
+                             "printing the values")
+    parser.add_argument("-t", "--timeout", type=float,
+                        help="Stop waiting after TIMEOUT seconds and exit "
+                             "with status 2")
+    parser.add_argument("-i", "--input", action='store_true',
+                        help="Configure the pins as inputs, so that --wait "
+                             "uses edge events instead of sampling them")
+    parser.add_argument("--sample_interval", type=float,
+                        default=DEFAULT_SAMPLE_INTERVAL * 1000,
+                        help="Sampling interval in milliseconds for "
+                             "--wait without --input")
+    arg_info = parser.parse_args()
+    try:
+        gpio_chip = GpioChip(arg_info.chip)
+        try:
+            gpio_lines = gpio_chip.request(
+                arg_info.pins,
+                inputs=arg_info.pins if arg_info.input else (),
+                edges=arg_info.wait,
+                sample_interval=arg_info.sample_interval / 1000)
+        except ValueError as e:
+            parser.error(str(e))
+        bits = gpio_lines.read()
+        timed_out = False
+        if arg_info.wait:
+            last = bits
+            bits = gpio_lines.wait(last, arg_info.timeout)
+            timed_out = bits == last
+        gpio_lines.close()
+        gpio_chip.close()
+    except OSError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        sys.exit(1)
+    if arg_info.mask:
+        print(bits)
+    else:
+        print(' '.join(str(v) for v in gpio_lines.values(bits).values()))
+    sys.exit(2 if timed_out else 0)
@@ -0,0 +1,45 @@
+import grp
+import os
+import socket
+import sys
+
+__author__ = "Steve Magnuson AG7GN"
+__copyright__ = "Copyright 2020, Steve Magnuson"
+__credits__ = ["Steve Magnuson"]
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Steve Magnuson"
+__email__ = "ag7gn@arrl.net"
+__status__ = "Production"
+
+# First file descriptor passed by systemd socket activation
+SD_LISTEN_FDS_START = 3
+
+
+def listen_socket(_path: str, group: str) -> socket.socket:
+    """
+    Returns the listening socket passed in by systemd socket
+    activation, or creates one at _path readable and writable by the
+    owner and group. Used by usb_controld.py and gpio_supervisor.py.
+
+    :param _path: Socket path
+    :param group: Group allowed to use the socket
+    :return: Listening socket
+    """
+    if os.environ.get('LISTEN_PID') == str(os.getpid()) and \
+            int(os.environ.get('LISTEN_FDS', '0')) >= 1:
+        return socket.socket(fileno=SD_LISTEN_FDS_START)
+    try:
+        os.unlink(_path)
+    except FileNotFoundError:
+        pass
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(_path)
+    try:
+        os.chown(_path, -1, grp.getgrnam(group).gr_gid)
+    except (KeyError, PermissionError) as e:
+        print(f"WARNING: Cannot give group '{group}' access to {_path}: {e}",
+              file=sys.stderr)
+    os.chmod(_path, 0o660)
+    listener.listen(16)
+    return listener
@@ -0,0 +1,380 @@
+import argparse
+import array
+import collections
+import json
+import os
+import queue
+import socket
+import sys
+import threading
+import time
+
+__author__ = "Steve Magnuson AG7GN"
+__copyright__ = "Copyright 2020, Steve Magnuson"
+__credits__ = ["Steve Magnuson"]
+__license__ = "GPL"
+__version__ = "1.0.1"
+__maintainer__ = "Steve Magnuson"
+__email__ = "ag7gn@arrl.net"
+__status__ = "Production"
+
+# Rolling statistics window (s)
+DEFAULT_STATS_WINDOW = 3600
+# Number of TX intervals kept per radio
+DEFAULT_RING_SIZE = 8192
+# How often (s) stuck PTTs are checked for
+STUCK_CHECK_INTERVAL = 1.0
+
+PttSummary = collections.namedtuple(
+    'PttSummary', ['airtime', 'duty_cycle', 'keyups', 'longest_tx',
+                   'current_tx'])
+PttSummary.__doc__ = """\
+Statistics for one radio over the rolling window. airtime and the TX
+durations are in seconds and duty_cycle is a fraction of the window.
+current_tx is how long the radio has been transmitting, 0 if it is
+receiving."""
+
+
+class PttStats(object):
+    """
+    Transmit-time accounting for one radio. Each keyup/unkey pair is
+    stored as a (start, duration) record in fixed-size arrays used as
+    a ring buffer, so memory use is constant no matter how long the
+    monitor runs. Airtime, keyup count and the longest TX over the
+    rolling window are kept up to date as records are added and
+    expire, rather than recomputed from the whole history.
+
+    If more than ring_size keyups happen within one window, the oldest
+    ones are dropped early and the statistics undercount.
+    """
+
+    def __init__(self, window: float = DEFAULT_STATS_WINDOW,
+                 ring_size: int = DEFAULT_RING_SIZE):
+        self.window = window
+        self.ring_size = ring_size
+        self.starts = array.array('d', bytes(8 * ring_size))
+        self.durations = array.array('d', bytes(8 * ring_size))
+        # Records are numbered from 0 forever; record n lives in slot
+        # n % ring_size. Records first..next-1 are in the window.
+        self._first = 0
+        self._next = 0
+        self._airtime = 0.0
+        # Record numbers in decreasing duration order, for the rolling
+        # maximum
+        self._longest = collections.deque()
+        self.tx_start = None
+
+    def transition(self, value: int, timestamp: float):
+        """
+        Records a PTT transition.
+
+        :param value: 1 for TX (keyup), 0 for RX (unkey)
+        :param timestamp: time.monotonic() of the transition
+        :return: Duration (s) of the TX that just ended, None if no
+                 TX ended
+        """
+        if value:
+            if self.tx_start is None:
+                self.tx_start = timestamp
+            return None
+        if self.tx_start is None:
+            return None
+        duration = max(0.0, timestamp - self.tx_start)
+        self._append(self.tx_start, duration)
+        self.tx_start = None
+        return duration
+
+    def _append(self, start: float, duration: float):
+        if self._next - self._first == self.ring_size:
+            self._expire_first()
+        slot = self._next % self.ring_size
+        self.starts[slot] = start
+        self.durations[slot] = duration
+        self._airtime += duration
+        while self._longest and \
+                self.durations[self._longest[-1] % self.ring_size] <= duration:
+            self._longest.pop()
+        self._longest.append(self._next)
+        self._next += 1
+
+    def _expire_first(self):
+        slot = self._first % self.ring_size
+        self._airtime -= self.durations[slot]
+        if self._longest and self._longest[0] == self._first:
+            self._longest.popleft()
+        self._first += 1
+
+    def summary(self, now: float = None) -> PttSummary:
+        """
+        Returns the statistics for the window ending at now.
+
+        :param now: time.monotonic() value, defaults to the current time
+        :return: PttSummary
+        """
+        if now is None:
+            now = time.monotonic()
+        window_start = now - self.window
+        while self._first < self._next:
+            slot = self._first % self.ring_size
+            if self.starts[slot] + self.durations[slot] > window_start:
+                break
+            self._expire_first()
+        airtime = self._airtime
+        keyups = self._next - self._first
+        if keyups:
+            # The oldest TX may have started before the window
+            slot = self._first % self.ring_size
+            airtime -= max(0.0, window_start - self.starts[slot])
+        longest = self.durations[self._longest[0] % self.ring_size] \
+            if self._longest else 0.0
+        current = 0.0
+        if self.tx_start is not None:
+            current = now - self.tx_start
+            airtime += min(current, self.window)
+            longest = max(longest, current)
+            keyups += 1
+        return PttSummary(airtime, airtime / self.window, keyups, longest,
+                          current)
+
+
+class PttStatsFile(object):
+    """
+    Appends one CSV record per completed transmission:
+    'epoch seconds at keyup,radio name,TX duration in seconds'.
+    """
+
+    def __init__(self, _path: str):
+        self.file = open(_path, 'a', buffering=1)
+
+    def write(self, radio: str, start: float, duration: float):
+        """
+        :param radio: Radio name
+        :param start: time.monotonic() at keyup
+        :param duration: TX duration (s)
+        :return: None
+        """
+        epoch = time.time() - (time.monotonic() - start)
+        self.file.write(f"{epoch:.3f},{radio},{duration:.3f}\n")
+
+    def close(self):
+        self.file.close()
+
+
+class PttMonitor(object):
+    """
+    Watches the PTT GPIOs of any number of radios. Transitions reported
+    by the GPIO backend's thread are queued, and process() turns them
+    into events in the caller's thread: it updates each radio's
+    PttStats, writes the stats file and hands an event dict to every
+    subscriber:
+
+        {"time": epoch seconds, "radio": name, "pin": BCM pin,
+         "state": "TX" | "RX" | "STUCK", "duration": TX seconds}
+
+    duration is only present on the RX event that ends a
+    transmission, and on STUCK events. No GUI toolkit is needed; the
+    Tk window in radio-monitor.py is just another subscriber.
+    """
+
+    def __init__(self, gpio, radios, stats_window: float =
+                 DEFAULT_STATS_WINDOW, stats_file: PttStatsFile = None,
+                 stuck_ptt: float = 0, wakeup=None):
+        """
+        :param gpio: GPIO backend (see nexus_gpio)
+        :param radios: List of (name, BCM pin) tuples
+        :param stats_window: Rolling statistics window (s)
+        :param stats_file: PttStatsFile or None
+        :param stuck_ptt: Report STUCK when a radio transmits for more
+                          than this many seconds. 0 disables the check.
+        :param wakeup: Called from the GPIO backend's thread each time
+                       a transition is queued, so that an event loop
+                       can call process() at once instead of polling
+        """
+        self.gpio = gpio
+        self.names = collections.OrderedDict()
+        for name, pin in radios:
+            if pin in self.names:
+                raise ValueError(f"GPIO {pin} is assigned to both "
+                                 f"'{self.names[pin]}' and '{name}'")
+            self.names[pin] = name
+        self.stats = {pin: PttStats(window=stats_window)
+                      for pin in self.names}
+        self.state = {}
+        self.stats_file = stats_file
+        self.stuck_ptt = stuck_ptt
+        self.wakeup = wakeup
+        self.stuck = set()
+        self.subscribers = []
+        self.transitions = queue.Queue()
+        self.running = False
+        self._next_stuck_check = 0.0
+
+    def subscribe(self, callback):
+        """
+        :param callback: Called as callback(event) for every event
+        :return: None
+        """
+        self.subscribers.append(callback)
+
+    def start(self):
+        """
+        Sets up the GPIOs, records their current state and starts
+        watching them.
+
+        :return: None
+        """
+        self.gpio.setup(list(self.names))
+        now = time.monotonic()
+        for pin in self.names:
+            self.state[pin] = self.gpio.read(pin)
+            self.stats[pin].transition(self.state[pin], now)
+        self.gpio.watch(list(self.names), self._queue_transition)
+        self.running = True
+
+    def _queue_transition(self, pin, value, timestamp):
+        # Called from the GPIO backend's thread
+        self.transitions.put((pin, value, timestamp))
+        if self.wakeup:
+            self.wakeup()
+
+    def _emit(self, pin, state, timestamp, duration=None):
+        event = {"time": round(time.time() - (time.monotonic() - timestamp),
+                               3),
+                 "radio": self.names[pin], "pin": pin, "state": state}
+        if duration is not None:
+            event["duration"] = round(duration, 3)
+        for callback in self.subscribers:
+            callback(event)
+
+    def process(self, timeout: float = 0):
+        """
+        Handles every queued transition and checks for stuck PTTs.
+
+        :param timeout: Seconds to wait for the first transition. 0
+                        returns at once if nothing is queued.
+        :return: None
+        """
+        try:
+            item = self.transitions.get(timeout=timeout) if timeout \
+                else self.transitions.get_nowait()
+        except queue.Empty:
+            item = None
+        while item is not None:
+            pin, value, timestamp = item
+            if value != self.state.get(pin):
+                self.state[pin] = value
+                duration = self.stats[pin].transition(value, timestamp)
+                if not value:
+                    self.stuck.discard(pin)
+                if duration is not None and self.stats_file:
+                    self.stats_file.write(self.names[pin],
+                                          timestamp - duration, duration)
+                self._emit(pin, "TX" if value else "RX", timestamp,
+                           duration)
+            try:
+                item = self.transitions.get_nowait()
+            except queue.Empty:
+                item = None
+        now = time.monotonic()
+        if self.stuck_ptt and now >= self._next_stuck_check:
+            self._next_stuck_check = now + STUCK_CHECK_INTERVAL
+            for pin, stats in self.stats.items():
+                if pin not in self.stuck and stats.tx_start is not None \
+                        and now - stats.tx_start >= self.stuck_ptt:
+                    self.stuck.add(pin)
+                    self._emit(pin, "STUCK", now, now - stats.tx_start)
+
+    def run(self):
+        """
+        Processes transitions until stop() is called. Used when there
+        is no GUI main loop.
+
+        :return: None
+        """
+        while self.running:
+            self.process(timeout=STUCK_CHECK_INTERVAL)
+
+    def stop(self, cleanup: bool = True):
+        """
+        :param cleanup: Release the GPIOs as well. Pass False when the
+                        GPIO backend is shared with something else,
+                        which then calls cleanup() itself.
+        :return: None
+        """
+        self.running = False
+        if cleanup:
+            self.gpio.cleanup()
+        if self.stats_file:
+            self.stats_file.close()
+
+
+def radio_spec(spec):
+    """
+    argparse type for --radio NAME=PIN
+
+    :param spec: 'NAME=PIN' string
+    :return: (NAME, PIN) tuple
+    """
+    name, sep, pin = spec.rpartition('=')
+    if not sep or not name or not pin.isdigit():
+        raise argparse.ArgumentTypeError(f"'{spec}' is not NAME=PIN")
+    return name, int(pin)
+
+
+def write_ndjson(event: dict, _file=sys.stdout):
+    """
+    Subscriber that writes each event as one line of JSON.
+
+    :param event: Event from PttMonitor
+    :param _file: Output file, flushed after every line
+    :return: None
+    """
+    _file.write(json.dumps(event) + '\n')
+    _file.flush()
+
+
+class NdjsonSocketPublisher(object):
+    """
+    Subscriber that streams events as newline-delimited JSON to every
+    client connected to a Unix domain socket. A client that stops
+    reading is disconnected rather than allowed to stall the monitor.
+    """
+
+    def __init__(self, _path: str):
+        try:
+            os.unlink(_path)
+        except FileNotFoundError:
+            pass
+        self.path = _path
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(_path)
+        self.listener.listen(8)
+        self.clients = []
+        self._lock = threading.Lock()
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.listener.accept()
+            except OSError:
+                return
+            conn.setblocking(False)
+            with self._lock:
+                self.clients.append(conn)
+
+    def __call__(self, event: dict):
+        data = json.dumps(event).encode('utf-8') + b'\n'
+        with self._lock:
+            for conn in list(self.clients):
+                try:
+                    if conn.send(data) == len(data):
+                        continue
+                except OSError:
+                    pass
+                self.clients.remove(conn)
+                conn.close()
+
+    def close(self):
+        self.listener.close()
+        os.unlink(self.path)
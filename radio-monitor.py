@@ -4,17 +4,22 @@
 # a label accordingly.  
 #
 
-import tkinter
-import tkinter.font as tkfont
 import argparse
-from RPi import GPIO
+import os
+import signal
 import time
+import sys
+from nexus_gpio import RPiGPIOBackend, GpioChipBackend, GpioChip, \
+    FakeGPIOBackend, SocketGPIOBackend, DEFAULT_SAMPLE_INTERVAL, \
+    GPIO_SUPERVISOR_SOCKET
+from ptt_monitor import PttMonitor, PttStatsFile, NdjsonSocketPublisher, \
+    write_ndjson, radio_spec, DEFAULT_STATS_WINDOW
 
 __author__ = "Steve Magnuson AG7GN"
 __copyright__ = "Copyright 2020, Steve Magnuson"
 __credits__ = ["Steve Magnuson"]
 __license__ = "GPL"
-__version__ = "1.0.0"
+__version__ = "1.5.0"
 __maintainer__ = "Steve Magnuson"
 __email__ = "ag7gn@arrl.net"
 __status__ = "Production"
@@ -22,10 +27,19 @@ left_PTT_pin_default = 12
 right_PTT_pin_default = 23
 title = 'TX/RX Status'
 colors=["white", "black", "red", "green", "blue", "cyan", "yellow", "magenta"]
+# Colors for radios beyond the first two: text, RX background, TX background
+extra_radio_colors = ("yellow", "green", "red")
 
 class StatusWindow(object):
 
-    poll_interval = 100
+    # Minimum time (s) a TX indication is shown, so that PTT bursts
+    # too short to see are still visible
+    min_tx_display = 0.25
+    # How often (ms) the TX statistics are redrawn and stuck PTTs are
+    # checked for
+    stats_interval = 1000
+    stuck_color = "magenta"
+    radio_width = 200
 
     def __init__(self, iterable=(), **kwargs):
         self.__dict__.update(iterable, **kwargs)
@@ -33,55 +47,131 @@ class StatusWindow(object):
         self.tkroot = tkinter.Tk()
         labelFont = tkfont.Font(family = 'Helvetica', size = 18, weight = 'bold')
         buttonFont = tkfont.Font(family = 'Helvetica', size = 14)
-        self.tkroot.geometry("400x160")
+        statsFont = tkfont.Font(family = 'Helvetica', size = 10)
+        self.tkroot.geometry(f"{self.radio_width * max(2, len(self.monitor.names))}x200")
         self.tkroot.title(f"{self.win_title} - {__version__}")
 
-        self.set_up_GPIO()
-
-        if GPIO.input(self.left_PTT_pin):
-            self.leftRadioStatus = tkinter.Label(self.tkroot, text="Left Radio\nTX", font=labelFont,
-                                   bg=self.left_bg_tx_color, fg=self.left_text_color)
-        else:
-            self.leftRadioStatus = tkinter.Label(self.tkroot, text="Left Radio\nRX", font=labelFont,
-                                   bg=self.left_bg_rx_color, fg=self.left_text_color)
-        self.leftRadioStatus.pack(padx=10, pady=5, side=tkinter.LEFT, expand=True, fill=tkinter.X)
-        if GPIO.input(self.right_PTT_pin):
-            self.leftRadioStatus = tkinter.Label(self.tkroot, text="Right Radio\nTX", font=labelFont,
-                                   bg=self.right_bg_rx_color, fg=self.right_text_color)
-        else:
-            self.rightRadioStatus = tkinter.Label(self.tkroot, text="Right Radio\nRX", font=labelFont,
-                                   bg=self.right_bg_rx_color, fg=self.right_text_color)
-        self.rightRadioStatus.pack(padx=10, pady=5, side=tkinter.RIGHT, expand=True, fill=tkinter.X)
-
         self.exitButton = tkinter.Button(self.tkroot, text="Quit", command=self.exit,
                                     font=buttonFont, relief="raised")
         self.exitButton.pack(padx=10, pady=5, side=tkinter.BOTTOM)
 
-        self.tkroot.after(self.poll_interval, self.status_handler)
+        # pin: (label widget, label text, RX background, TX background,
+        #       statistics label widget)
+        self.radios = {}
+        for ix, (pin, name) in enumerate(self.monitor.names.items()):
+            text_color, rx_color, tx_color = self.radio_colors[ix] \
+                if ix < len(self.radio_colors) else extra_radio_colors
+            frame = tkinter.Frame(self.tkroot)
+            frame.pack(padx=10, pady=5, side=tkinter.LEFT, expand=True, fill=tkinter.X)
+            status = tkinter.Label(frame, font=labelFont, fg=text_color)
+            status.pack(side=tkinter.TOP, expand=True, fill=tkinter.X)
+            stats = tkinter.Label(frame, font=statsFont, justify=tkinter.LEFT)
+            stats.pack(side=tkinter.TOP, expand=True, fill=tkinter.X)
+            self.radios[pin] = (status, name, rx_color, tx_color, stats)
+        self.shown_state = {}
+        self.shown_stats = {}
+        self.tx_start = {}
+        for pin, value in self.monitor.state.items():
+            self.show(pin, value)
+        self.monitor.subscribe(self.ptt_event)
 
-    def set_up_GPIO(self):
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setwarnings(False)
-        GPIO.setup(self.left_PTT_pin, GPIO.OUT)
-        GPIO.setup(self.right_PTT_pin, GPIO.OUT)
+        # The GPIO backend's thread writes to this pipe when it queues a
+        # transition, so Tk only wakes up when there is one
+        self.wake_r, self.wake_w = os.pipe()
+        os.set_blocking(self.wake_r, False)
+        os.set_blocking(self.wake_w, False)
+        self.tkroot.createfilehandler(self.wake_r, tkinter.READABLE,
+                                      self.status_handler)
+        self.monitor.wakeup = self.wakeup
+        self.update_stats()
 
     def exit(self):
+        self.tkroot.deletefilehandler(self.wake_r)
         self.tkroot.destroy()
-        GPIO.cleanup()
+        self.monitor.stop()
+
+    def wakeup(self):
+        # Called from the GPIO backend's thread
+        try:
+            os.write(self.wake_w, b'\0')
+        except OSError:
+            # The pipe is full, so Tk will wake up anyway, or closed
+            pass
 
     def mainloop(self):
         self.tkroot.mainloop()
 
-    def status_handler(self):
-        if GPIO.input(self.left_PTT_pin):
-            self.leftRadioStatus.configure(text="Left Radio\nTX", bg=self.left_bg_tx_color)
-        else:
-            self.leftRadioStatus.config(text="Left Radio\nRX", bg=self.left_bg_rx_color)
-        if GPIO.input(self.right_PTT_pin):
-            self.rightRadioStatus.configure(text="Right Radio\nTX", bg=self.right_bg_tx_color)
+    def ptt_event(self, event):
+        pin = event["pin"]
+        if event["state"] == "TX":
+            self.tx_start[pin] = time.monotonic()
+        elif event["state"] == "RX":
+            hold = self.tx_start.get(pin, 0) + self.min_tx_display - time.monotonic()
+            if hold > 0:
+                # show() keeps TX up until then
+                self.tkroot.after(int(hold * 1000) + 1,
+                                  lambda: self.show(pin, self.monitor.state[pin]))
+        self.show(pin, self.monitor.state[pin])
+
+    def show(self, pin, value):
+        # Redraw a radio's label only if its displayed state changes
+        if not value and time.monotonic() - self.tx_start.get(pin, 0) < self.min_tx_display:
+            # Short burst already over; keep TX up for min_tx_display
+            value = 1
+        if pin in self.monitor.stuck and value:
+            value = 'stuck'
+        if self.shown_state.get(pin) == value:
+            return
+        self.shown_state[pin] = value
+        label, text, rx_color, tx_color, _ = self.radios[pin]
+        if value == 'stuck':
+            label.configure(text=f"{text}\nSTUCK TX", bg=self.stuck_color)
+        elif value:
+            label.configure(text=f"{text}\nTX", bg=tx_color)
         else:
-            self.rightRadioStatus.config(text="Right Radio\nRX", bg=self.right_bg_rx_color)
-        self.tkroot.after(self.poll_interval, self.status_handler)
+            label.configure(text=f"{text}\nRX", bg=rx_color)
+
+    def update_stats(self):
+        # Stuck PTTs and a stopped monitor raise no transition
+        if not self.status_handler():
+            return
+        # Redraw the statistics
+        now = time.monotonic()
+        for pin, radio in self.radios.items():
+            summary = self.monitor.stats[pin].summary(now)
+            text = (f"{self.monitor.stats[pin].window // 60:.0f} min: "
+                    f"{summary.duty_cycle:.1%} TX, {summary.keyups} keyups\n"
+                    f"Longest TX: {summary.longest_tx:.1f} s")
+            if self.shown_stats.get(pin) != text:
+                self.shown_stats[pin] = text
+                radio[4].configure(text=text)
+        self.tkroot.after(self.stats_interval, self.update_stats)
+
+    def status_handler(self, *_):
+        """
+        Handles the queued PTT transitions.
+
+        :return: False if the monitor has stopped and the window is
+                 closed
+        """
+        try:
+            os.read(self.wake_r, 512)
+        except BlockingIOError:
+            pass
+        if not self.monitor.running:
+            self.tkroot.deletefilehandler(self.wake_r)
+            self.tkroot.destroy()
+            return False
+        self.monitor.process()
+        for pin, value in self.monitor.state.items():
+            self.show(pin, value)
+        return True
+
+
+def warn_stuck(event):
+    if event["state"] == "STUCK":
+        print(f"WARNING: {event['radio']} PTT stuck on for "
+              f"{event['duration']:.0f} seconds", file=sys.stderr)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(prog='radio-monitor.py',
@@ -113,13 +203,134 @@ if __name__ == '__main__':
     parser.add_argument("--right_bg_tx_color", choices=colors,
                         type=str, default="red",
                         help="Background color for right radio TX indicator")
+    parser.add_argument("--ptt_input", action='store_true',
+                        help="Configure the PTT GPIOs as inputs and use "
+                             "interrupt edge detection. Only use this if "
+                             "the PTT signals are wired to GPIOs that no "
+                             "other application drives")
+    parser.add_argument("--sample_interval", type=float,
+                        default=DEFAULT_SAMPLE_INTERVAL * 1000,
+                        help="PTT GPIO sampling interval in milliseconds "
+                             "when --ptt_input is not used. Shorter "
+                             "intervals show TX sooner and catch shorter "
+                             "keyups, at the cost of more CPU wakeups")
+    parser.add_argument("--gpiochip", type=str, nargs='?', const='',
+                        metavar="DEVICE",
+                        help="Read the GPIOs through GPIO character device "
+                             "DEVICE (the Raspberry Pi's GPIO controller if "
+                             "DEVICE is omitted), all of them with one "
+                             "read, instead of through RPi.GPIO. The PTT "
+                             "GPIOs must not be exported by other "
+                             "applications")
+    parser.add_argument("--fake_gpio", type=argparse.FileType('r'),
+                        metavar="FILE",
+                        help="Simulate the GPIOs, replaying 'delay pin "
+                             "value' lines from FILE. For testing "
+                             "without hardware")
+    parser.add_argument("--stats_window", type=float,
+                        default=DEFAULT_STATS_WINDOW / 60,
+                        help="Period in minutes over which TX time and "
+                             "keyups are totalled")
+    parser.add_argument("--stats_file", type=str, metavar="FILE",
+                        help="Append a CSV record (epoch time at keyup, "
+                             "radio, TX seconds) to FILE for every "
+                             "transmission")
+    parser.add_argument("--stuck_ptt", type=float, default=0,
+                        metavar="SECONDS",
+                        help="Show an alarm when a radio transmits "
+                             "continuously for more than SECONDS. 0 "
+                             "disables the alarm")
+    parser.add_argument("--radio", type=radio_spec, action='append',
+                        metavar="NAME=PIN",
+                        help="Monitor the radio NAME with its PTT on GPIO "
+                             "PIN (BCM numbering). Can be repeated. "
+                             "Replaces --left_gpio and --right_gpio. The "
+                             "first two radios use the left and right "
+                             "colors")
+    parser.add_argument("--headless", action='store_true',
+                        help="Run without a window. Implied when there is "
+                             "no $DISPLAY")
+    parser.add_argument("--json", action='store_true',
+                        help="Print each PTT transition to stdout as a "
+                             "line of JSON. Default when running headless "
+                             "without --json_socket")
+    parser.add_argument("--json_socket", type=str, metavar="PATH",
+                        help="Stream each PTT transition as a line of JSON "
+                             "to clients of Unix domain socket PATH")
+    parser.add_argument("--connect", type=str, nargs='?',
+                        const=GPIO_SUPERVISOR_SOCKET, metavar="PATH",
+                        help="Get the PTT states from gpio_supervisor.py "
+                             f"through its socket PATH ({GPIO_SUPERVISOR_SOCKET} "
+                             "if PATH is omitted) instead of reading the "
+                             "GPIOs. Monitors the supervisor's radios "
+                             "unless --radio is used")
     arg_info = parser.parse_args()
-    win = StatusWindow(left_PTT_pin=arg_info.left_gpio, 
-                       right_PTT_pin=arg_info.right_gpio,
-                       left_text_color=arg_info.left_text_color,
-                       left_bg_rx_color=arg_info.left_bg_rx_color,
-                       left_bg_tx_color=arg_info.left_bg_tx_color,
-                       right_text_color=arg_info.right_text_color,
-                       right_bg_rx_color=arg_info.right_bg_rx_color,
-                       right_bg_tx_color=arg_info.right_bg_tx_color)
+    if arg_info.connect:
+        try:
+            gpio = SocketGPIOBackend(arg_info.connect)
+        except OSError as e:
+            print(f"ERROR: Cannot connect to gpio_supervisor.py at "
+                  f"{arg_info.connect}: {e}", file=sys.stderr)
+            sys.exit(1)
+    elif arg_info.fake_gpio:
+        gpio = FakeGPIOBackend.from_file(arg_info.fake_gpio)
+    elif arg_info.gpiochip is not None:
+        try:
+            gpio = GpioChipBackend(
+                GpioChip(arg_info.gpiochip or None), input=arg_info.ptt_input,
+                sample_interval=arg_info.sample_interval / 1000)
+        except OSError as e:
+            print(f"ERROR: {e}", file=sys.stderr)
+            sys.exit(1)
+    else:
+        gpio = RPiGPIOBackend(input=arg_info.ptt_input,
+                              sample_interval=arg_info.sample_interval / 1000)
+    if arg_info.radio:
+        radios = arg_info.radio
+    elif arg_info.connect:
+        radios = gpio.radios
+    else:
+        radios = [("Left Radio", arg_info.left_gpio),
+                  ("Right Radio", arg_info.right_gpio)]
+    try:
+        monitor = PttMonitor(gpio, radios,
+                             stats_window=arg_info.stats_window * 60,
+                             stats_file=PttStatsFile(arg_info.stats_file)
+                             if arg_info.stats_file else None,
+                             stuck_ptt=arg_info.stuck_ptt)
+    except ValueError as e:
+        parser.error(str(e))
+    if arg_info.connect:
+        # Nothing left to monitor once the supervisor stops
+        gpio.on_close = monitor.stop
+    headless = arg_info.headless or os.environ.get('DISPLAY', '') == ''
+    if arg_info.json or (headless and not arg_info.json_socket):
+        monitor.subscribe(write_ndjson)
+    if arg_info.json_socket:
+        monitor.subscribe(NdjsonSocketPublisher(arg_info.json_socket))
+    monitor.subscribe(warn_stuck)
+    try:
+        monitor.start()
+    except OSError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        sys.exit(1)
+    if headless:
+        signal.signal(signal.SIGTERM, lambda *_: monitor.stop())
+        try:
+            monitor.run()
+        except KeyboardInterrupt:
+            monitor.stop()
+        sys.exit(0)
+
+    # Only load Tk when a window is wanted
+    import tkinter
+    import tkinter.font as tkfont
+    win = StatusWindow(monitor=monitor,
+                       radio_colors=[
+                           (arg_info.left_text_color,
+                            arg_info.left_bg_rx_color,
+                            arg_info.left_bg_tx_color),
+                           (arg_info.right_text_color,
+                            arg_info.right_bg_rx_color,
+                            arg_info.right_bg_tx_color)])
     win.mainloop()
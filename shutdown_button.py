@@ -1,49 +1,221 @@
-#!/usr/bin/python3                 
+#!/usr/bin/python3
 
-# Version 2.0.1
+# Version 3.0.1
 # Original script by Stewart C. Russell via https://github.com/scruss/shutdown_button
 # Modified by Steve Magnuson, AG7GN to control LED on different GPIO during Button
 # press.
-                                                                                                                                                                                
+
 # -*- coding: utf-8 -*-
-# example gpiozero code that could be used to have a reboot
-#  and a shutdown function on one GPIO button
+# gpiozero code that runs a reboot, a shutdown or a custom command depending
+# on how long one GPIO button is held down.
 # scruss - 2017-10
+#
+# How long the button was held is measured from the press and release
+# edges. The LED toggles each time the button has been held long enough
+# to arm the next action: on at the reboot threshold, off at the poweroff
+# threshold, and so on for any custom actions.
+
+import argparse
+import shlex
+import subprocess
+import threading
+import time
 
 use_button=26     # Button on use_button (BCM GPIO 26 by default)
+use_led=24        # LED on BCM GPIO 24 by default
+reboot_after=2.0
+poweroff_after=5.0
+
+
+class ButtonStateMachine(object):
+    """
+    Turns button press and release edges into actions. thresholds is a
+    list of (seconds, command) tuples. When the button is released,
+    the command of the longest threshold the hold time reached (held
+    >= seconds) is run. A hold shorter than every threshold does
+    nothing.
+
+    While the button is held, a single timer is armed for the next
+    threshold only. When it fires, the LED is toggled so the user
+    knows which action a release would run. timer is called like
+    threading.Timer to make it.
+    """
+
+    def __init__(self, thresholds, led=None, clock=time.monotonic,
+                 run=subprocess.call, timer=threading.Timer):
+        self.thresholds = sorted(thresholds, key=lambda t: t[0])
+        self.led = led
+        self.clock = clock
+        self.run = run
+        self.timer = timer
+        self.pressed_at = None
+        self.level = 0
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def pressed(self, timestamp: float = None):
+        """
+        Call on the press edge.
+
+        :param timestamp: clock() value of the edge, defaults to now
+        :return: None
+        """
+        with self._lock:
+            self.pressed_at = self.clock() if timestamp is None \
+                else timestamp
+            self.level = 0
+            self._set_led(False)
+            self._arm()
+
+    def _arm(self):
+        # Start the timer for the next threshold, if there is one
+        self._cancel()
+        if self.level < len(self.thresholds):
+            delay = self.thresholds[self.level][0] - \
+                (self.clock() - self.pressed_at)
+            self._timer = self.timer(max(0.0, delay),
+                                     self._threshold_reached)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _cancel(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _threshold_reached(self):
+        with self._lock:
+            if self.pressed_at is None:
+                return
+            self.level += 1
+            self._set_led(self.level % 2 == 1)
+            self._arm()
+
+    def _set_led(self, on: bool):
+        if self.led is not None:
+            if on:
+                self.led.on()
+            else:
+                self.led.off()
+
+    def action_for(self, held: float):
+        """
+        :param held: Seconds the button was held
+        :return: Command for that hold time, None if no threshold was
+                 reached
+        """
+        command = None
+        for seconds, threshold_command in self.thresholds:
+            if held >= seconds:
+                command = threshold_command
+        return command
+
+    def released(self, timestamp: float = None):
+        """
+        Call on the release edge. Runs the selected command, if any,
+        and resets the state machine for the next press.
+
+        :param timestamp: clock() value of the edge, defaults to now
+        :return: Command that was run, or None
+        """
+        with self._lock:
+            if self.pressed_at is None:
+                return None
+            held = (self.clock() if timestamp is None else timestamp) - \
+                self.pressed_at
+            self._cancel()
+            self.pressed_at = None
+            self.level = 0
+            self._set_led(False)
+        command = self.action_for(held)
+        if command:
+            self.run(command)
+        return command
+
+
+def attach(button, machine: ButtonStateMachine):
+    """
+    Feeds a ButtonStateMachine from a gpiozero Button's edges.
+    gpiozero calls back from its own thread, which can run well after
+    the edge on a busy Pi, so the time of each edge is worked back from
+    how long the button has been in its new state. That is counted
+    from when the pin driver saw the edge.
+
+    :param button: gpiozero Button
+    :param machine: ButtonStateMachine
+    :return: None
+    """
+    def _edge_time(since) -> float:
+        return machine.clock() - (since or 0.0)
+
+    button.when_pressed = \
+        lambda: machine.pressed(_edge_time(button.active_time))
+    button.when_released = \
+        lambda: machine.released(_edge_time(button.inactive_time))
+
+
+def threshold_spec(spec):
+    """
+    argparse type for --action SECONDS:COMMAND
+
+    :param spec: 'SECONDS:COMMAND' string
+    :return: (SECONDS, COMMAND as an argument list) tuple
+    """
+    seconds, sep, command = spec.partition(':')
+    try:
+        threshold = float(seconds), shlex.split(command)
+    except ValueError:
+        threshold = None
+    if not threshold or not threshold[1]:
+        raise argparse.ArgumentTypeError(f"'{spec}' is not SECONDS:COMMAND")
+    return threshold
+
+
+def thresholds_from_args(arg_info):
+    """
+    :param arg_info: Parsed command line arguments
+    :return: List of (seconds, command) tuples
+    """
+    thresholds = list(arg_info.action or [])
+    if arg_info.reboot > 0:
+        thresholds.append((arg_info.reboot, ['/sbin/reboot']))
+    if arg_info.poweroff > 0:
+        thresholds.append((arg_info.poweroff, ['/sbin/poweroff']))
+    return thresholds
+
+
+def add_arguments(parser):
+    parser.add_argument("--button", type=int, default=use_button,
+                        help="Button GPIO (BCM numbering)")
+    parser.add_argument("--led", type=int, default=use_led,
+                        help="LED GPIO (BCM numbering)")
+    parser.add_argument("--reboot", type=float, default=reboot_after,
+                        metavar="SECONDS",
+                        help="Reboot when the button is held at least "
+                             "SECONDS. 0 disables reboot")
+    parser.add_argument("--poweroff", type=float, default=poweroff_after,
+                        metavar="SECONDS",
+                        help="Power off when the button is held at least "
+                             "SECONDS. 0 disables power off")
+    parser.add_argument("--action", type=threshold_spec, action='append',
+                        metavar="SECONDS:COMMAND",
+                        help="Run COMMAND when the button is held at least "
+                             "SECONDS. Can be repeated")
+
+
+if __name__ == "__main__":
+    from gpiozero import Button
+    from gpiozero import LED
+    from signal import pause
+    parser = argparse.ArgumentParser(
+        prog='shutdown_button.py',
+        description="Reboot, power off or run a command from a GPIO button",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    add_arguments(parser)
+    arg_info = parser.parse_args()
+    led=LED(arg_info.led)
+    machine = ButtonStateMachine(thresholds_from_args(arg_info), led)
+    button=Button(arg_info.button)
+    attach(button, machine)
 
-from gpiozero import Button
-from gpiozero import LED
-from signal import pause
-from subprocess import check_call
-
-held_for=0.0
-led=LED(24)			# LED on BCM GPIO 24
-
-def rls():
-        global held_for
-        if (held_for > 5.0):
-                check_call(['/sbin/poweroff'])
-        elif (held_for > 2.0):
-                check_call(['/sbin/reboot'])
-        else:
-        	held_for = 0.0
-
-def hld():
-        # callback for when button is held
-        #  is called every hold_time seconds
-        global held_for
-        # need to use max() as held_time resets to zero on last callback
-        held_for = max(held_for, button.held_time + button.hold_time)
-        if (held_for > 5.0):
-            led.off()
-        elif (held_for > 2.0):
-            led.on()
-        else:
-            led.off()
-
-button=Button(use_button, hold_time=1.0, hold_repeat=True)
-button.when_held = hld
-button.when_released = rls
-
-pause() # wait forever
+    pause() # wait forever
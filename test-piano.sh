@@ -1,6 +1,6 @@
 #!/bin/bash
 
-VERSION="1.1.1"
+VERSION="1.2.1"
 
 # This script checks the status of 4 GPIO pins and runs a script corresponding
 # to those settings as described below.  This script is called by initialize-pi.sh,
@@ -0,0 +1,101 @@
+# fsq_search.py's message framing and audit log following, on audit
+# logs written to a temporary directory. Run with
+# 'python3 -m pytest tests'.
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fsq_search
+
+MESSAGE = b"\x01<SOH>ag7gn:12w7ecg QSL 73<BS>\n"
+ARROW = b"\x01<SOH>w7ecg:34allcall check in > net control<BS>\n"
+
+
+def test_framer_messages():
+    framer = fsq_search.FsqFramer()
+    assert framer.feed(MESSAGE + b"<BS> ~~ noise \x7f\x80 <SOH> garbled\n" +
+                       MESSAGE) == ["ag7gn:12w7ecg QSL 73<BS"] * 2
+
+
+def test_framer_message_with_arrow():
+    framer = fsq_search.FsqFramer()
+    assert framer.feed(ARROW) == \
+        ["w7ecg:34allcall check in > net control<BS"]
+    assert framer.resume_offset == len(ARROW) - 1
+
+
+def test_framer_partial_message_across_feeds():
+    framer = fsq_search.FsqFramer()
+    data = MESSAGE + ARROW
+    cut = len(MESSAGE) + ARROW.index(b"check")
+    start = len(MESSAGE) + ARROW.index(b"w7ecg")
+    assert framer.feed(data[:cut]) == ["ag7gn:12w7ecg QSL 73<BS"]
+    assert framer.resume_offset == start
+    # Past the '>' in the second message, which is held back until its
+    # end arrives. A restart must go back to its start.
+    assert framer.feed(data[cut:cut + 18]) == []
+    assert framer.offset > start
+    assert framer.resume_offset == start
+    assert framer.feed(data[cut + 18:]) == \
+        ["w7ecg:34allcall check in > net control<BS"]
+    assert framer.resume_offset == len(data) - 1
+
+
+def test_framer_overflow():
+    framer = fsq_search.FsqFramer()
+    framer.max_message = 40
+    start = b"\x01<SOH>ag7gn:12w7ecg long "
+    assert framer.feed(start + b"> more " * 10 + b"end<BS>\n") == []
+    assert framer.resume_offset == framer.offset
+    # Messages after it are found again
+    assert framer.feed(MESSAGE) == ["ag7gn:12w7ecg QSL 73<BS"]
+
+
+def _append(_path, _data: bytes):
+    with open(_path, 'ab') as f:
+        f.write(_data)
+
+
+def test_follower_starts_at_end(tmp_path):
+    _path = str(tmp_path / fsq_search.FSQ_AUDIT_FILE)
+    _append(_path, MESSAGE)
+    follower = fsq_search.AuditLogFollower(_path)
+    assert follower.poll() == []
+    _append(_path, MESSAGE)
+    assert follower.poll() == ["ag7gn:12w7ecg QSL 73<BS"]
+    follower.close()
+
+
+def test_follower_file_replaced(tmp_path):
+    _path = str(tmp_path / fsq_search.FSQ_AUDIT_FILE)
+    _append(_path, b"")
+    follower = fsq_search.AuditLogFollower(_path)
+    assert follower.poll() == []
+    # Fldigi writes the end of a message, then restarts and starts a
+    # new log
+    _append(_path, ARROW[:30])
+    assert follower.poll() == []
+    _append(_path, ARROW[30:])
+    new = str(tmp_path / "new")
+    _append(new, MESSAGE)
+    os.replace(new, _path)
+    assert follower.poll() == ["w7ecg:34allcall check in > net control<BS",
+                               "ag7gn:12w7ecg QSL 73<BS"]
+    st = os.stat(_path)
+    assert follower.checkpoint() == [st.st_dev, st.st_ino, len(MESSAGE) - 1]
+    follower.close()
+
+
+def test_follower_resumes_from_checkpoint(tmp_path):
+    _path = str(tmp_path / fsq_search.FSQ_AUDIT_FILE)
+    _append(_path, MESSAGE + ARROW[:30])
+    follower = fsq_search.AuditLogFollower(_path, from_start=True)
+    assert follower.poll() == ["ag7gn:12w7ecg QSL 73<BS"]
+    checkpoint = follower.checkpoint()
+    follower.close()
+    _append(_path, ARROW[30:])
+    follower = fsq_search.AuditLogFollower(_path, checkpoint)
+    assert follower.poll() == ["w7ecg:34allcall check in > net control<BS"]
+    follower.close()
@@ -0,0 +1,107 @@
+# log_trim.py's binary search for the first record to keep and the
+# trimming of the FSQ logs, on small logs in a temporary directory.
+# Run with 'python3 -m pytest tests'.
+
+import calendar
+import mmap
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import log_trim
+
+SEPARATOR = log_trim.SEPARATOR.decode()
+HEARD = [f"2020010{day}, 120000, AG7GN, 1 HEARD\n" for day in (1, 2, 3)]
+AUDIT = [f"{SEPARATOR}Audit log: 2020010{day}, 120000\n{SEPARATOR}"
+         f"AG7GN: QSL {day}\n" for day in (1, 2, 3)]
+
+
+def _epoch(day: int, hour: int = 0) -> float:
+    return calendar.timegm((2020, 1, day, hour, 0, 0))
+
+
+def _write(tmp_path, text: str) -> str:
+    _path = str(tmp_path / 'fsq_log.txt')
+    with open(_path, 'w') as f:
+        f.write(text)
+    return _path
+
+
+def _find_cutoff(log, _path, cutoff) -> int:
+    with open(_path, 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return log.find_cutoff(mm, cutoff)
+
+
+@pytest.mark.parametrize('cutoff, kept', [
+    (_epoch(1), 0),         # The first record is newer
+    (_epoch(1, 12), 1),     # Exactly as old as the first record
+    (_epoch(2, 18), 2),     # Only the last record is newer
+    (_epoch(3, 18), 3),     # None is newer
+])
+def test_heard_find_cutoff(tmp_path, cutoff, kept):
+    header = f"{SEPARATOR}Heard log: 20191231, 000000\n{SEPARATOR}"
+    _path = _write(tmp_path, header + ''.join(HEARD))
+    offset = _find_cutoff(log_trim.FsqHeardLog(), _path, cutoff)
+    assert offset == len(header) + len(''.join(HEARD[:kept]))
+
+
+def test_audit_find_cutoff_lines_between_records(tmp_path):
+    _path = _write(tmp_path, ''.join(AUDIT))
+    log = log_trim.FsqAuditLog()
+    # The session, not the separator above it, is where the cut goes
+    assert _find_cutoff(log, _path, _epoch(1)) == len(SEPARATOR)
+    assert _find_cutoff(log, _path, _epoch(2, 18)) == \
+        len(''.join(AUDIT[:2])) + len(SEPARATOR)
+
+
+def test_trim_nothing_older(tmp_path):
+    text = ''.join(AUDIT)
+    _path = _write(tmp_path, text)
+    assert log_trim.FsqAuditLog().trim(_path, _epoch(1)) == 0
+    with open(_path) as f:
+        assert f.read() == text
+
+
+def test_trim_keeps_last_record(tmp_path):
+    _path = _write(tmp_path, ''.join(AUDIT))
+    log = log_trim.FsqAuditLog()
+    reclaimed = log.trim(_path, _epoch(2, 18), dry_run=True)
+    assert reclaimed == len(''.join(AUDIT[:2]))
+    assert log.trim(_path, _epoch(2, 18)) == reclaimed
+    with open(_path) as f:
+        assert f.read() == AUDIT[2]
+    assert os.stat(_path).st_mode & 0o777 == 0o644
+
+
+def test_trim_heard_without_header(tmp_path):
+    _path = _write(tmp_path, ''.join(HEARD))
+    log_trim.FsqHeardLog().trim(_path, _epoch(1, 18))
+    with open(_path) as f:
+        assert f.read() == f"{SEPARATOR}Heard log: 20200101, 180000\n" \
+                           f"{SEPARATOR}" + ''.join(HEARD[1:])
+
+
+def test_trim_heard_drops_old_headers(tmp_path):
+    header = f"{SEPARATOR}Heard log: 20191231, 000000\n{SEPARATOR}"
+    _path = _write(tmp_path, header + HEARD[0] + header + ''.join(HEARD[1:]))
+    log_trim.FsqHeardLog().trim(_path, _epoch(1, 18))
+    with open(_path) as f:
+        assert f.read() == f"{SEPARATOR}Heard log: 20200101, 180000\n" \
+                           f"{SEPARATOR}" + ''.join(HEARD[1:])
+
+
+def test_trim_audit_without_header(tmp_path):
+    # Nothing in it can be dated, so nothing is kept
+    _path = _write(tmp_path, "AG7GN: QSL\n")
+    log_trim.FsqAuditLog().trim(_path, _epoch(1))
+    with open(_path) as f:
+        assert f.read() == SEPARATOR
+
+
+def test_trim_empty_log(tmp_path):
+    _path = _write(tmp_path, '')
+    assert log_trim.FsqAuditLog().trim(_path, _epoch(1)) == 0
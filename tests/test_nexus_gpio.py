@@ -0,0 +1,138 @@
+# nexus_gpio's GPIO character device backend, run on MockGpioChip so
+# no Pi is needed. Run with 'python3 -m pytest tests'.
+
+import errno
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import nexus_gpio
+
+# The piano switches, which check-piano.sh reads in one go
+PIANO = [25, 13, 6, 5]
+BUTTON = 24
+LED = 23
+
+
+def test_lines_read_in_bulk():
+    chip = nexus_gpio.MockGpioChip({25: 1, 6: 1})
+    lines = chip.request(PIANO, inputs=PIANO)
+    assert lines.read() == 0b0101
+    assert lines.values() == {25: 1, 13: 0, 6: 1, 5: 0}
+    assert lines.values(0b1010) == {25: 0, 13: 1, 6: 0, 5: 1}
+    assert lines.mask([13, 5]) == 0b1010
+
+
+def test_lines_pins_checked():
+    chip = nexus_gpio.MockGpioChip()
+    with pytest.raises(ValueError):
+        chip.request([5, 5])
+    with pytest.raises(ValueError):
+        chip.request([])
+    with pytest.raises(OSError) as e:
+        chip.request([60])
+    assert e.value.errno == errno.EINVAL
+
+
+def test_lines_requested_once():
+    chip = nexus_gpio.MockGpioChip()
+    lines = chip.request(PIANO, inputs=PIANO)
+    with pytest.raises(OSError) as e:
+        chip.request([6, BUTTON])
+    assert e.value.errno == errno.EBUSY
+    lines.close()
+    chip.request([6, BUTTON]).close()
+
+
+def test_lines_write_outputs_only():
+    chip = nexus_gpio.MockGpioChip()
+    lines = chip.request([BUTTON, LED], pull_ups=[BUTTON], outputs={LED: 0})
+    assert lines.values() == {BUTTON: 1, LED: 0}
+    lines.write({LED: 1})
+    assert chip.values[LED] == 1
+    with pytest.raises(OSError):
+        lines.write({BUTTON: 0})
+
+
+def test_lines_wait():
+    chip = nexus_gpio.MockGpioChip()
+    lines = chip.request([BUTTON], inputs=[BUTTON])
+    assert lines.wait(0, 0.01) == 0
+    threading.Timer(0.01, chip.set, (BUTTON, 1)).start()
+    assert lines.wait(0, 2) == 1
+
+
+def _backend(**values):
+    chip = nexus_gpio.MockGpioChip(values)
+    gpio = nexus_gpio.GpioChipBackend(chip)
+    gpio.setup([BUTTON], input=True, pull_up=True)
+    gpio.setup(PIANO, input=True)
+    return chip, gpio
+
+
+def test_backend_read_all():
+    chip, gpio = _backend()
+    chip.set(13, 1)
+    assert gpio.read_all() == {BUTTON: 1, 25: 0, 13: 1, 6: 0, 5: 0}
+    assert gpio.read(13) == 1
+    gpio.cleanup()
+
+
+def test_backend_reads_while_watcher_waits():
+    chip, gpio = _backend()
+    gpio.write(LED, 0)
+    changes = []
+    gpio.watch([BUTTON], lambda *args: changes.append(args[:2]))
+    # Let the watcher start waiting on the lines
+    time.sleep(0.02)
+    slowest = 0
+    for n in range(20):
+        start = time.monotonic()
+        gpio.read_all()
+        gpio.write(LED, n % 2)
+        slowest = max(slowest, time.monotonic() - start)
+    # Without the lock held by the watcher these never wait for it
+    assert slowest < nexus_gpio.EDGE_WAIT_INTERVAL / 2
+    assert chip.values[LED] == 1
+    chip.set(BUTTON, 0)
+    deadline = time.monotonic() + 2
+    while not changes and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert changes == [(BUTTON, 0)]
+    gpio.cleanup()
+
+
+def test_backend_setup_while_watching():
+    chip, gpio = _backend()
+    changes = []
+    gpio.watch([BUTTON, 17], lambda *args: changes.append(args[:2]))
+    time.sleep(0.02)
+    # The pins are requested again with 17 added
+    gpio.setup([17], input=True)
+    assert 17 in chip.requested
+    chip.set(17, 1)
+    deadline = time.monotonic() + 2
+    while not changes and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert changes == [(17, 1)]
+    gpio.cleanup()
+
+
+def test_backend_cleanup():
+    chip, gpio = _backend()
+    gpio.watch([BUTTON], lambda *_: None)
+    thread = gpio._thread
+    time.sleep(0.02)
+    start = time.monotonic()
+    gpio.cleanup()
+    assert time.monotonic() - start < nexus_gpio.EDGE_WAIT_INTERVAL * 2
+    thread.join(nexus_gpio.EDGE_WAIT_INTERVAL * 2)
+    assert not thread.is_alive()
+    assert not chip.requested
+    # The pins can be requested again
+    chip.request(PIANO + [BUTTON]).close()
@@ -0,0 +1,204 @@
+# PTT transitions from the GPIO backends through ptt_monitor.PttMonitor,
+# using nexus_gpio's FakeGPIOBackend and MockRPiGPIO, so no Pi is
+# needed, and the airtime accounting in PttStats. Run with
+# 'python3 -m pytest tests'.
+
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import nexus_gpio
+import ptt_monitor
+
+PTT = 12
+# A short packet keyup
+KEYUP = 0.02
+
+
+class Events(object):
+    """
+    PttMonitor subscriber that keeps the events, fed by a thread that
+    only calls process() when the monitor's wakeup says there is
+    something queued.
+    """
+
+    def __init__(self, monitor):
+        self.events = []
+        self.wakeups = 0
+        self._woken = threading.Event()
+        monitor.wakeup = self._wakeup
+        monitor.subscribe(self.events.append)
+        self.monitor = monitor
+
+    def _wakeup(self):
+        self.wakeups += 1
+        self._woken.set()
+
+    def wait(self, count: int, timeout: float = 2.0) -> list:
+        deadline = time.monotonic() + timeout
+        while len(self.events) < count and time.monotonic() < deadline:
+            if self._woken.wait(deadline - time.monotonic()):
+                self._woken.clear()
+                self.monitor.process()
+        return [e["state"] for e in self.events]
+
+
+def _monitor(gpio):
+    monitor = ptt_monitor.PttMonitor(gpio, [("Left", PTT)])
+    events = Events(monitor)
+    monitor.start()
+    return monitor, events
+
+
+def test_fake_backend_short_keyup():
+    gpio = nexus_gpio.FakeGPIOBackend([(0.01, PTT, 1), (KEYUP, PTT, 0)])
+    monitor, events = _monitor(gpio)
+    assert events.wait(2) == ["TX", "RX"]
+    assert events.events[1]["duration"] == pytest.approx(KEYUP, abs=0.015)
+    assert events.wakeups == 2
+    monitor.stop()
+
+
+def test_rpi_gpio_input_short_keyup():
+    mock = nexus_gpio.MockRPiGPIO()
+    gpio = nexus_gpio.RPiGPIOBackend(input=True, GPIO=mock)
+    monitor, events = _monitor(gpio)
+    mock.set(PTT, 1)
+    time.sleep(KEYUP)
+    mock.set(PTT, 0)
+    assert events.wait(2) == ["TX", "RX"]
+    assert monitor.state[PTT] == 0
+    monitor.stop()
+
+
+def test_rpi_gpio_keyup_over_before_callback():
+    # Both edges arrive before RPi.GPIO's thread runs the callback,
+    # which then reads the pin back at RX
+    mock = nexus_gpio.MockRPiGPIO()
+    gpio = nexus_gpio.RPiGPIOBackend(input=True, GPIO=mock)
+    monitor, events = _monitor(gpio)
+    with mock._changed:
+        mock.set(PTT, 1)
+        mock.set(PTT, 0)
+    assert events.wait(2) == ["TX", "RX"]
+    time.sleep(0.05)
+    assert events.wait(3, timeout=0.05) == ["TX", "RX"]
+    monitor.stop()
+
+
+def test_rpi_gpio_outputs_are_sampled():
+    mock = nexus_gpio.MockRPiGPIO()
+    gpio = nexus_gpio.RPiGPIOBackend(sample_interval=0.005, GPIO=mock)
+    monitor, events = _monitor(gpio)
+    # The kernel has no edge detection for a pin driven as an output
+    assert PTT not in mock.callbacks
+    mock.output(PTT, 1)
+    assert events.wait(1) == ["TX"]
+    mock.output(PTT, 0)
+    assert events.wait(2) == ["TX", "RX"]
+    monitor.stop()
+
+
+HOUR = ptt_monitor.DEFAULT_STATS_WINDOW
+
+
+def _tx(stats, start, duration):
+    stats.transition(1, start)
+    return stats.transition(0, start + duration)
+
+
+def test_stats_hour_rollover():
+    stats = ptt_monitor.PttStats()
+    assert _tx(stats, 100, 10) == 10
+    _tx(stats, 1000, 30)
+    summary = stats.summary(now=1100)
+    assert summary.airtime == 40
+    assert summary.keyups == 2
+    assert summary.longest_tx == 30
+    assert summary.duty_cycle == pytest.approx(40 / HOUR)
+    # An hour later the window starts halfway through the first TX
+    summary = stats.summary(now=HOUR + 105)
+    assert summary.airtime == 35
+    assert summary.keyups == 2
+    # and then the first one has left it
+    summary = stats.summary(now=HOUR + 110)
+    assert summary.airtime == 30
+    assert summary.keyups == 1
+    assert summary.longest_tx == 30
+    # and the second one
+    summary = stats.summary(now=HOUR + 1030)
+    assert summary == ptt_monitor.PttSummary(0, 0, 0, 0, 0)
+
+
+def test_stats_ring_wraparound():
+    stats = ptt_monitor.PttStats(window=1000, ring_size=4)
+    durations = [5, 1, 4, 2, 3, 1]
+    for n, duration in enumerate(durations):
+        _tx(stats, n * 10, duration)
+    # Only the last 4 fit, so the oldest 2 were dropped early
+    summary = stats.summary(now=100)
+    assert summary.keyups == 4
+    assert summary.airtime == sum(durations[2:])
+    assert summary.longest_tx == 4
+    for n in range(6, 12):
+        _tx(stats, n * 10, 0.5)
+    summary = stats.summary(now=200)
+    assert summary.keyups == 4
+    assert summary.airtime == 2
+    assert summary.longest_tx == 0.5
+
+
+def test_stats_stuck_ptt_longer_than_window():
+    stats = ptt_monitor.PttStats(window=60)
+    _tx(stats, 0, 5)
+    stats.transition(1, 10)
+    # Keying up again while transmitting changes nothing
+    stats.transition(1, 20)
+    summary = stats.summary(now=40)
+    assert summary.current_tx == 30
+    assert summary.airtime == 35
+    assert summary.keyups == 2
+    summary = stats.summary(now=200)
+    # Only the window is counted, however long the TX has lasted
+    assert summary.airtime == 60
+    assert summary.duty_cycle == 1
+    assert summary.keyups == 1
+    assert summary.longest_tx == summary.current_tx == 190
+    assert stats.transition(0, 200) == 190
+    summary = stats.summary(now=200)
+    assert summary.airtime == 60
+    assert summary.current_tx == 0
+
+
+def test_monitor_stuck_once():
+    gpio = nexus_gpio.FakeGPIOBackend([(0.01, PTT, 1)])
+    monitor = ptt_monitor.PttMonitor(gpio, [("Left", PTT)], stuck_ptt=0.05)
+    events = Events(monitor)
+    monitor.start()
+    assert events.wait(1) == ["TX"]
+    time.sleep(0.06)
+    monitor._next_stuck_check = 0
+    monitor.process()
+    time.sleep(0.01)
+    monitor._next_stuck_check = 0
+    monitor.process()
+    assert [e["state"] for e in events.events] == ["TX", "STUCK"]
+    gpio.set(PTT, 0)
+    assert events.wait(3) == ["TX", "STUCK", "RX"]
+    monitor.stop()
+
+
+def test_stats_file(tmp_path):
+    _path = tmp_path / "ptt.csv"
+    stats_file = ptt_monitor.PttStatsFile(str(_path))
+    start = time.monotonic() - 2
+    stats_file.write("Left Radio", start, 1.5)
+    stats_file.close()
+    epoch, radio, duration = _path.read_text().strip().split(',')
+    assert float(epoch) == pytest.approx(time.time() - 2, abs=0.5)
+    assert (radio, duration) == ("Left Radio", "1.500")
@@ -0,0 +1,149 @@
+# Hold-time boundaries of shutdown_button.py's ButtonStateMachine,
+# driven through gpiozero Button and LED objects on MockFactory pins.
+# The clock and the threshold timers are fakes, so the tests take no
+# real time. Run with 'python3 -m pytest tests'.
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+gpiozero = pytest.importorskip("gpiozero")
+from gpiozero.pins.mock import MockFactory
+
+import shutdown_button
+
+BUTTON = 26
+LED = 24
+REBOOT = ['/sbin/reboot']
+POWEROFF = ['/sbin/poweroff']
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeTimer(object):
+    """
+    Stands in for threading.Timer. Pending timers are only run by
+    fire().
+    """
+
+    pending = []
+
+    def __init__(self, interval: float, function):
+        self.interval = interval
+        self.function = function
+        self.daemon = False
+
+    def start(self):
+        FakeTimer.pending.append(self)
+
+    def cancel(self):
+        if self in FakeTimer.pending:
+            FakeTimer.pending.remove(self)
+
+    @classmethod
+    def fire(cls) -> float:
+        """
+        Runs the one pending timer.
+
+        :return: Its interval
+        """
+        assert len(cls.pending) == 1
+        timer = cls.pending.pop()
+        timer.function()
+        return timer.interval
+
+
+@pytest.fixture
+def rig(monkeypatch):
+    FakeTimer.pending = []
+    clock = FakeClock()
+    # The mock pins timestamp their edges with the same clock
+    monkeypatch.setattr(gpiozero.pins.mock, 'monotonic', clock)
+    gpiozero.Device.pin_factory = MockFactory()
+    ran = []
+    led = gpiozero.LED(LED)
+    machine = shutdown_button.ButtonStateMachine(
+        [(2.0, REBOOT), (5.0, POWEROFF)], led, clock=clock, run=ran.append,
+        timer=FakeTimer)
+    button = gpiozero.Button(BUTTON)
+    shutdown_button.attach(button, machine)
+    yield button, led, clock, ran
+    button.close()
+    led.close()
+    gpiozero.Device.pin_factory.reset()
+
+
+def hold(button, clock, seconds: float):
+    button.pin.drive_low()
+    clock.now += seconds
+    button.pin.drive_high()
+
+
+@pytest.mark.parametrize("seconds, command", [
+    (0.5, None),
+    (1.999, None),
+    (2.0, REBOOT),
+    (4.999, REBOOT),
+    (5.0, POWEROFF),
+    (30.0, POWEROFF),
+])
+def test_hold_boundaries(rig, seconds, command):
+    button, led, clock, ran = rig
+    hold(button, clock, seconds)
+    assert ran == ([command] if command else [])
+    assert not led.is_lit
+    assert FakeTimer.pending == []
+
+
+def test_led_shows_the_armed_action(rig):
+    button, led, clock, ran = rig
+    button.pin.drive_low()
+    assert not led.is_lit
+    clock.now += FakeTimer.fire()
+    assert led.is_lit
+    # The next timer covers the rest of the way to the poweroff hold
+    clock.now += FakeTimer.fire()
+    assert not led.is_lit
+    assert FakeTimer.pending == []
+    button.pin.drive_high()
+    assert ran == [POWEROFF]
+
+
+def test_state_is_reset_between_presses(rig):
+    button, led, clock, ran = rig
+    hold(button, clock, 4.0)
+    hold(button, clock, 1.0)
+    hold(button, clock, 6.0)
+    assert ran == [REBOOT, POWEROFF]
+
+
+def test_release_without_press_does_nothing(rig):
+    button, led, clock, ran = rig
+    button.pin.drive_high()
+    assert ran == []
+
+
+def test_hold_measured_from_edges(rig):
+    button, led, clock, ran = rig
+    fire = button._fire_deactivated
+
+    def late():
+        # gpiozero's thread only gets to the release 0.3 s after the
+        # edge
+        clock.now += 0.3
+        fire()
+
+    button._fire_deactivated = late
+    hold(button, clock, 1.9)
+    assert ran == []
+    hold(button, clock, 4.8)
+    assert ran == [REBOOT]
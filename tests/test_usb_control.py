@@ -0,0 +1,146 @@
+# usb_control.py falling back to scanning sysfs itself when
+# usb_controld.py is gone or answers with garbage. Uses a small copy of
+# the sysfs tree in a temporary directory. Run with
+# 'python3 -m pytest tests'.
+
+import os
+import socket
+import subprocess
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import usb_control
+
+DEVICE = ('0d8c:013c', 'C-Media PCM2902 Audio', '1-1.1', 'Enabled')
+
+
+@pytest.fixture
+def sysfs(tmp_path, monkeypatch):
+    monkeypatch.setattr(usb_control, 'USB_IDS_FILES', ())
+    device = tmp_path / 'devices' / '1-1.1'
+    device.mkdir(parents=True)
+    for attr, value in (('busnum', '1'), ('devnum', '3'),
+                        ('idVendor', '0d8c'), ('idProduct', '013c'),
+                        ('manufacturer', 'C-Media'),
+                        ('product', 'PCM2902 Audio'),
+                        ('bDeviceClass', '00')):
+        (device / attr).write_text(value + '\n')
+    driver = tmp_path / 'drivers' / 'usb'
+    driver.mkdir(parents=True)
+    (driver / '1-1.1').symlink_to(device)
+    (driver / 'bind').write_text('')
+    (driver / 'unbind').write_text('')
+    return str(tmp_path)
+
+
+def _daemon(tmp_path, reply: bytes = b''):
+    """
+    Listens on a Unix socket like usb_controld.py, but sends reply to
+    the first request (nothing at all by default) and hangs up.
+
+    :return: UsbControlClient connected to it
+    """
+    _path = str(tmp_path / 'usb_controld.sock')
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(_path)
+    server.listen(1)
+
+    def _serve():
+        conn, _ = server.accept()
+        if reply:
+            conn.recv(4096)
+            conn.sendall(reply)
+        conn.close()
+        server.close()
+
+    threading.Thread(target=_serve, daemon=True).start()
+    return usb_control.UsbControlClient(_path)
+
+
+def test_list_without_daemon(sysfs):
+    assert usb_control.list_usb_devices(None, sysfs) == ([DEVICE], None)
+
+
+def test_list_daemon_closes_connection(sysfs, tmp_path, capsys):
+    client = _daemon(tmp_path)
+    devices, lost = usb_control.list_usb_devices(client, sysfs)
+    assert devices == [DEVICE]
+    assert isinstance(lost, ConnectionError)
+    assert 'WARNING: usb_controld.py unavailable' in capsys.readouterr().err
+
+
+@pytest.mark.parametrize('reply', [b'not json\n', b'[1, 2]\n',
+                                   b'{"devices": [["0d8c:013c"]]}\n'])
+def test_list_daemon_bad_reply(sysfs, tmp_path, reply):
+    client = _daemon(tmp_path, reply)
+    devices, lost = usb_control.list_usb_devices(client, sysfs)
+    assert devices == [DEVICE]
+    assert isinstance(lost, ValueError)
+
+
+def test_list_daemon_updates_inventory(sysfs, tmp_path):
+    client = _daemon(tmp_path, b'{"devices": [["0d8c:013c", '
+                               b'"C-Media PCM2902 Audio", "1-1.1", '
+                               b'"Enabled"]], "serials": {}}\n')
+    inventory = usb_control.UsbInventory(str(tmp_path / 'inventory.json'))
+    assert usb_control.list_usb_devices(client, sysfs, inventory) == \
+        ([DEVICE], None)
+    assert '1-1.1' in inventory.ports
+
+
+def test_set_state_daemon_closes_connection(sysfs, tmp_path):
+    client = _daemon(tmp_path)
+    ok, lost = usb_control.change_usb_devices_state([(DEVICE, 'unbind')],
+                                                    client, sysfs)
+    assert ok
+    assert isinstance(lost, ConnectionError)
+    with open(os.path.join(sysfs, 'drivers', 'usb', 'unbind')) as f:
+        assert f.read() == '1-1.1'
+
+
+def test_set_state_daemon_bad_results(sysfs, tmp_path):
+    client = _daemon(tmp_path, b'{"ok": true, "results": '
+                               b'[{"device": "9-9"}]}\n')
+    reports = []
+    ok, lost = usb_control.change_usb_devices_state(
+        [(DEVICE, 'unbind')], client, sysfs,
+        report=lambda *args: reports.append(args))
+    assert ok
+    assert isinstance(lost, ValueError)
+    assert [r[:3] for r in reports] == [('unbind', DEVICE, '')]
+
+
+def test_writer_falls_back_to_sudo_tee(sysfs, tmp_path, monkeypatch, capsys):
+    # sudo that refuses the privileged helper but allows tee
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    sudo = bin_dir / 'sudo'
+    sudo.write_text('#!/bin/sh\n'
+                    'case "$*" in *--privileged-helper*) exit 1;; esac\n'
+                    'exec "$@"\n')
+    sudo.chmod(0o755)
+    monkeypatch.setenv('PATH', f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    # As a user without write access to the driver files
+    monkeypatch.setattr(usb_control.os, 'access', lambda *_: False)
+    with usb_control.UsbStateWriter(sysfs) as writer:
+        assert writer.write('1-1.1', 'unbind') == ''
+        assert writer.use_tee
+        assert writer.write('1-1.1', 'bind') == ''
+        assert writer.write('1-1.1; reboot', 'bind') != ''
+    assert 'Using sudo tee' in capsys.readouterr().err
+    for _action in ('bind', 'unbind'):
+        with open(os.path.join(sysfs, 'drivers', 'usb', _action)) as f:
+            assert f.read() == '1-1.1'
+
+
+def test_stdin_for_bind_and_unbind(sysfs):
+    result = subprocess.run(
+        [sys.executable, usb_control.__file__, '--sysfs-root', sysfs,
+         '-b', '-', '-u', '-'], input='1-1.1\n', stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE, universal_newlines=True)
+    assert result.returncode == 2
+    assert "stdin ('-')" in result.stderr
@@ -0,0 +1,111 @@
+# usb_events.py: uevent parsing, the scripted FakeEventSource and the
+# UsbEventWatcher thread, without USB hardware. Run with
+# 'python3 -m pytest tests'.
+
+import io
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import usb_events
+from usb_events import UsbEvent
+
+
+def _uevent(**env) -> bytes:
+    header = f"{env.get('ACTION', 'add')}@{env.get('DEVPATH', '')}"
+    return b'\0'.join([header.encode()] +
+                      [f"{k}={v}".encode() for k, v in env.items()])
+
+
+DEVPATH = '/devices/platform/soc/usb1/1-1/1-1.3'
+
+
+def test_parse_uevent_usb_device():
+    for action in usb_events.USB_ACTIONS:
+        assert usb_events.parse_uevent(_uevent(
+            ACTION=action, DEVPATH=DEVPATH, SUBSYSTEM='usb',
+            DEVTYPE='usb_device')) == UsbEvent(action, '1-1.3', DEVPATH)
+
+
+def test_parse_uevent_ignored():
+    # An interface, another subsystem and an action that is not
+    # reported
+    for env in ({'DEVTYPE': 'usb_interface'}, {'SUBSYSTEM': 'sound'},
+                {'ACTION': 'change'}, {'SUBSYSTEM': None}):
+        fields = dict(ACTION='add', DEVPATH=DEVPATH, SUBSYSTEM='usb',
+                      DEVTYPE='usb_device')
+        fields.update(env)
+        fields = {k: v for k, v in fields.items() if v is not None}
+        assert usb_events.parse_uevent(_uevent(**fields)) is None
+    assert usb_events.parse_uevent(b'libudev\0\xff\xfe') is None
+
+
+def test_fake_event_source_from_file():
+    source = usb_events.FakeEventSource.from_file(io.StringIO(
+        "# delay action device\n\n0 add 1-1.3\n0 unbind 1-1.3\n"))
+    try:
+        events = []
+        while len(events) < 2:
+            threading.Event().wait(0.01)
+            events += source.read()
+        assert events == [UsbEvent('add', '1-1.3', '1-1.3'),
+                          UsbEvent('unbind', '1-1.3', '1-1.3')]
+        assert source.read() == []
+    finally:
+        source.close()
+
+
+def _watcher(source):
+    woken = threading.Event()
+    watcher = usb_events.UsbEventWatcher(source, wakeup=woken.set)
+    watcher.start()
+    return watcher, woken
+
+
+def test_watcher_wakes_on_events():
+    add = UsbEvent('add', '1-1.3', '1-1.3')
+    remove = UsbEvent('remove', '1-1.3', '1-1.3')
+    watcher, woken = _watcher(usb_events.FakeEventSource(
+        [(0, add), (0.05, remove)]))
+    events = []
+    while len(events) < 2:
+        assert woken.wait(2)
+        woken.clear()
+        events += [e for _, e in watcher.drain()]
+    assert events == [add, remove]
+    assert not watcher.finished
+    watcher.stop()
+    watcher.join(2)
+    assert watcher.finished
+    assert woken.is_set()
+
+
+class EndingSource(object):
+    """
+    Event source that is readable at once and then ends, as the
+    usb_controld.py subscription does when the daemon stops.
+    """
+
+    def __init__(self):
+        self._r, self._w = os.pipe()
+        os.write(self._w, b'.')
+
+    def fileno(self) -> int:
+        return self._r
+
+    def read(self) -> list:
+        raise EOFError
+
+    def close(self):
+        os.close(self._r)
+        os.close(self._w)
+
+
+def test_watcher_wakes_when_source_ends():
+    watcher, woken = _watcher(EndingSource())
+    assert woken.wait(2)
+    watcher.join(2)
+    assert watcher.finished
+    assert watcher.drain() == []
@@ -5,6 +5,7 @@
 #% SYNOPSIS
 #+   ${SCRIPT_NAME} [-hv] 
 #+   ${SCRIPT_NAME} [-c FILE] start COMMAND [COMMAND ...]
+#+   ${SCRIPT_NAME} [-c FILE] config digiigate|digi|igate [both]
 #+   ${SCRIPT_NAME} stop
 #%
 #% DESCRIPTION
@@ -75,6 +76,12 @@
 #%                                channel 1 (stereo left) and channel 2 (stereo right)
 #%                                on stereo sound cards only.
 #%                                
+#%  ${SCRIPT_NAME} [-c FILE] config digiigate|digi|igate [both]
+#%                                Prints the Direwolf configuration file for an APRS
+#%                                mode without starting anything.  Each '#COMMAND NAME'
+#%                                line in it is a command to run, in order.  Used by
+#%                                tnc_supervisor.py.
+#%
 #%  ${SCRIPT_NAME} stop
 #%                                Stops all the apps.  Same as pressing Ctrl-C.
 #%
@@ -97,7 +104,7 @@
 #%
 #================================================================
 #- IMPLEMENTATION
-#-    version         ${SCRIPT_NAME} 3.3.9
+#-    version         ${SCRIPT_NAME} 3.4.0
 #-    author          Steve Magnuson, AG7GN
 #-    license         CC-BY-SA Creative Commons License
 #-    script_id       0
@@ -739,6 +746,25 @@ case "$ACTION" in
 				;;
 		esac
 		;;
+	config)
+		case "$DMODE" in
+			digi*|igate)
+				checkSoundCard
+				[[ $PTT0 == "" || $PTT0 =~ "GPIO" ]] && ORDERS=( direwolf ) || { checkSerial; ORDERS=( rigctld direwolf ); }
+			   CONFFILE="$(makeConfig $DMODE)"
+				CMDS[direwolf]+=" -d t"
+				# Direwolf ignores these comment lines
+				for i in ${!ORDERS[@]}
+				do
+					echo "#COMMAND ${ORDERS[$i]} ${CMDS[${ORDERS[$i]}]}"
+				done
+				grep -v "^$" $CONFFILE
+				;;
+			*)
+				Die "Only the APRS modes (digiigate, digi, igate) can be configured this way."
+				;;
+		esac
+		;;
    stop)
 		ORDERS=( rigctld piardop2 direwolf pat )
 		#ORDERS=( rigctld direwolf )
@@ -0,0 +1,586 @@
+#!/usr/bin/env python3
+
+# Starts Direwolf in one of tnc.sh's APRS modes (digi, igate or
+# digiigate) and keeps it running. Replaces the cron polling in
+# watchdog-tnc.sh, which runs this script instead when it is
+# installed. A crashed Direwolf is seen the moment it exits, rather
+# than at the next cron run, and is restarted with a backoff.
+
+import argparse
+import asyncio
+import json
+import os
+import shlex
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+__author__ = "Steve Magnuson AG7GN"
+__copyright__ = "Copyright 2020, Steve Magnuson"
+__credits__ = ["Steve Magnuson"]
+__license__ = "GPL"
+__version__ = "1.0.1"
+__maintainer__ = "Steve Magnuson"
+__email__ = "ag7gn@arrl.net"
+__status__ = "Production"
+
+TNC_SCRIPT = "/usr/local/bin/tnc.sh"
+TNC_LOG = "/tmp/tnc.log"
+# Not /tmp/tnc*, which tnc.sh deletes every time it exits
+TNC_SUPERVISOR_SOCKET = "watchdog-tnc.sock"
+APRS_MODES = ('digiigate', 'digi', 'igate')
+# Size (KB) at which the log is rotated, as watchdog-tnc.sh's
+# 'find -size +100k' did
+DEFAULT_LOG_SIZE = 100
+
+
+def _stamp() -> str:
+    return time.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+def tnc_commands(mode: str, both: bool, conf_dir: str,
+                 tnc_script: str = TNC_SCRIPT, config: str = None) -> list:
+    """
+    Has tnc.sh build the Direwolf configuration for an APRS mode,
+    as 'tnc.sh start' would, and saves it in conf_dir.
+
+    :param mode: digiigate|digi|igate
+    :param both: Decode both channels of a stereo sound card
+    :param conf_dir: Directory to save direwolf.conf in
+    :param tnc_script: Path to tnc.sh
+    :param config: tnc.sh configuration file, None for its default
+    :return: List of (name, argument list) tuples of the commands to
+             run, in order
+    :raise ValueError: tnc.sh did not produce a configuration
+    """
+    command = [tnc_script] + (['-c', config] if config else []) + \
+        ['config', mode] + (['both'] if both else [])
+    try:
+        result = subprocess.run(command, stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT,
+                                universal_newlines=True)
+    except OSError as e:
+        raise ValueError(f"Cannot run {tnc_script}: {e}")
+    commands = []
+    for line in result.stdout.splitlines():
+        if line.startswith('#COMMAND '):
+            name, _, args = line[len('#COMMAND '):].partition(' ')
+            commands.append((name, shlex.split(args)))
+    # tnc.sh's exit status is not reliable: its exit trap's rm can fail
+    if not any(name == 'direwolf' for name, _ in commands):
+        raise ValueError(f"'{' '.join(command)}' failed: "
+                         f"{result.stdout.strip()}")
+    conf = os.path.join(conf_dir, 'direwolf.conf')
+    with open(conf, 'w') as f:
+        f.write(result.stdout)
+    return [(name, args + ['-c', conf] if name == 'direwolf' else args)
+            for name, args in commands]
+
+
+class RotatingLog(object):
+    """
+    Log file that rotates itself: once it is larger than max_size
+    bytes, it is renamed to FILE.1 (older copies to FILE.2 and so on,
+    up to backups) and a new FILE is started. If the file is removed,
+    as tnc.sh does to /tmp/tnc* whenever it exits, it is recreated.
+    """
+    # How often (s) the file is checked for having been removed
+    check_interval = 1.0
+
+    def __init__(self, _path: str, max_size: int, backups: int = 1,
+                 echo=None):
+        """
+        :param _path: Log file
+        :param max_size: Size in bytes at which the log is rotated
+        :param backups: Number of rotated copies kept. 0 keeps none.
+        :param echo: Binary file everything logged is also written to,
+                     or None
+        """
+        self.path = _path
+        self.max_size = max_size
+        self.backups = backups
+        self.echo = echo
+        self._fd = None
+        self._inode = None
+        self.size = 0
+        self._next_check = 0.0
+
+    def open(self):
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                           0o644)
+        st = os.fstat(self._fd)
+        self._inode = (st.st_dev, st.st_ino)
+        self.size = st.st_size
+
+    def _reopen(self):
+        os.close(self._fd)
+        self.open()
+
+    def _rotate(self):
+        if self.backups:
+            for n in range(self.backups - 1, 0, -1):
+                try:
+                    os.replace(f"{self.path}.{n}", f"{self.path}.{n + 1}")
+                except FileNotFoundError:
+                    pass
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.unlink(self.path)
+        self._reopen()
+
+    def write(self, data: bytes):
+        """
+        :param data: Bytes to append
+        :return: None
+        """
+        if self.echo is not None:
+            self.echo.write(data)
+            self.echo.flush()
+        _now = time.monotonic()
+        try:
+            if _now >= self._next_check:
+                self._next_check = _now + self.check_interval
+                st = os.stat(self.path)
+                if (st.st_dev, st.st_ino) != self._inode:
+                    self._reopen()
+            if self.size >= self.max_size:
+                self._rotate()
+        except FileNotFoundError:
+            self._reopen()
+        except OSError as e:
+            print(f"WARNING: Cannot rotate {self.path}: {e}", file=sys.stderr)
+        self.size += os.write(self._fd, data)
+
+    def message(self, text: str):
+        """
+        Logs a line of the supervisor's own, with a timestamp.
+
+        :param text: Message
+        :return: None
+        """
+        self.write(f"{_stamp()} tnc_supervisor: {text}\n".encode('utf-8'))
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class SupervisedProcess(object):
+    """
+    State of one supervised command.
+    """
+
+    def __init__(self, name: str, command: list):
+        self.name = name
+        self.command = command
+        self.process = None
+        # time.monotonic() the process was last started
+        self.started = None
+        self.restarts = 0
+        # Consecutive runs shorter than TncSupervisor.stable_time
+        self.failures = 0
+        self.last_exit = None
+        # time.monotonic() of the next start while waiting to restart
+        self.next_start = None
+        self.pidfd = None
+
+
+class TncSupervisor(object):
+    """
+    Runs the tnc.sh commands of an APRS mode (Direwolf, and rigctld
+    when the PTT is not a GPIO) as child processes in an asyncio event
+    loop, so the process sleeps until something happens:
+
+        - A child's exit is reported by its pidfd becoming readable
+          (Linux 5.3 and later), or by SIGCHLD on older kernels.
+        - Child output is read from a pipe and written to the log,
+          which rotates itself.
+
+    A child that exits is restarted after backoff seconds. If it ran
+    for less than stable_time, the wait is doubled each time, up to
+    max_backoff seconds.
+
+    The status socket is a Unix domain socket. Every client is sent
+    one JSON object and disconnected:
+
+        {"mode": mode, "pid": supervisor PID, "uptime": seconds,
+         "log": log file,
+         "processes": [{"name": name, "pid": PID or null,
+                        "uptime": seconds or null, "restarts": count,
+                        "last_exit": description or null,
+                        "restart_in": seconds or null}, ...]}
+    """
+    # Seconds to wait before restarting a child that exited
+    backoff = 5.0
+    max_backoff = 300.0
+    # A child that ran at least this many seconds was healthy, and
+    # its next restart waits only backoff seconds again
+    stable_time = 60.0
+    # Seconds children get to exit after SIGTERM before SIGKILL
+    stop_timeout = 5.0
+
+    def __init__(self, mode: str, commands: list, log: RotatingLog,
+                 listener: socket.socket):
+        self.mode = mode
+        self.children = [SupervisedProcess(name, command)
+                         for name, command in commands]
+        self.log = log
+        self.listener = listener
+        self.started = time.monotonic()
+        self.loop = None
+        self._stopped = None
+        self._use_pidfd = hasattr(os, 'pidfd_open')
+
+    def run(self):
+        """
+        Runs until SIGTERM or SIGINT, then stops the children.
+
+        :return: None
+        """
+        asyncio.run(self._main())
+
+    async def _main(self):
+        self.loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            self.loop.add_signal_handler(sig, self._stopped.set)
+        if not self._use_pidfd:
+            self.loop.add_signal_handler(signal.SIGCHLD, self._check_exits)
+        self.log.message(f"Starting {self.mode} mode")
+        for child in self.children:
+            self._start(child)
+        server = await asyncio.start_unix_server(self._client,
+                                                 sock=self.listener)
+        try:
+            await self._stopped.wait()
+        finally:
+            server.close()
+            await self._stop_children()
+            self.log.message("Stopped")
+
+    def _start(self, child: SupervisedProcess):
+        child.next_start = None
+        try:
+            child.process = subprocess.Popen(
+                child.command, stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                start_new_session=True)
+        except OSError as e:
+            child.process = None
+            self._exited(child, str(e))
+            return
+        child.started = time.monotonic()
+        self.log.message(f"Started {child.name} (PID {child.process.pid}): "
+                         f"{' '.join(child.command)}")
+        os.set_blocking(child.process.stdout.fileno(), False)
+        self.loop.add_reader(child.process.stdout.fileno(),
+                             self._read_output, child)
+        if self._use_pidfd:
+            try:
+                child.pidfd = os.pidfd_open(child.process.pid)
+            except OSError:
+                # Kernel older than 5.3
+                self._use_pidfd = False
+                self.loop.add_signal_handler(signal.SIGCHLD,
+                                             self._check_exits)
+            else:
+                self.loop.add_reader(child.pidfd, self._check_exit, child)
+        # It may have exited before it could be watched
+        self._check_exit(child)
+
+    def _read_output(self, child: SupervisedProcess) -> bool:
+        # Copies what the child wrote to the log. Returns False when
+        # there is nothing more to read for now.
+        stdout = child.process.stdout
+        if stdout.closed:
+            return False
+        try:
+            data = os.read(stdout.fileno(), 65536)
+        except BlockingIOError:
+            return False
+        except OSError:
+            data = b''
+        if data:
+            self.log.write(data)
+            return True
+        self.loop.remove_reader(stdout.fileno())
+        stdout.close()
+        return False
+
+    def _unwatch(self, child: SupervisedProcess):
+        if child.pidfd is not None:
+            self.loop.remove_reader(child.pidfd)
+            os.close(child.pidfd)
+            child.pidfd = None
+
+    def _check_exits(self):
+        # SIGCHLD: any child may have exited
+        for child in self.children:
+            if child.process is not None:
+                self._check_exit(child)
+
+    def _check_exit(self, child: SupervisedProcess):
+        if child.process is None or child.process.poll() is None:
+            return
+        self._unwatch(child)
+        # Log whatever output is left before the exit message
+        while self._read_output(child):
+            pass
+        returncode = child.process.returncode
+        child.process = None
+        if returncode < 0:
+            self._exited(child, f"killed by signal {-returncode}")
+        else:
+            self._exited(child, f"exit status {returncode}")
+
+    def _exited(self, child: SupervisedProcess, reason: str):
+        if self._stopped.is_set():
+            return
+        ran = time.monotonic() - child.started if child.started else 0
+        child.failures = child.failures + 1 if ran < self.stable_time else 1
+        delay = min(self.max_backoff,
+                    self.backoff * 2 ** (child.failures - 1))
+        child.last_exit = reason
+        child.restarts += 1
+        child.started = None
+        child.next_start = time.monotonic() + delay
+        self.log.message(f"{child.name} stopped ({reason}) after "
+                         f"{_duration(ran)}. Restarting in {delay:g} s")
+        self.loop.call_later(delay, self._start, child)
+
+    async def _stop_children(self):
+        # Exits are waited for here from now on
+        if not self._use_pidfd:
+            self.loop.remove_signal_handler(signal.SIGCHLD)
+        running = [c for c in self.children if c.process is not None]
+        for child in running:
+            self._unwatch(child)
+            try:
+                os.killpg(child.process.pid, signal.SIGTERM)
+            except OSError:
+                pass
+        deadline = time.monotonic() + self.stop_timeout
+        while any(c.process.poll() is None for c in running) and \
+                time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        for child in running:
+            if child.process.poll() is None:
+                try:
+                    os.killpg(child.process.pid, signal.SIGKILL)
+                except OSError:
+                    pass
+                child.process.wait()
+            while self._read_output(child):
+                pass
+            self.log.message(f"Stopped {child.name}")
+
+    def status(self) -> dict:
+        """
+        :return: Status dictionary, as sent to socket clients
+        """
+        _now = time.monotonic()
+        return {
+            "mode": self.mode, "pid": os.getpid(),
+            "uptime": round(_now - self.started), "log": self.log.path,
+            "processes": [{
+                "name": c.name,
+                "pid": c.process.pid if c.process else None,
+                "uptime": round(_now - c.started) if c.started else None,
+                "restarts": c.restarts, "last_exit": c.last_exit,
+                "restart_in": round(max(0.0, c.next_start - _now), 1)
+                if c.next_start else None,
+            } for c in self.children]}
+
+    async def _client(self, reader: asyncio.StreamReader,
+                      writer: asyncio.StreamWriter):
+        writer.write((json.dumps(self.status()) + '\n').encode('utf-8'))
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+
+def socket_paths() -> list:
+    """
+    :return: Status socket paths, in $XDG_RUNTIME_DIR and in /tmp. The
+             runtime directory does not exist on a Pi with no login
+             session, in which case the socket is in /tmp.
+    """
+    paths = [os.path.join(_dir, TNC_SUPERVISOR_SOCKET) for _dir in
+             (os.environ.get('XDG_RUNTIME_DIR'), '/tmp') if _dir]
+    return list(dict.fromkeys(paths))
+
+
+def supervisor_status(_path: str = None):
+    """
+    :param _path: Status socket of a running tnc_supervisor.py. None
+                  tries each of socket_paths().
+    :return: Its status dictionary, or None if none is running there
+    """
+    if _path is None:
+        for _path in socket_paths():
+            status = supervisor_status(_path)
+            if status is not None:
+                return status
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.settimeout(5)
+            s.connect(_path)
+            data = b''
+            while not data.endswith(b'\n'):
+                chunk = s.recv(65536)
+                if not chunk:
+                    break
+                data += chunk
+    except OSError:
+        return None
+    try:
+        return json.loads(data.decode('utf-8'))
+    except ValueError:
+        return None
+
+
+def print_status(status: dict):
+    """
+    :param status: Status dictionary from supervisor_status()
+    :return: None
+    """
+    print(f"Mode {status['mode']}, supervisor PID {status['pid']}, up "
+          f"{_duration(status['uptime'])}, logging to {status['log']}")
+    for p in status['processes']:
+        if p['pid'] is not None:
+            state = f"running, PID {p['pid']}, up {_duration(p['uptime'])}"
+        else:
+            state = f"restarting in {p['restart_in']:g} s"
+        last = f", last {p['last_exit']}" if p['last_exit'] else ''
+        print(f"{p['name']}: {state}, {p['restarts']} restarts{last}")
+
+
+def _listen_socket(_path: str) -> socket.socket:
+    """
+    :param _path: Socket path
+    :return: Listening socket usable only by the owner
+    """
+    try:
+        os.unlink(_path)
+    except FileNotFoundError:
+        pass
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(_path)
+    os.chmod(_path, 0o600)
+    listener.listen(4)
+    return listener
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog='tnc_supervisor.py',
+        description="Start Direwolf in an APRS mode and restart it "
+                    "whenever it stops",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('-v', '--version', action='version',
+                        version=f"Version: {__version__}")
+    parser.add_argument("mode", nargs='?', type=str.lower,
+                        choices=APRS_MODES,
+                        help="APRS mode, as for 'tnc.sh start'")
+    parser.add_argument("both", nargs='?', type=str.lower, choices=['both'],
+                        help="Decode both channels of a stereo sound card")
+    parser.add_argument("-c", "--config", type=str, metavar="FILE",
+                        help="tnc.sh configuration file. Default is "
+                             "tnc.sh's default, $HOME/tnc.conf")
+    parser.add_argument("--tnc_script", type=str, default=TNC_SCRIPT,
+                        help="tnc.sh to get the Direwolf configuration "
+                             "from")
+    parser.add_argument("--log", type=str, default=TNC_LOG, metavar="FILE",
+                        help="Log file for Direwolf's output")
+    parser.add_argument("--log_size", type=int, default=DEFAULT_LOG_SIZE,
+                        metavar="KB",
+                        help="Rotate the log when it reaches KB kilobytes")
+    parser.add_argument("--log_backups", type=int, default=1,
+                        metavar="COUNT",
+                        help="Rotated logs to keep (FILE.1 ... FILE.COUNT)")
+    parser.add_argument("-s", "--socket", type=str,
+                        help="Status socket. Default is "
+                             f"$XDG_RUNTIME_DIR/{TNC_SUPERVISOR_SOCKET}, or "
+                             f"/tmp/{TNC_SUPERVISOR_SOCKET} if that "
+                             "directory does not exist")
+    parser.add_argument("--status", action='store_true',
+                        help="Print the status of the running supervisor "
+                             "and exit")
+    parser.add_argument("--json", action='store_true',
+                        help="With --status, print the status as JSON")
+    arg_info = parser.parse_args()
+
+    status = supervisor_status(arg_info.socket)
+    if arg_info.status:
+        if status is None:
+            print(f"tnc_supervisor.py is not running (no answer on "
+                  f"{arg_info.socket or ' or '.join(socket_paths())})",
+                  file=sys.stderr)
+            sys.exit(1)
+        if arg_info.json:
+            print(json.dumps(status, indent=1))
+        else:
+            print_status(status)
+        sys.exit(0)
+    if arg_info.mode is None:
+        parser.error("the mode is required")
+    if status is not None:
+        # Already running, like watchdog-tnc.sh finding Direwolf
+        if status['mode'] != arg_info.mode:
+            print(f"WARNING: tnc_supervisor.py is already running in "
+                  f"{status['mode']} mode", file=sys.stderr)
+        sys.exit(0)
+
+    # Everything that can fail is done before a Direwolf started by
+    # tnc.sh is stopped, so that a failed start leaves it running
+    socket_path = arg_info.socket or \
+        next(p for p in socket_paths() if os.path.isdir(os.path.dirname(p)))
+    try:
+        listener = _listen_socket(socket_path)
+    except OSError as e:
+        print(f"ERROR: Cannot listen on {socket_path}: {e}", file=sys.stderr)
+        sys.exit(1)
+    log = RotatingLog(arg_info.log, arg_info.log_size * 1024,
+                      arg_info.log_backups,
+                      echo=sys.stdout.buffer if sys.stdout.isatty() else None)
+    # When running from cron, PATH is /usr/bin:/bin
+    os.environ['PATH'] = f"/usr/local/bin{os.pathsep}{os.environ['PATH']}"
+    conf_dir = tempfile.mkdtemp(prefix='direwolf-')
+    try:
+        log.open()
+        commands = tnc_commands(arg_info.mode, bool(arg_info.both), conf_dir,
+                                arg_info.tnc_script, arg_info.config)
+    except (OSError, ValueError) as e:
+        listener.close()
+        os.unlink(socket_path)
+        shutil.rmtree(conf_dir, ignore_errors=True)
+        print(f"ERROR: {e}", file=sys.stderr)
+        sys.exit(1)
+    # Stop any Direwolf that tnc.sh started in screen
+    subprocess.run([arg_info.tnc_script, 'stop'], stdout=subprocess.DEVNULL,
+                   stderr=subprocess.DEVNULL)
+    try:
+        TncSupervisor(arg_info.mode, commands, log, listener).run()
+    finally:
+        listener.close()
+        try:
+            os.unlink(socket_path)
+        except OSError:
+            pass
+        log.close()
+        shutil.rmtree(conf_dir, ignore_errors=True)
+    sys.exit(0)
@@ -1,6 +1,6 @@
 #!/bin/bash
 
-VERSION="1.5.1"
+VERSION="1.6.1"
 
 #
 # This script removes log files from the $HOME/.fldigi* folder(s) and subfolders.
@@ -25,6 +25,10 @@ VERSION="1.5.1"
 # Leave the "Execute in Terminal" box unchecked, then click OK.
 #
 
+# Old Fldigi logs are deleted by log_trim.py when it is installed here
+LOG_TRIM_PY="$(dirname "$0")/log_trim.py"
+[[ -x $LOG_TRIM_PY ]] && exec "$LOG_TRIM_PY" --kind fldigi "$@"
+
 # Exit if Fldigi is already running
 pgrep fldigi >/dev/null && exit 0
 
@@ -1,6 +1,6 @@
 #!/bin/bash
 
-VERSION="1.5.1"
+VERSION="1.6.1"
 
 #
 # This script removes log files from the $HOME/.flmsg* folder(s) and subfolders.
@@ -24,6 +24,10 @@ VERSION="1.5.1"
 # Leave the "Execute in Terminal" box unchecked, then click OK.
 #
 
+# log_trim.py, if present here, clears the old Flmsg files in one process
+LOG_TRIM_PY="$(dirname "$0")/log_trim.py"
+[[ -x $LOG_TRIM_PY ]] && exec "$LOG_TRIM_PY" --kind flmsg "$@"
+
 # Exit if Flmsg is already running
 pgrep flmsg >/dev/null && exit 0
 
@@ -1,6 +1,6 @@
 #!/bin/bash
 
-VERSION="1.5.1"
+VERSION="1.6.1"
 
 # This script removes log files from the $HOME/.flrig* folder(s) and subfolders.
 # Files with "last modified" timestamps that are before the specified time 
@@ -24,6 +24,10 @@ VERSION="1.5.1"
 # Leave the "Execute in Terminal" box unchecked, then click OK.
 #
 
+# Flrig's old logs: delegate to log_trim.py when it sits next to this script
+LOG_TRIM_PY="$(dirname "$0")/log_trim.py"
+[[ -x $LOG_TRIM_PY ]] && exec "$LOG_TRIM_PY" --kind flrig "$@"
+
 # Exit if Fldigi is already running
 pgrep flrig >/dev/null && exit 0
 
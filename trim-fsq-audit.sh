@@ -1,6 +1,6 @@
 #!/bin/bash
 
-VERSION="1.5"
+VERSION="1.6.1"
 
 # This script trims the fsq_audit_log.txt file
 # in the ~/.fldigi/temp folder by removing content added aded earlier 
@@ -29,6 +29,10 @@ VERSION="1.5"
 # sh -c '/usr/local/bin/trim-fsq-audit.sh "30 days ago";/usr/local/bin/trim-fsq-heard.sh "1 hour ago"';fldigi
 #
 
+# log_trim.py finds the first Audit log session to keep by binary search
+LOG_TRIM_PY="$(dirname "$0")/log_trim.py"
+[[ -x $LOG_TRIM_PY ]] && exec "$LOG_TRIM_PY" --kind fsq-audit "$@"
+
 # Exit if Fldigi is already running
 pgrep fldigi >/dev/null && exit 0
 
@@ -1,6 +1,6 @@
 #!/bin/bash
 
-VERSION="1.5"
+VERSION="1.6.1"
 
 # This script trims the fsq_heard_log.txt file
 # in the ~/.fldigi/temp folder by removing lines with timestamps earlier 
@@ -29,6 +29,10 @@ VERSION="1.5"
 # sh -c '/usr/local/bin/trim-fsq-audit.sh "30 days ago";/usr/local/bin/trim-fsq-heard.sh "1 week ago"';fldigi
 #
 
+# log_trim.py keeps the recent heard lines under a new header in one pass
+LOG_TRIM_PY="$(dirname "$0")/log_trim.py"
+[[ -x $LOG_TRIM_PY ]] && exec "$LOG_TRIM_PY" --kind fsq-heard "$@"
+
 # Exit if Fldigi is already running
 pgrep fldigi >/dev/null && exit 0
 
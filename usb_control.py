@@ -1,22 +1,40 @@
 #!/usr/bin/env python3
 import sys
-import signal
 import os
-import subprocess
-import tkinter as tk
-from tkinter import ttk
-import tkinter.font as tkfont
+import re
+import time
+import json
+import socket
 import collections
+# tkinter, subprocess, threading and usb_events are imported where
+# they are used, so that the command line options, which are run from
+# udev rules and cron, start quickly
 
 __author__ = "Steve Magnuson AG7GN"
 __copyright__ = "Copyright 2020, Steve Magnuson"
 __credits__ = ["Steve Magnuson"]
 __license__ = "GPL"
-__version__ = "1.0.3"
+__version__ = "1.7.4"
 __maintainer__ = "Steve Magnuson"
 __email__ = "ag7gn@arrl.net"
 __status__ = "Production"
 
+USB_SYSFS_ROOT = "/sys/bus/usb"
+USB_CLASS_HUB = "09"
+# Valid bind/unbind designations, e.g. 1-1.3
+USB_DEVICE_RE = re.compile(r'^\d+-\d+(\.\d+)*$')
+# Socket of the optional usb_controld.py daemon
+USB_CONTROL_SOCKET = "/run/usb_control.sock"
+# Devices seen by usb_control.py, see UsbInventory
+USB_INVENTORY = os.path.expanduser("~/.cache/usb_control.json")
+# Vendor and product name databases lsusb gets its names from, in the
+# order they are tried. The .hwdb file is the source udev's hwdb is
+# built from.
+USB_IDS_FILES = ("/usr/share/misc/usb.ids", "/usr/share/hwdata/usb.ids",
+                 "/var/lib/usbutils/usb.ids",
+                 "/usr/lib/udev/hwdb.d/20-usb-vendor-model.hwdb",
+                 "/lib/udev/hwdb.d/20-usb-vendor-model.hwdb")
+
 
 class UsbWindow(object):
     """
@@ -31,9 +49,27 @@ class UsbWindow(object):
     window_padding = 35
     min_window_width = max_label_width + window_padding
     max_window_height = 380
+    # Device list refresh interval (ms) when no hotplug events are available
+    poll_interval = 1000
+    # Time (ms) to let a burst of hotplug events settle before rescanning
+    event_settle_time = 50
+    # How often (ms) finished worker thread operations are checked
+    result_check_interval = 20
+    # State shown while a device is being bound or unbound
+    pending_labels = {'bind': "Enabling...", 'unbind': "Disabling..."}
 
-    def __init__(self, master):
+    def __init__(self, master, event_source=None, client=None,
+                 telemetry=None):
+        import tkinter as tk
+        from tkinter import ttk
+        import tkinter.font as tkfont
+        import concurrent.futures
+        from usb_events import UsbEventWatcher
         self.master = master
+        # usb_controld.py connection, if the daemon is running
+        self.client = client
+        # UsbTelemetry for the optional power and traffic columns
+        self.telemetry = telemetry
         master.title(f"USB Device Manager - version {__version__}")
         ws = master.winfo_screenwidth()
         hs = master.winfo_screenheight()
@@ -43,6 +79,8 @@ class UsbWindow(object):
         # master.config(bg="skyblue")
         # Make the label frame & label
         self.header = ["ID", "Tag", "Device", "State"]
+        if telemetry is not None:
+            self.header += UsbTelemetry.columns
         self.label_frame = tk.Frame(master=master, borderwidth=5)
         self.label_frame.pack(side='top', fill='both', padx=5, pady=5, expand=True)
         s = """Click on a device to toggle state.
@@ -54,6 +92,13 @@ Empty list means no devices found.
                        font=self.label_font, fg='blue',
                        anchor="center", text=s)
         msg.pack(side='top', padx=5, pady=5)
+        # Shows the last bind/unbind or scan failure
+        self.error_label = tk.Label(master=self.label_frame,
+                                    wraplength=self.max_label_width,
+                                    justify="center",
+                                    font=self.label_font, fg='red',
+                                    anchor="center", text='')
+        self.error_label.pack(side='top', padx=5)
         self.list_frame = tk.Frame(master=master, borderwidth=5)
         self.list_frame.pack(side='top', fill='both', padx=5, pady=5,
                              expand=True)
@@ -101,7 +146,65 @@ Empty list means no devices found.
         self.quit_button.pack(side='left',
                               fill='both', expand=True)
         self.current_list = None
+        self._rescan_pending = None
+        # Keeps sysfs attribute reads to changed devices when polling
+        self.inventory = UsbInventory()
+        # Device scans and bind/unbind (which may wait on sudo or a
+        # hung device) run one at a time in this thread, never in the
+        # Tk thread. The daemon connection is only used from it, but
+        # self.client is only changed in the Tk thread.
+        self.worker = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        # (future, callback) of operations whose results are not in
+        self._results = []
+        # Device: bind|unbind operation in progress
+        self.pending = {}
+        # Device: telemetry column values
+        self.metrics = {}
+        self._refreshing = False
+        self._refresh_again = False
+        # Fonts are created once and every measured string is cached
+        self._font = tkfont.Font(font=self.treeview_font)
+        self._header_font = tkfont.Font(font=self.treeview_header_font)
+        self._text_widths = {}
+        self._header_widths = {}
+        self._col_widths = {}
+        self._window_width = None
+        self._sort_col = None
+        self._sort_descending = False
+        self._build_headers()
+        if event_source is not None:
+            # The watcher thread writes to this pipe to have Tk call
+            # _check_events
+            self._wake_r, self._wake_w = os.pipe()
+            os.set_blocking(self._wake_r, False)
+            os.set_blocking(self._wake_w, False)
+            self.master.createfilehandler(self._wake_r, tk.READABLE,
+                                          self._check_events)
+            self.watcher = UsbEventWatcher(event_source,
+                                           wakeup=self._wakeup)
+            self.watcher.start()
+        else:
+            self.watcher = None
         self._update_tree()
+        if telemetry is not None:
+            self.list_frame.after(int(telemetry.interval * 1000),
+                                  self._sample_telemetry)
+
+    def _text_width(self, text: str, header: bool = False) -> int:
+        """
+        Returns the width in pixels of text plus padding, measuring
+        each distinct string only once.
+
+        :param text: String to measure
+        :param header: True to measure using the header font
+        :return: Width in pixels
+        """
+        cache = self._header_widths if header else self._text_widths
+        width = cache.get(text)
+        if width is None:
+            font = self._header_font if header else self._font
+            width = cache[text] = font.measure(text + '__')
+        return width
 
     def _build_headers(self):
         """
@@ -113,152 +216,1018 @@ Empty list means no devices found.
         """
         for col in self.header:
             self.tree.heading(col, text=col.title(),
-                              command=lambda c=col: self._sort_by(c, 0))
+                              command=lambda c=col: self._sort_by(c))
             # Adjust the column's width to the header string
-            _width = tkfont.Font(font=self.treeview_header_font).measure(col.title() + '__')
-            self.tree.column(col, width=_width)
+            self._col_widths[col] = self._text_width(col.title(),
+                                                     header=True)
+            self.tree.column(col, width=self._col_widths[col])
 
     def _build_tree(self):
         """
-        Calls get_usb_devices and inserts results into the tree. Column
-        width auto-adjusts based on the character count in the row
-        field with the greatest number of characters.
+        Brings the tree in line with current_list. Rows are keyed by
+        device (e.g. '1-1.3'), so only inserted, removed or changed rows
+        are touched and the selection survives a refresh. Column width
+        auto-adjusts based on the widest field in each column.
 
         :return: None
         """
-        self.tree.delete(*self.tree.get_children())
-        i = 0
+        latest = {item[2]: self._row(item) for item in self.current_list}
+        existing = set(self.tree.get_children())
+        removed = existing - latest.keys()
+        if removed:
+            self.tree.delete(*removed)
+        for device, item in latest.items():
+            if device not in existing:
+                self.tree.insert('', 'end', iid=device, values=item)
+            elif tuple(str(v) for v in self.tree.item(device, 'values')) \
+                    != item:
+                self.tree.item(device, values=item)
+        if self._sort_col is None:
+            # Keep the order returned by get_usb_devices
+            for ix, device in enumerate(latest):
+                if self.tree.index(device) != ix:
+                    self.tree.move(device, '', ix)
+        else:
+            self._sort_rows()
+        self._stripe_rows()
+        # adjust column's width if necessary to fit each value
+        # Use the column's header string as a minimum width
         tree_width = 0
-        for item in self.current_list:
-            if i % 2 == 0:
-                self.tree.insert('', 'end', values=item, tags=('even',))
-            else:
-                self.tree.insert('', 'end', values=item, tags=('odd',))
-            i += 1
-            # adjust column's width if necessary to fit each value
-            # Use the column's header string as a minimum width
-            tree_width = 0
-            for ix, val in enumerate(item):
-                min_col_w = self.tree.column(self.header[ix], width=None)
-                col_w = tkfont.Font(font=self.treeview_font).measure(val + '__')
-                if min_col_w < col_w:
-                    self.tree.column(self.header[ix], width=col_w)
-                    tree_width += col_w
-                else:
-                    tree_width += min_col_w
+        for ix, col in enumerate(self.header):
+            col_w = max([self._text_width(col.title(), header=True)] +
+                        [self._text_width(item[ix])
+                         for item in latest.values()])
+            if col_w != self._col_widths.get(col):
+                self._col_widths[col] = col_w
+                self.tree.column(col, width=col_w)
+            tree_width += col_w
         # Update root window width to accommodate the new tree width
-        self.master.update_idletasks()
-        self.master.update()
-        x = self.master.winfo_width()
-        y = self.master.winfo_height()
         window_width = max([tree_width + self.window_padding,
                             self.min_window_width])
-        if x != window_width:
+        if window_width != self._window_width:
+            self._window_width = window_width
+            self.master.update_idletasks()
+            y = self.master.winfo_height()
             self.master.geometry(f"{window_width}x{y}")
 
+    def _stripe_rows(self):
+        """
+        Sets the alternating row background tags, touching only the
+        rows whose position parity changed.
+
+        :return: None
+        """
+        for ix, device in enumerate(self.tree.get_children()):
+            tag = 'even' if ix % 2 == 0 else 'odd'
+            if self.tree.item(device, 'tags') != (tag,):
+                self.tree.item(device, tags=(tag,))
+
+    def _row(self, item: tuple) -> tuple:
+        """
+        :param item: Device tuple as returned by get_usb_devices
+        :return: Tree row values for the device, with the pending
+                 state shown while it is being bound or unbound
+        """
+        if item[2] in self.pending:
+            item = item[:3] + (self.pending_labels[self.pending[item[2]]],)
+        if self.telemetry is not None:
+            item += self.metrics.get(item[2], ('',) * len(
+                UsbTelemetry.columns))
+        return item
+
+    def _submit(self, callback, fn, *args):
+        """
+        Runs fn(*args) in the worker thread and then callback(future)
+        in the Tk thread.
+
+        :return: None
+        """
+        if not self._results:
+            self.list_frame.after(self.result_check_interval,
+                                  self._check_results)
+        self._results.append((self.worker.submit(fn, *args), callback))
+
+    def _check_results(self):
+        """
+        Hands finished worker thread operations to their callbacks, and
+        reschedules itself while any are still running. A callback that
+        fails does not stop the others.
+
+        :return: None
+        """
+        done = []
+        running = []
+        for result in self._results:
+            (done if result[0].done() else running).append(result)
+        self._results = running
+        for future, callback in done:
+            try:
+                callback(future)
+            except Exception as e:
+                self._show_error(f"ERROR: {e}")
+        if self._results:
+            self.list_frame.after(self.result_check_interval,
+                                  self._check_results)
+
     def _select_item(self, _):
         selected = self.tree.focus()
-        if not selected:
+        if not selected or selected in self.pending:
+            # Clicks on a device that is still changing are ignored
             return
-        _device = self.tree.item(selected)['values'][2]
-        _state = self.tree.item(selected)['values'][3].casefold()
-        if _state == "enabled":
+        _item = next((d for d in self.current_list if d[2] == selected),
+                     None)
+        if _item is None:
+            return
+        if _item[3] == "Enabled":
             target_state = "unbind"
         else:
             target_state = "bind"
-        set_usb_device_state(_device, target_state)
+        self.pending[selected] = target_state
         self._build_tree()
+        client = self.client
+        self._submit(lambda future: self._state_changed(
+            client, _item, target_state, future),
+                     self._set_state, client, _item, target_state)
 
-    def _update_tree(self):
+    @staticmethod
+    def _set_state(client, _item: tuple, _action: str) -> tuple:
+        """
+        Runs in the worker thread.
+
+        :param client: UsbControlClient to use, or None
+        :return: (True if the write succeeded, the error that made the
+                 daemon unusable or None)
+        """
+        return change_usb_devices_state([(_item, _action)], client)
+
+    def _drop_client(self, client, error: Exception):
         """
-        Checks to see if the size of the list of USB devices has changed
-        and if it has, refresh the tree header and list of devices.
+        Stops using the daemon after the worker thread found it gone.
 
+        :param client: UsbControlClient the worker thread was using
+        :param error: What went wrong
         :return: None
         """
-        _latest_list = get_usb_devices()
-        if collections.Counter(_latest_list) != collections.Counter(self.current_list):
+        if client is not None and client is self.client:
+            self.client = None
+
+    def _show_error(self, text: str):
+        """
+        :param text: Error to show above the list. '' clears it.
+        :return: None
+        """
+        if text:
+            print(text, file=sys.stderr)
+        self.error_label.configure(text=text)
+
+    def _state_changed(self, client, _item: tuple, _action: str, future):
+        del self.pending[_item[2]]
+        verb = 'enable' if _action == 'bind' else 'disable'
+        try:
+            ok, lost = future.result()
+        except Exception as e:
+            ok, lost = False, None
+            self._show_error(f"ERROR: Cannot {verb} {_item[1]} "
+                             f"({_item[2]}): {e}")
+        else:
+            if lost is not None:
+                self._drop_client(client, lost)
+            if ok:
+                self._show_error('')
+            else:
+                self._show_error(f"ERROR: Cannot {verb} {_item[1]} "
+                                 f"({_item[2]})")
+        self._build_tree()
+        self._refresh_tree()
+
+    def _refresh_tree(self):
+        """
+        Re-reads the USB device list in the worker thread. The tree is
+        updated when the list arrives, if anything changed. Refresh
+        requests made while a scan is running result in one more scan
+        once it is done.
+
+        :return: None
+        """
+        self._rescan_pending = None
+        if self._refreshing:
+            self._refresh_again = True
+            return
+        self._refreshing = True
+        client = self.client
+        self._submit(lambda future: self._list_received(client, future),
+                     self._scan, client)
+
+    def _scan(self, client) -> tuple:
+        """
+        Runs in the worker thread.
+
+        :param client: UsbControlClient to use, or None
+        :return: (devices, telemetry metrics, the error that made the
+                 daemon unusable or None)
+        """
+        devices, lost = list_usb_devices(client, inventory=self.inventory)
+        metrics = {}
+        if self.telemetry is not None:
+            metrics = {port: UsbTelemetry.row(values) for port, values
+                       in self.telemetry.sample(devices).items()}
+        return devices, metrics, lost
+
+    def _list_received(self, client, future):
+        self._refreshing = False
+        try:
+            _latest_list, metrics, lost = future.result()
+        except Exception as e:
+            self._show_error(f"ERROR: Cannot read the USB devices: {e}")
+            _latest_list, metrics, lost = self.current_list or [], \
+                self.metrics, None
+        if lost is not None:
+            self._drop_client(client, lost)
+        if collections.Counter(_latest_list) != \
+                collections.Counter(self.current_list) or \
+                metrics != self.metrics:
             self.current_list = _latest_list
-            self._build_headers()
+            self.metrics = metrics
             self._build_tree()
-        self.list_frame.after(1000, self._update_tree)
+        if self._refresh_again:
+            self._refresh_again = False
+            self._refresh_tree()
+
+    def close(self):
+        """
+        Stops the hotplug watcher and the worker thread. An operation
+        already running in the worker thread is allowed to finish.
+
+        :return: None
+        """
+        if self.watcher is not None:
+            self.master.deletefilehandler(self._wake_r)
+            self.watcher.stop()
+        self.worker.shutdown(wait=False)
+
+    def _sample_telemetry(self):
+        """
+        Rescans, and so updates the telemetry columns, every telemetry
+        interval.
+
+        :return: None
+        """
+        self._refresh_tree()
+        self.list_frame.after(int(self.telemetry.interval * 1000),
+                              self._sample_telemetry)
+
+    def _update_tree(self):
+        """
+        Checks to see if the list of USB devices has changed and if it
+        has, refresh the tree. Without a hotplug event source,
+        reschedules itself every poll_interval ms.
+
+        :return: None
+        """
+        self._refresh_tree()
+        if self.watcher is None:
+            self.list_frame.after(self.poll_interval, self._update_tree)
+
+    def _wakeup(self):
+        # Called from the watcher thread
+        try:
+            os.write(self._wake_w, b'\0')
+        except OSError:
+            # The pipe is full, so Tk will wake up anyway, or closed
+            pass
+
+    def _check_events(self, *_):
+        """
+        Collects hotplug events queued by the watcher thread. Tk calls
+        this only when the watcher has written to the wakeup pipe. A
+        burst of events (a device add is followed by its interfaces
+        and driver binds) results in a single rescan.
+
+        :return: None
+        """
+        try:
+            os.read(self._wake_r, 512)
+        except BlockingIOError:
+            pass
+        if self.watcher.drain() and self._rescan_pending is None:
+            self._rescan_pending = self.list_frame.after(
+                self.event_settle_time, self._refresh_tree)
+        if self.watcher.finished:
+            # Event source went away (usb_controld.py stopped). Fall back
+            # to scanning sysfs directly.
+            print("WARNING: Lost USB hotplug events. Polling instead",
+                  file=sys.stderr)
+            self.master.deletefilehandler(self._wake_r)
+            os.close(self._wake_r)
+            os.close(self._wake_w)
+            self.watcher = None
+            self.client = None
+            self._update_tree()
 
-    def _sort_by(self, col, descending):
+    def _sort_by(self, col):
         """
         Sorts tree contents when a column header is clicked on.
+        Clicking the same header again reverses the sort direction.
+        The sort order is kept when the tree is refreshed.
 
         :param col: The column to sort on
-        :param descending: True if descending, False if ascending sort
-                           desired
         :return: None
         """
-        data = [(self.tree.set(child, col), child) for child in self.tree.get_children('')]
-        # Sort the data in place
-        # if the data to be sorted is numeric change to float
-        # data = change_numeric(data)
-        data.sort(reverse=descending)
+        if col == self._sort_col:
+            self._sort_descending = not self._sort_descending
+        else:
+            self._sort_col = col
+            self._sort_descending = False
+        self._sort_rows()
+        self._stripe_rows()
+
+    def _sort_rows(self):
+        """
+        Moves rows into the current sort order. Rows already in place
+        are not moved.
+
+        :return: None
+        """
+        data = [(self.tree.set(child, self._sort_col), child)
+                for child in self.tree.get_children('')]
+        data.sort(reverse=self._sort_descending)
         for ix, item in enumerate(data):
-            self.tree.move(item[1], '', ix)
-        # Switch the sort direction
-        self.tree.heading(col,
-                          command=lambda c=col:
-                          self._sort_by(col, int(not descending)))
+            if self.tree.index(item[1]) != ix:
+                self.tree.move(item[1], '', ix)
+
+
+class UiLatencyProbe(object):
+    """
+    Measures how responsive the Tk mainloop is. A timer is set to fire
+    every interval ms, and the time by which it fires late is how long
+    the mainloop was kept from handling events. Each stall of at least
+    threshold ms is printed, and summary() reports them all.
+    """
+
+    def __init__(self, widget, threshold: float = 100, interval: int = 20,
+                 log=sys.stderr):
+        self.widget = widget
+        self.threshold = threshold
+        self.interval = interval
+        self.log = log
+        self.samples = 0
+        self.total = 0.0
+        self.worst = 0.0
+        self.stalls = 0
+        self._due = None
+
+    def start(self):
+        self._due = time.monotonic() + self.interval / 1000
+        self.widget.after(self.interval, self._tick)
+
+    def _tick(self):
+        _now = time.monotonic()
+        late = max(0.0, (_now - self._due) * 1000)
+        self.samples += 1
+        self.total += late
+        self.worst = max(self.worst, late)
+        if late >= self.threshold:
+            self.stalls += 1
+            print(f"UI stall: {late:.0f} ms", file=self.log)
+        self._due = _now + self.interval / 1000
+        self.widget.after(self.interval, self._tick)
+
+    def summary(self) -> str:
+        """
+        :return: Number of samples and stalls, and the mean and worst
+                 timer lateness
+        """
+        mean = self.total / self.samples if self.samples else 0.0
+        return f"UI latency: {self.samples} samples, {self.stalls} " \
+               f"stalls of {self.threshold:.0f} ms or more, mean " \
+               f"{mean:.1f} ms, worst {self.worst:.0f} ms"
+
+
+def _read_sysfs_attr(_path: str, _attr: str) -> str:
+    """
+    Returns the stripped contents of a sysfs attribute file, or an
+    empty string if the attribute is not present or cannot be read.
+
+    :param _path: sysfs device directory
+    :param _attr: Attribute (file) name in _path
+    :return: Attribute value as a string
+    """
+    try:
+        with open(os.path.join(_path, _attr), 'r') as f:
+            return f.read().strip()
+    except (OSError, UnicodeDecodeError):
+        return ''
+
+
+# Path: names loaded from it by usb_names()
+_usb_names = {}
+
+
+def _parse_usb_ids(f) -> dict:
+    # usb.ids: 'vvvv  Vendor' lines, each followed by tab-indented
+    # 'pppp  Product' lines. The device classes come after the vendors.
+    names = {}
+    vendor = None
+    for line in f:
+        if line.startswith('C '):
+            break
+        if line.startswith('#') or line.startswith('\t\t'):
+            continue
+        _id, _, name = line.lstrip('\t').partition('  ')
+        if len(_id) != 4:
+            continue
+        if not line.startswith('\t'):
+            vendor = _id.lower()
+            names[vendor] = name.strip()
+        elif vendor is not None:
+            names[f"{vendor}:{_id.lower()}"] = name.strip()
+    return names
+
+
+def _parse_usb_hwdb(f) -> dict:
+    # 'usb:vVVVV*' or 'usb:vVVVVpPPPP*' lines, each followed by an
+    # ' ID_VENDOR_FROM_DATABASE=' or ' ID_MODEL_FROM_DATABASE=' line
+    names = {}
+    key = None
+    for line in f:
+        if line.startswith('usb:v'):
+            _id = line[5:].rstrip().rstrip('*').lower()
+            key = f"{_id[:4]}:{_id[5:9]}" if len(_id) == 9 and \
+                _id[4] == 'p' else _id if len(_id) == 4 else None
+        elif key and line.startswith(' ID_'):
+            names[key] = line.split('=', 1)[1].strip()
+            key = None
+    return names
+
+
+def usb_names() -> dict:
+    """
+    Loads the vendor and product names lsusb shows from the first of
+    USB_IDS_FILES found. Each file is read only once.
+
+    :return: Dictionary of 'vendor' and 'vendor:product' IDs (lower
+             case hex) to names. Empty if no file is found.
+    """
+    for _path in USB_IDS_FILES:
+        if _path not in _usb_names:
+            try:
+                with open(_path, 'r', encoding='utf-8',
+                          errors='replace') as f:
+                    _usb_names[_path] = _parse_usb_hwdb(f) \
+                        if _path.endswith('.hwdb') else _parse_usb_ids(f)
+            except OSError:
+                continue
+        return _usb_names[_path]
+    return {}
+
+
+def _read_usb_device(_path: str):
+    """
+    Reads the identity of the USB device at a sysfs device directory.
+
+    :param _path: sysfs device directory, e.g. /sys/bus/usb/devices/1-1.3
+    :return: Dictionary with the bus and device numbers ('bus', 'dev'),
+             'id' (vendor:product), 'tag', 'serial' and 'hub' (True if
+             the device is a hub), or None if _path is not a device
+    """
+    _bus = _read_sysfs_attr(_path, 'busnum')
+    _dev = _read_sysfs_attr(_path, 'devnum')
+    if not _bus.isdigit() or not _dev.isdigit():
+        return None
+    _id = f"{_read_sysfs_attr(_path, 'idVendor')}:" \
+          f"{_read_sysfs_attr(_path, 'idProduct')}"
+    names = usb_names()
+    # As lsusb does: the names in the database, or the device's own
+    # descriptor strings if its IDs are not in it
+    _tag = (names.get(_id[:4]) or _read_sysfs_attr(_path, 'manufacturer'),
+            names.get(_id) or _read_sysfs_attr(_path, 'product'))
+    return {
+        'bus': int(_bus), 'dev': int(_dev),
+        'id': _id,
+        'tag': ' '.join(t for t in _tag if t),
+        'serial': _read_sysfs_attr(_path, 'serial'),
+        'hub': _read_sysfs_attr(_path, 'bDeviceClass') == USB_CLASS_HUB,
+    }
 
 
-def get_usb_devices() -> list:
+def get_usb_devices(sysfs_root: str = USB_SYSFS_ROOT,
+                    inventory=None) -> list:
     """Returns list of USB devices that are eligible for binding
-    and unbinding. Devices with 'hub' in the description are excluded
-    from the list.  The returned list consists of tuples, with each
-    tuple containing the USB device ID, Tag (Product description), Device
-    number, and state. State is "Enabled" if device is bound, "Disabled"
-    if unbound.
+    and unbinding. Hubs (bDeviceClass 09) are excluded from the list.
+    The returned list consists of tuples, with each tuple containing
+    the USB device ID, Tag (vendor and product names, as lsusb shows
+    them), Device number, and state. State is "Enabled" if device is bound,
+    "Disabled" if unbound.
+
+    Everything is read directly from sysfs in a single pass, so no
+    subprocesses are started.
 
+    :param sysfs_root: Root of the USB sysfs tree. Override to scan a
+                       copy of the tree.
+    :param inventory: UsbInventory to update. Its cached attributes
+                      are used for devices that have not changed since
+                      the last scan.
     :return: List of tuples of USB devices. If no devices were found,
              returns empty list.
     """
-    import re
-    device_re = re.compile("Bus\\s+(?P<bus>\\d+)\\s+"
-                           "Device\\s+(?P<device>\\d+).+"
-                           "ID\\s(?P<id>\\w+:\\w+)\\s(?P<tag>.+)$", re.I)
     devices = []
+    devices_dir = os.path.join(sysfs_root, 'devices')
+    driver_dir = os.path.join(sysfs_root, 'drivers', 'usb')
     try:
-        df = subprocess.check_output("lsusb").decode('utf-8')
-    except subprocess.CalledProcessError as e:
+        entries = os.listdir(devices_dir)
+    except OSError as e:
         print(f"ERROR: {e}", file=sys.stderr)
         return devices
-    for i in df.split('\n'):
-        hub = True  # Assume device is a hub
-        if i:
-            info = device_re.match(i)
-            if info:
-                dinfo = info.groupdict()
-                _bus = dinfo.pop('bus')
-                _device = dinfo.pop('device')
-                # See if the device is a hub. Ignore it if it is
-                cmd = f"sudo lsusb -D /dev/bus/usb/{_bus}/{_device} 2>/dev/null | grep -qi 'bDeviceClass.*Hub'"
-                try:
-                    subprocess.check_output(cmd, shell=True).decode('utf-8')
-                except subprocess.CalledProcessError:
-                    hub = False  # Did not find 'Hub' in 'nDeviceClass'
-                if hub:  # Device is a hub, so skip it.
-                    continue
-                cmd = f"grep -l {_bus}/{_device} /sys/bus/usb/devices/*/uevent 2>/dev/null | tail -1"
-                try:
-                    product = subprocess.check_output(cmd, shell=True).decode('utf-8')
-                except subprocess.CalledProcessError as e:
-                    print(f"ERROR: {e}", file=sys.stderr)
-                    continue
-                if product:
-                    _p = product.split('/')[5]
-                    if os.path.islink(f"/sys/bus/usb/drivers/usb/{_p}"):
-                        status = "Enabled"
-                    else:
-                        status = 'Disabled'
-                    devices.append((dinfo['id'], dinfo['tag'],
-                                    _p, status))
+    try:
+        bound = set(os.listdir(driver_dir))
+    except OSError:
+        bound = set()
+    found = []
+    for _p in entries:
+        # Interfaces (1-1.3:1.0) and root hubs (usb1) are not
+        # eligible for binding/unbinding.
+        if ':' in _p or _p.startswith('usb'):
+            continue
+        _path = os.path.join(devices_dir, _p)
+        if inventory is None:
+            info = _read_usb_device(_path)
+        else:
+            info = inventory.device(_path, _p)
+        # See if the device is a hub. Ignore it if it is
+        if info is None or info['hub']:
+            continue
+        if _p in bound:
+            status = "Enabled"
+        else:
+            status = 'Disabled'
+        found.append(((info['bus'], info['dev']),
+                      (info['id'], info['tag'], _p, status)))
+    # Same order as 'lsusb': by bus, then device number
+    devices = [d for _, d in sorted(found)]
+    if inventory is not None:
+        inventory.update(devices)
     return devices
 
 
+class UsbTelemetry(object):
+    """
+    Samples the power and traffic attributes of USB devices from sysfs.
+    Each sample is compared with the previous one for the same device,
+    so the rates cover the time since the last sample:
+
+        runtime_status   'active', 'suspended', ... (power/runtime_status)
+        active_duration  ms the device has been powered up in total
+                         (power/active_duration)
+        active_rate      Fraction of the time since the last sample the
+                         device was powered up, 0 to 1
+        max_power        mA the device may draw (bMaxPower)
+        speed            Link speed in Mbit/s (speed)
+        urbnum           USB request blocks submitted to the device
+        urb_rate         urbnum increase per second
+
+    Values sysfs does not provide, and rates for a device's first
+    sample, are None. The kernel does not count URB errors per device,
+    so a device that stops passing data shows up as an urb_rate of 0.
+    """
+    # GUI and table columns, in the order row() returns them
+    columns = ["Power", "Max Power", "Speed", "URB/s", "Active"]
+
+    def __init__(self, sysfs_root: str = USB_SYSFS_ROOT,
+                 interval: float = 1.0):
+        self.sysfs_root = sysfs_root
+        self.interval = interval
+        # Port: (monotonic time, urbnum, active_duration) of last sample
+        self._last = {}
+
+    def sample(self, devices: list) -> dict:
+        """
+        :param devices: List of tuples as returned by get_usb_devices
+        :return: Dictionary of port: dictionary of values
+        """
+        _now = time.monotonic()
+        metrics = {}
+        last = {}
+        for d in devices:
+            _path = os.path.join(self.sysfs_root, 'devices', d[2])
+            values = {
+                'runtime_status':
+                    _read_sysfs_attr(_path, 'power/runtime_status') or None,
+                'active_duration':
+                    _int_or_none(_read_sysfs_attr(_path,
+                                                  'power/active_duration')),
+                'max_power':
+                    _int_or_none(_read_sysfs_attr(_path, 'bMaxPower')
+                                 .rstrip('mA')),
+                'speed': _float_or_none(_read_sysfs_attr(_path, 'speed')),
+                'urbnum': _int_or_none(_read_sysfs_attr(_path, 'urbnum')),
+                'urb_rate': None,
+                'active_rate': None,
+            }
+            last[d[2]] = (_now, values['urbnum'], values['active_duration'])
+            previous = self._last.get(d[2])
+            if previous is not None and _now > previous[0]:
+                elapsed = _now - previous[0]
+                # A counter that went down means the device was
+                # re-enumerated
+                if None not in (values['urbnum'], previous[1]) and \
+                        values['urbnum'] >= previous[1]:
+                    values['urb_rate'] = round(
+                        (values['urbnum'] - previous[1]) / elapsed, 1)
+                if None not in (values['active_duration'], previous[2]) \
+                        and values['active_duration'] >= previous[2]:
+                    values['active_rate'] = round(min(
+                        1.0, (values['active_duration'] - previous[2]) /
+                        (elapsed * 1000)), 3)
+            metrics[d[2]] = values
+        self._last = last
+        return metrics
+
+    @staticmethod
+    def row(values: dict) -> tuple:
+        """
+        :param values: Dictionary from sample() for one device
+        :return: Display strings for columns
+        """
+        def _fmt(value, fmt):
+            return '' if value is None else fmt.format(value)
+        values = values or {}
+        return (values.get('runtime_status') or '',
+                _fmt(values.get('max_power'), "{} mA"),
+                _fmt(values.get('speed'), "{:g} Mb/s"),
+                _fmt(values.get('urb_rate'), "{:.1f}"),
+                _fmt(values.get('active_rate'), "{:.0%}"))
+
+
+def _int_or_none(value: str):
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+def _float_or_none(value: str):
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+class UsbInventory(object):
+    """
+    USB devices seen by usb_control.py, kept between runs in a JSON
+    file. Devices are identified by 'vendor:product:serial' rather
+    than by the port they are plugged into, so a device keeps its
+    identity when its cable is moved to another port or the Pi is
+    rebooted. A device without a serial number is identified by
+    'vendor:product:@port' instead.
+
+    The last known port, tag and state of every device is kept, also
+    after the device is unplugged. The sysfs attributes of a device
+    are only read again when the inode or mtime of its sysfs entry
+    changes, which happens when the device is plugged in or
+    re-enumerated. Rescanning an unchanged bus therefore only lists
+    two directories.
+
+    Pass None as the file name to keep the inventory in memory only.
+    """
+    # Unplugged devices remembered. The ones unplugged longest ago are
+    # forgotten first.
+    max_absent = 100
+    # Format of the file. The devices in a file of another version are
+    # read from sysfs again.
+    version = 2
+
+    def __init__(self, _path: str = None):
+        self.path = _path
+        # Identity: {'id', 'serial', 'tag', 'port', 'state', 'bus',
+        #            'dev', 'sysfs', 'present', 'changed'}
+        self.devices = {}
+        # Port: [inode, mtime] of hubs, which are not in devices
+        self.hubs = {}
+        # Port: identity of the devices present at the last scan
+        self.ports = {}
+        # Ports looked at since the last update()
+        self._scanned = set()
+        self._changed = False
+
+    @classmethod
+    def load(cls, _path: str = USB_INVENTORY):
+        """
+        Reads the inventory file. A missing or unreadable file gives an
+        empty inventory.
+
+        :param _path: Inventory file
+        :return: UsbInventory
+        """
+        inventory = cls(_path)
+        try:
+            with open(_path, 'r') as f:
+                data = json.load(f)
+            inventory.devices = data['devices']
+            inventory.hubs = data.get('hubs', {})
+            if data.get('version') != cls.version:
+                for entry in inventory.devices.values():
+                    entry['sysfs'] = None
+                inventory.hubs = {}
+                inventory._changed = True
+        except FileNotFoundError:
+            return inventory
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"WARNING: Ignoring USB inventory {_path}: {e}",
+                  file=sys.stderr)
+            inventory.devices = {}
+            inventory.hubs = {}
+            return inventory
+        inventory.ports = {d['port']: key
+                           for key, d in inventory.devices.items()
+                           if d['present']}
+        return inventory
+
+    def save(self):
+        """
+        Writes the inventory file if anything changed. The file is
+        replaced atomically, so a concurrent reader never sees a
+        partial file.
+
+        :return: None
+        """
+        if self.path is None or not self._changed:
+            return
+        import tempfile
+        _dir = os.path.dirname(os.path.abspath(self.path))
+        try:
+            os.makedirs(_dir, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=_dir, prefix='.usb_control.')
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'version': self.version, 'devices': self.devices,
+                           'hubs': self.hubs}, f,
+                          indent=1, sort_keys=True)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"WARNING: Cannot save USB inventory {self.path}: {e}",
+                  file=sys.stderr)
+        else:
+            self._changed = False
+
+    def device(self, _path: str, port: str):
+        """
+        Returns the identity of the device at port, read from sysfs
+        only if the port's sysfs entry changed since it was recorded.
+
+        :param _path: sysfs device directory
+        :param port: Device designation, e.g. 1-1.3
+        :return: Dictionary as returned by _read_usb_device, or None if
+                 _path is not a device
+        """
+        try:
+            st = os.lstat(_path)
+        except OSError:
+            return None
+        self._scanned.add(port)
+        stamp = [st.st_ino, st.st_mtime_ns]
+        if self.hubs.get(port) == stamp:
+            return {'hub': True}
+        entry = self.devices.get(self.ports.get(port))
+        if entry is not None and entry['sysfs'] == stamp:
+            return dict(entry, hub=False)
+        info = _read_usb_device(_path)
+        if info is None:
+            return None
+        if info['hub']:
+            self.hubs[port] = stamp
+            self._changed = True
+            return info
+        self.hubs.pop(port, None)
+        key = f"{info['id']}:{info['serial'] or '@' + port}"
+        entry = dict(self.devices.get(key, {}), id=info['id'],
+                     serial=info['serial'], tag=info['tag'], port=port,
+                     bus=info['bus'], dev=info['dev'], sysfs=stamp)
+        entry.setdefault('state', '')
+        entry.setdefault('present', False)
+        self.devices[key] = entry
+        # Another device may have been on this port before
+        self.ports[port] = key
+        self._changed = True
+        return info
+
+    def update(self, devices: list):
+        """
+        Records the result of a scan: the state of every device present
+        and which devices are no longer present.
+
+        :param devices: List of tuples as returned by get_usb_devices
+        :return: None
+        """
+        now = round(time.time())
+        present = {}
+        for d in devices:
+            key = self.ports[d[2]]
+            present[key] = d[2]
+            entry = self.devices[key]
+            if not entry['present'] or entry['state'] != d[3]:
+                entry.update(present=True, state=d[3], changed=now)
+                self._changed = True
+        for key, entry in self.devices.items():
+            if entry['present'] and key not in present:
+                entry.update(present=False, changed=now)
+                self._changed = True
+        self.ports = {port: key for key, port in present.items()}
+        for port in set(self.hubs) - self._scanned:
+            del self.hubs[port]
+            self._changed = True
+        self._scanned = set()
+        absent = sorted((entry['changed'], key)
+                        for key, entry in self.devices.items()
+                        if not entry['present'])
+        for _, key in absent[:max(0, len(absent) - self.max_absent)]:
+            del self.devices[key]
+            self._changed = True
+
+    def record(self, devices: list, serials: dict):
+        """
+        Records a device list obtained without a local scan, e.g. from
+        usb_controld.py. Devices new to the inventory have their sysfs
+        attributes read at the next local scan.
+
+        :param devices: List of tuples as returned by get_usb_devices
+        :param serials: Dictionary of port: serial number of the
+                        devices, as returned by serials()
+        :return: None
+        """
+        for d in devices:
+            serial = serials.get(d[2], '')
+            key = f"{d[0]}:{serial or '@' + d[2]}"
+            entry = self.devices.get(key, {})
+            if entry.get('port') != d[2] or entry.get('tag') != d[1]:
+                entry = dict(entry, id=d[0], serial=serial, tag=d[1],
+                             port=d[2], sysfs=None)
+                entry.setdefault('bus', '')
+                entry.setdefault('dev', '')
+                entry.setdefault('state', '')
+                entry.setdefault('present', False)
+                self.devices[key] = entry
+                self._changed = True
+            self.ports[d[2]] = key
+        # The list has no hubs, so keep the ones already recorded
+        self._scanned.update(self.hubs)
+        self.update(devices)
+
+    def serials(self) -> dict:
+        """
+        :return: Dictionary of port: serial number of the devices
+                 present at the last scan
+        """
+        return {port: self.devices[key]['serial']
+                for port, key in self.ports.items()}
+
+    def last_known(self, pattern: str):
+        """
+        Looks for an unplugged device with pattern in its ID, Tag or
+        serial number.
+
+        :param pattern: String to search for (case-insensitive)
+        :return: Inventory entry of the device most recently seen, or
+                 None
+        """
+        pattern = pattern.casefold()
+        matches = [entry for entry in self.devices.values()
+                   if not entry['present'] and
+                   any(pattern in entry[f].casefold()
+                       for f in ('id', 'tag', 'serial'))]
+        return max(matches, key=lambda e: e['changed'], default=None)
+
+
+def _write_usb_driver_file(_device: str, _action: str,
+                           sysfs_root: str = USB_SYSFS_ROOT) -> str:
+    """
+    Writes a device designation to the usb driver's bind or unbind
+    file. Caller must have write access to the file.
+
+    :param _device: Device designation
+    :param _action: bind|unbind
+    :param sysfs_root: Root of the USB sysfs tree
+    :return: Empty string on success, error message otherwise
+    """
+    if _action not in ('bind', 'unbind'):
+        return f"invalid action '{_action}'"
+    if not USB_DEVICE_RE.match(_device):
+        return f"invalid device '{_device}'"
+    try:
+        with open(os.path.join(sysfs_root, 'drivers', 'usb', _action),
+                  'w') as f:
+            f.write(_device)
+    except OSError as e:
+        return str(e)
+    return ''
+
+
+def _privileged_helper(sysfs_root: str = USB_SYSFS_ROOT):
+    """
+    Runs as root (via sudo) on behalf of UsbStateWriter. Reads
+    'action device' lines from stdin, performs each write and answers
+    'OK' or 'ERROR message' on stdout, one line per request.
+
+    :param sysfs_root: Root of the USB sysfs tree
+    :return: None
+    """
+    for line in sys.stdin:
+        try:
+            _action, _device = line.split()
+        except ValueError:
+            _error = "malformed request"
+        else:
+            _error = _write_usb_driver_file(_device, _action, sysfs_root)
+        print(f"ERROR {_error}" if _error else "OK", flush=True)
+
+
+class UsbStateWriter(object):
+    """
+    Performs bind/unbind writes for a batch of devices. Writes go
+    straight to sysfs when the driver files are writable (running as
+    root). Otherwise a single privileged helper is started with sudo
+    and kept open for the whole batch, so sudo runs once per batch
+    rather than once per device.
+
+    The helper needs sudo rights for 'python3 usb_control.py
+    --privileged-helper'. If it cannot be started, e.g. because sudo
+    only allows 'tee' on the driver files as older versions of this
+    script needed, each write is done with 'sudo tee' instead.
+    """
+
+    def __init__(self, sysfs_root: str = USB_SYSFS_ROOT):
+        self.sysfs_root = sysfs_root
+        self.helper = None
+        self.use_tee = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def _start_helper(self):
+        import subprocess
+        self.helper = subprocess.Popen(
+            ['sudo', sys.executable, os.path.abspath(__file__),
+             '--privileged-helper', '--sysfs-root', self.sysfs_root],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            universal_newlines=True, bufsize=1)
+
+    def write(self, _device: str, _action: str) -> str:
+        """
+        Binds or unbinds one device.
+
+        :param _device: Device designation
+        :param _action: bind|unbind
+        :return: Empty string on success, error message otherwise
+        """
+        _path = os.path.join(self.sysfs_root, 'drivers', 'usb', _action)
+        if os.access(_path, os.W_OK):
+            return _write_usb_driver_file(_device, _action, self.sysfs_root)
+        if not self.use_tee:
+            try:
+                if self.helper is None:
+                    self._start_helper()
+                self.helper.stdin.write(f"{_action} {_device}\n")
+                answer = self.helper.stdout.readline().strip()
+            except OSError:
+                answer = ''
+            if answer == 'OK':
+                return ''
+            if answer:
+                return answer.partition(' ')[2]
+            print("WARNING: privileged helper failed. Using sudo tee",
+                  file=sys.stderr)
+            self.close()
+            self.use_tee = True
+        return self._tee(_device, _action, _path)
+
+    @staticmethod
+    def _tee(_device: str, _action: str, _path: str) -> str:
+        import subprocess
+        if _action not in ('bind', 'unbind') or \
+                not USB_DEVICE_RE.match(_device):
+            return f"invalid request '{_action} {_device}'"
+        try:
+            subprocess.run(['sudo', 'tee', _path],
+                           input=_device.encode('utf-8'),
+                           stdout=subprocess.DEVNULL,
+                           stderr=subprocess.DEVNULL, check=True)
+        except (OSError, subprocess.CalledProcessError) as e:
+            return f"{e}. Do you have sudo permissions to run " \
+                   f"'sudo tee {_path}'?"
+        return ''
+
+    def close(self):
+        if self.helper is not None:
+            try:
+                self.helper.stdin.close()
+            except OSError:
+                pass
+            self.helper.wait()
+            self.helper = None
+
+
 def set_usb_device_state(_device: str, _action: str) -> bool:
     """
     Binds (enables) or unbinds (disables) a USB device
@@ -267,19 +1236,114 @@ def set_usb_device_state(_device: str, _action: str) -> bool:
     :param _action: bind|unbind Desired setting for device
     :return True if _action was successful, False otherwise
     """
-    cmd = f"echo {_device} | sudo tee /sys/bus/usb/drivers/usb/{_action} 2>/dev/null"
+    import subprocess
+    _path = f"/sys/bus/usb/drivers/usb/{_action}"
+    if os.access(_path, os.W_OK):
+        _error = _write_usb_driver_file(_device, _action)
+        if _error:
+            print(f"ERROR: {_error}", file=sys.stderr)
+        return not _error
     try:
-        _result = subprocess.check_output(cmd, shell=True).decode('utf-8')
-    except subprocess.CalledProcessError as e:
+        subprocess.run(['sudo', 'tee', _path], input=_device.encode('utf-8'),
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                       check=True)
+    except (OSError, subprocess.CalledProcessError) as e:
         print(f"ERROR: {e}. Do you have sudo permissions to run "
-              f"'sudo tee /sys/bus/usb/drivers/usb/{_action}'?",
+              f"'sudo tee {_path}'?",
               file=sys.stderr)
         return False
     else:
         return True
 
 
-def find_usb_device(_device_string: str, _action: str) -> bool:
+def match_usb_devices(devices: list, patterns=(), regex: str = None,
+                      all_matches: bool = False, serials: dict = None) -> list:
+    """
+    Selects devices whose ID, Tag or serial number contains any of the
+    patterns (case-insensitive substring) or matches regex
+    (case-insensitive).
+
+    :param devices: List of tuples as returned by get_usb_devices
+    :param patterns: Strings to search for in USB device ID, Tag or
+                     serial number
+    :param regex: Regular expression to search for in USB device ID,
+                  Tag or serial number. Every matching device is
+                  selected.
+    :param all_matches: If True, select every device matching each
+                        pattern instead of only the first one
+    :param serials: Dictionary of device designation: serial number,
+                    as returned by UsbInventory.serials. Serial numbers
+                    are not searched if not supplied.
+    :return: List of (pattern, device tuple or None) in pattern order.
+             Each device appears at most once. A pattern with no
+             matching device is returned with None.
+    """
+    import re
+    serials = serials or {}
+    selected = []
+    seen = set()
+    for pattern in patterns:
+        found = False
+        for d in devices:
+            if pattern.casefold() in d[0].casefold() or \
+                    pattern.casefold() in d[1].casefold() or \
+                    pattern.casefold() in serials.get(d[2], '').casefold():
+                found = True
+                if d[2] not in seen:
+                    seen.add(d[2])
+                    selected.append((pattern, d))
+                if not all_matches:
+                    break
+        if not found:
+            selected.append((pattern, None))
+    if regex is not None:
+        _re = re.compile(regex, re.I)
+        for d in devices:
+            if (_re.search(d[0]) or _re.search(d[1]) or
+                    _re.search(serials.get(d[2], ''))) and d[2] not in seen:
+                seen.add(d[2])
+                selected.append((regex, d))
+    return selected
+
+
+def set_usb_devices_state(requests: list, sysfs_root: str = USB_SYSFS_ROOT,
+                          report=None) -> bool:
+    """
+    Binds/unbinds a batch of devices as one transaction. If any write
+    fails, the devices already changed are returned to their previous
+    state in reverse order.
+
+    :param requests: List of (device tuple, action) where the device
+                     tuple is as returned by get_usb_devices and action
+                     is bind|unbind
+    :param sysfs_root: Root of the USB sysfs tree
+    :param report: Called as report(action, device tuple, error,
+                   seconds) after each write, including rollback
+                   writes. error is empty on success.
+    :return: True if every write succeeded, False otherwise
+    """
+    undo = {'bind': 'unbind', 'unbind': 'bind'}
+    done = []
+    with UsbStateWriter(sysfs_root) as writer:
+        for d, _action in requests:
+            _start = time.monotonic()
+            _error = writer.write(d[2], _action)
+            if report:
+                report(_action, d, _error, time.monotonic() - _start)
+            if _error:
+                for _d, _done_action in reversed(done):
+                    _start = time.monotonic()
+                    _undo_error = writer.write(_d[2], undo[_done_action])
+                    if report:
+                        report(f"rollback {undo[_done_action]}", _d,
+                               _undo_error, time.monotonic() - _start)
+                return False
+            done.append((d, _action))
+    return True
+
+
+def find_usb_device(_device_string: str, _action: str,
+                    devices: list = None) -> bool:
     """
     Searches the ID and tag for device_string, and if a match is
     found, calls set_usb_device_state to bind/unbind that USB device.
@@ -287,27 +1351,688 @@ def find_usb_device(_device_string: str, _action: str) -> bool:
     :param _device_string: String to search for in USB device ID or Tag
                             (Product string)
     :param _action: bind|unbind Desired setting for device
+    :param devices: List as returned by get_usb_devices. The devices
+                    are enumerated if not supplied.
     :return True if device was found AND _action was successful, False
             otherwise
     """
-    devices = get_usb_devices()
-    if devices:
-        for d in devices:
-            if _device_string.casefold() in d[0].casefold() or \
-                    _device_string.casefold() in d[1].casefold():
-                if (_action == "bind" and d[3] == "Enabled") or \
-                        (_action == "unbind" and d[3] == "Disabled"):
-                    print(f"ERROR: {_action} requested but device is already {d[3]}",
-                          file=sys.stderr)
-                    return False
-                _answer = set_usb_device_state(d[2], _action)
-                if _answer:
-                    return True
-                else:
-                    return False
+    client = None
+    if devices is None:
+        client = UsbControlClient.connect()
+        devices, lost = list_usb_devices(client)
+        if lost:
+            client = None
+    for _, d in match_usb_devices(devices, [_device_string]):
+        if d is None:
+            return False
+        if (_action == "bind" and d[3] == "Enabled") or \
+                (_action == "unbind" and d[3] == "Disabled"):
+            print(f"ERROR: {_action} requested but device is already {d[3]}",
+                  file=sys.stderr)
+            return False
+        return change_usb_devices_state([(d, _action)], client)[0]
     return False
 
 
+def usb_device_links(_device: str, sysfs_root: str = USB_SYSFS_ROOT) -> dict:
+    """
+    Finds the ALSA sound cards and serial ports the kernel created for
+    a USB device's interfaces.
+
+    :param _device: Device designation, e.g. 1-1.3
+    :param sysfs_root: Root of the USB sysfs tree
+    :return: Dictionary with 'cards' (card numbers) and 'ttys' (tty
+             names, e.g. ttyUSB0) lists
+    """
+    devices_dir = os.path.join(sysfs_root, 'devices')
+    cards = []
+    ttys = []
+    try:
+        interfaces = [e for e in os.listdir(devices_dir)
+                      if e.startswith(_device + ':')]
+    except OSError:
+        interfaces = []
+    for interface in interfaces:
+        _path = os.path.join(devices_dir, interface)
+        try:
+            entries = os.listdir(_path)
+        except OSError:
+            continue
+        for entry in entries:
+            if entry == 'sound':
+                try:
+                    cards += [c[4:] for c in
+                              os.listdir(os.path.join(_path, entry))
+                              if c.startswith('card')]
+                except OSError:
+                    pass
+            elif entry == 'tty':
+                # CDC ACM (ttyACM0)
+                try:
+                    ttys += os.listdir(os.path.join(_path, entry))
+                except OSError:
+                    pass
+            elif entry.startswith('tty'):
+                # USB serial converters (ttyUSB0)
+                ttys.append(entry)
+    return {'cards': sorted(cards), 'ttys': sorted(ttys)}
+
+
+class WatchedDevice(object):
+    """
+    Watchdog state of one --watchdog STRING.
+    """
+
+    def __init__(self, pattern: str):
+        self.pattern = pattern
+        # Device tuple the last time the device was seen
+        self.device = None
+        # Most ALSA cards and ttys seen while the device was healthy
+        self.cards = 0
+        self.ttys = 0
+        # Why the device is unhealthy, or '' if it is healthy
+        self.problem = ''
+        # Consecutive recoveries that did not make the device healthy
+        self.failures = 0
+        # time.monotonic() of the recovery in progress, and of past ones
+        self.recovering_since = None
+        self.recoveries = collections.deque()
+        self.next_attempt = 0.0
+
+
+class UsbWatchdog(object):
+    """
+    Watches USB devices and recovers a wedged one by unbinding it,
+    waiting and binding it again. A device is unhealthy when:
+
+        - it disappears from the bus
+        - an ALSA sound card or tty it had while healthy is gone
+        - the probe command exits non-zero or takes longer than the
+          check interval. The command is run by the shell with
+          USB_DEVICE, USB_ID, USB_TAG, USB_SERIAL, USB_CARDS and
+          USB_TTYS in its environment.
+
+    A device that has been unbound (Disabled) is left alone, so an
+    operator can still take a device offline. The bus is enumerated
+    once per check, however many devices are watched.
+
+    When a recovery does not help, the next one waits twice as long,
+    starting at backoff and up to max_backoff seconds. No device is
+    recovered more than max_recoveries times per hour. A device that
+    disappeared cannot be unbound, so it is only recovered if
+    reset_hub is set, by unbinding and binding the hub it was
+    plugged into. That also resets the other devices on the hub.
+    """
+    # Seconds between the unbind and the bind
+    recover_delay = 2.0
+    # Seconds to wait after a recovery that did not help, doubled on
+    # each further one
+    backoff = 10.0
+    max_backoff = 600.0
+
+    def __init__(self, patterns: list, probe: str = None,
+                 interval: float = 5.0, max_recoveries: int = 6,
+                 reset_hub: bool = False, inventory=None,
+                 sysfs_root: str = USB_SYSFS_ROOT, log=sys.stdout):
+        self.watched = [WatchedDevice(p) for p in patterns]
+        self.probe = probe
+        self.interval = interval
+        self.max_recoveries = max_recoveries
+        self.reset_hub = reset_hub
+        self.inventory = inventory if inventory is not None \
+            else UsbInventory()
+        self.sysfs_root = sysfs_root
+        self.log = log
+        self.writer = UsbStateWriter(sysfs_root)
+        import threading
+        self._stop = threading.Event()
+
+    def _print(self, message: str):
+        print(f"{time.strftime('%Y-%m-%d %H:%M:%S')} {message}",
+              file=self.log, flush=True)
+
+    def run(self):
+        """
+        Checks the devices every interval seconds until stop() is
+        called.
+
+        :return: None
+        """
+        self._print(f"Watching {', '.join(repr(w.pattern) for w in self.watched)} "
+                    f"every {self.interval:g} s")
+        try:
+            while not self._stop.is_set():
+                self.check()
+                self._stop.wait(self.interval)
+        finally:
+            self.writer.close()
+
+    def stop(self, *_):
+        """
+        Makes run() return. Safe to call from a signal handler.
+
+        :return: None
+        """
+        self._stop.set()
+
+    def check(self):
+        """
+        Enumerates the bus once, checks every watched device and
+        recovers the unhealthy ones that are due.
+
+        :return: None
+        """
+        devices = get_usb_devices(self.sysfs_root, self.inventory)
+        self.inventory.save()
+        serials = self.inventory.serials()
+        for w, (_, d) in zip(self.watched, match_usb_devices(
+                devices, [w.pattern for w in self.watched],
+                serials=serials)):
+            if d is not None and d[3] == "Disabled":
+                if w.device is None or w.device[3] != "Disabled":
+                    self._print(f"{d[2]} {d[0]} {d[1]}: unbound. Not "
+                                f"checked until it is bound again")
+                w.device = d
+                continue
+            problem = self._problem(w, d, serials)
+            if d is not None:
+                w.device = d
+            if not problem:
+                if w.problem or w.recovering_since is not None:
+                    took = f" in {time.monotonic() - w.recovering_since:.1f} s" \
+                        if w.recovering_since is not None else ""
+                    self._print(f"{self._name(w)}: healthy again{took}")
+                w.problem = ''
+                w.failures = 0
+                w.recovering_since = None
+                continue
+            if problem != w.problem:
+                self._print(f"{self._name(w)}: {problem}")
+            w.problem = problem
+            self._recover(w, d)
+
+    def _name(self, w: WatchedDevice) -> str:
+        if w.device is None:
+            return f"'{w.pattern}'"
+        return f"{w.device[2]} {w.device[0]} {w.device[1]}"
+
+    def _problem(self, w: WatchedDevice, d, serials: dict) -> str:
+        """
+        :return: Why the device is unhealthy, or '' if it is healthy
+                 or has never been seen
+        """
+        if d is None:
+            return "not present" if w.device is not None else ''
+        links = usb_device_links(d[2], self.sysfs_root)
+        if len(links['cards']) < w.cards:
+            return "ALSA sound card gone"
+        if len(links['ttys']) < w.ttys:
+            return "serial port gone"
+        if self.probe:
+            import subprocess
+            env = dict(os.environ, USB_DEVICE=d[2], USB_ID=d[0],
+                       USB_TAG=d[1], USB_SERIAL=serials.get(d[2], ''),
+                       USB_CARDS=' '.join(links['cards']),
+                       USB_TTYS=' '.join(f"/dev/{t}" for t in links['ttys']))
+            try:
+                result = subprocess.run(self.probe, shell=True, env=env,
+                                        stdin=subprocess.DEVNULL,
+                                        stdout=subprocess.DEVNULL,
+                                        timeout=self.interval)
+            except subprocess.TimeoutExpired:
+                return "probe timed out"
+            if result.returncode != 0:
+                return f"probe failed (exit status {result.returncode})"
+        # Interfaces can take a moment to appear after a bind, so the
+        # most seen is what the device should have
+        w.cards = max(w.cards, len(links['cards']))
+        w.ttys = max(w.ttys, len(links['ttys']))
+        return ''
+
+    def _recover(self, w: WatchedDevice, d):
+        _now = time.monotonic()
+        if _now < w.next_attempt:
+            return
+        while w.recoveries and w.recoveries[0] < _now - 3600:
+            w.recoveries.popleft()
+        if len(w.recoveries) >= self.max_recoveries:
+            self._print(f"{self._name(w)}: {len(w.recoveries)} recoveries "
+                        f"in the past hour. Waiting")
+            w.next_attempt = w.recoveries[0] + 3600
+            return
+        if d is not None:
+            target = d[2]
+        elif self.reset_hub and '.' in w.device[2]:
+            # The parent of 1-1.2.4 is 1-1.2. Root hub ports (1-1)
+            # are never reset.
+            target = w.device[2].rsplit('.', 1)[0]
+        else:
+            return
+        if w.recovering_since is not None:
+            w.failures += 1
+        w.recoveries.append(_now)
+        w.recovering_since = _now
+        w.next_attempt = _now + min(self.max_backoff,
+                                    self.backoff * 2 ** w.failures)
+        for _action in ('unbind', 'bind'):
+            _start = time.monotonic()
+            _error = self.writer.write(target, _action)
+            self._print(f"{self._name(w)}: {_action} {target} "
+                        f"{'OK' if not _error else 'ERROR: ' + _error} "
+                        f"({(time.monotonic() - _start) * 1000:.1f} ms)")
+            if _error:
+                break
+            if _action == 'unbind':
+                self._stop.wait(self.recover_delay)
+
+
+def _print_timing(_action: str, d: tuple, _error: str, seconds: float):
+    """
+    Reports the outcome and duration of one bind/unbind write.
+    """
+    outcome = f"ERROR: {_error}" if _error else "OK"
+    print(f"{_action} {d[2]} {d[0]} {d[1]}: {outcome} "
+          f"({seconds * 1000:.1f} ms)",
+          file=sys.stderr if _error else sys.stdout)
+
+
+def _batch_usb_action(arg_info) -> bool:
+    """
+    Carries out the -b/-u/--bind-all-matching/--unbind-all-matching
+    command line options using a single device enumeration and a
+    single privileged helper.
+
+    :param arg_info: Parsed command line arguments
+    :return: True if every requested device was found and changed
+    """
+    inventory = UsbInventory.load(arg_info.inventory)
+    client = _daemon_client(arg_info)
+    devices, lost = list_usb_devices(client, arg_info.sysfs_root, inventory)
+    if lost:
+        client = None
+    inventory.save()
+    requests = []
+    for _action, patterns, regex in (
+            ('unbind', arg_info.unbind, arg_info.unbind_all_matching),
+            ('bind', arg_info.bind, arg_info.bind_all_matching)):
+        patterns = patterns or []
+        if '-' in patterns:
+            patterns = [p for p in patterns if p != '-'] + \
+                [line.strip() for line in sys.stdin if line.strip()]
+        _lenient = arg_info.all or regex is not None
+        for pattern, d in match_usb_devices(devices, patterns, regex,
+                                            arg_info.all,
+                                            inventory.serials()):
+            if d is None:
+                print(f"ERROR: No device matching '{pattern}' found",
+                      file=sys.stderr)
+                last = inventory.last_known(pattern)
+                if last is not None:
+                    print(f"{last['id']} {last['tag']} was last seen on "
+                          f"{last['port']} at "
+                          f"{time.strftime('%c', time.localtime(last['changed']))}",
+                          file=sys.stderr)
+                return False
+            if (_action == "bind" and d[3] == "Enabled") or \
+                    (_action == "unbind" and d[3] == "Disabled"):
+                if _lenient:
+                    print(f"{_action} {d[2]} {d[0]} {d[1]}: already {d[3]}")
+                    continue
+                print(f"ERROR: {_action} requested but device {d[2]} is "
+                      f"already {d[3]}", file=sys.stderr)
+                return False
+            requests.append((d, _action))
+    return change_usb_devices_state(requests, client, arg_info.sysfs_root,
+                                    report=_print_timing)[0]
+
+
+def format_table(rows: list, headers: list) -> str:
+    """
+    Formats rows as left-aligned fixed-width columns under a header
+    line and a line of dashes, the layout 'tabulate' produced.
+
+    :param rows: Sequences of values, one per row
+    :param headers: Column titles
+    :return: Table text, without a trailing newline
+    """
+    rows = [[str(v) for v in row] for row in rows]
+    widths = [max([len(h)] + [len(row[ix]) for row in rows])
+              for ix, h in enumerate(headers)]
+
+    def _line(values):
+        return '  '.join(v.ljust(w) for v, w in zip(values, widths)).rstrip()
+
+    return '\n'.join([_line(headers), _line('-' * w for w in widths)] +
+                     [_line(row) for row in rows])
+
+
+def _print_rows(rows: list, headers: list, output: str = 'table',
+                header: bool = True):
+    """
+    Prints rows as a table or as CSV.
+
+    :param rows: Sequences of values, one per row
+    :param headers: Column titles
+    :param output: table|csv
+    :param header: Print the CSV header line
+    :return: None
+    """
+    if output == 'csv':
+        import csv
+        writer = csv.writer(sys.stdout)
+        if header:
+            writer.writerow(headers)
+        writer.writerows(rows)
+    else:
+        print(format_table(rows, headers))
+    sys.stdout.flush()
+
+
+def _print_devices(devices: list, telemetry=None, output: str = 'table',
+                   header: bool = True):
+    """
+    Prints the device list as a table, as CSV or as one line of JSON:
+
+        {"time": epoch seconds, "devices": [{"id": ..., "tag": ...,
+         "device": ..., "state": ..., UsbTelemetry values}, ...]}
+
+    :param devices: List of tuples as returned by get_usb_devices
+    :param telemetry: UsbTelemetry to sample, or None
+    :param output: table|csv|json
+    :param header: Print the CSV header line
+    :return: None
+    """
+    metrics = telemetry.sample(devices) if telemetry else {}
+    if output == 'json':
+        print(json.dumps({
+            "time": round(time.time(), 3),
+            "devices": [dict(zip(("id", "tag", "device", "state"), d),
+                             **metrics.get(d[2], {})) for d in devices]}),
+            flush=True)
+        return
+    if not devices and output == 'table':
+        print("No non-hub USB devices found", file=sys.stderr)
+        return
+    headers = ["ID", "Tag", "Device", "State"]
+    if telemetry:
+        headers += UsbTelemetry.columns
+        devices = [d + UsbTelemetry.row(metrics[d[2]]) for d in devices]
+    _print_rows(devices, headers, output, header)
+
+
+def _print_inventory(inventory, output: str = 'table'):
+    """
+    Prints every device in the inventory, unplugged ones included.
+
+    :param inventory: UsbInventory
+    :param output: table|csv|json
+    :return: None
+    """
+    if output == 'json':
+        print(json.dumps(inventory.devices, sort_keys=True))
+        return
+    rows = []
+    for key, d in sorted(inventory.devices.items(),
+                         key=lambda kv: (not kv[1]['present'],
+                                         kv[1]['port'])):
+        rows.append((key, d['tag'], d['port'],
+                     d['state'] if d['present'] else "Unplugged",
+                     time.strftime('%Y-%m-%d %H:%M:%S',
+                                   time.localtime(d['changed']))))
+    _print_rows(rows, ["Identity", "Tag", "Last Device", "State", "Changed"],
+                output)
+
+
+def _benchmark(runs: int, sysfs_root: str, inventory: str):
+    """
+    Times 'usb_control.py -l' from interpreter start to exit, next to a
+    bare interpreter start, and lists the slowest imports reported by
+    'python3 -X importtime'.
+
+    :param runs: Number of times each command is run
+    :param sysfs_root: Root of the USB sysfs tree to list
+    :param inventory: Inventory file to use
+    :return: None
+    """
+    import subprocess
+    import statistics
+    command = [sys.executable, os.path.abspath(__file__), '-l',
+               '--sysfs-root', sysfs_root, '--inventory', inventory]
+    for label, _command in (("python3 -c pass", [sys.executable, '-c',
+                                                  'pass']),
+                            ("usb_control.py -l", command)):
+        times = []
+        for _ in range(runs):
+            _start = time.perf_counter()
+            subprocess.run(_command, stdout=subprocess.DEVNULL,
+                           stderr=subprocess.DEVNULL)
+            times.append((time.perf_counter() - _start) * 1000)
+        print(f"{label}: median {statistics.median(times):.1f} ms, best "
+              f"{min(times):.1f} ms over {runs} runs", file=sys.stderr)
+    result = subprocess.run([sys.executable, '-X', 'importtime'] +
+                            command[1:], stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, universal_newlines=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        fields = line.split('|')
+        if len(fields) == 3 and fields[1].strip().isdigit():
+            imports.append((int(fields[1]), fields[2].rstrip()))
+    print("Slowest imports (cumulative us):", file=sys.stderr)
+    for cumulative, name in sorted(imports, reverse=True)[:10]:
+        print(f"{cumulative:8d} {name}", file=sys.stderr)
+
+
+def _daemon_client(arg_info):
+    """
+    Connects to usb_controld.py unless the user asked for a specific
+    sysfs tree or no daemon is running.
+
+    :param arg_info: Parsed command line arguments
+    :return: UsbControlClient or None
+    """
+    if arg_info.sysfs_root != USB_SYSFS_ROOT:
+        return None
+    return UsbControlClient.connect(arg_info.socket)
+
+
+def _daemon_lost(client, error: Exception):
+    print(f"WARNING: usb_controld.py unavailable ({error}). Using "
+          f"{USB_SYSFS_ROOT} directly", file=sys.stderr)
+    client.close()
+
+
+def list_usb_devices(client=None, sysfs_root: str = USB_SYSFS_ROOT,
+                     inventory=None) -> tuple:
+    """
+    Lists the USB devices through usb_controld.py, or by scanning sysfs
+    when there is no client or the daemon fails. The inventory is
+    updated either way.
+
+    :param client: UsbControlClient or None
+    :param sysfs_root: Root of the USB sysfs tree to scan
+    :param inventory: UsbInventory to update, or None
+    :return: (list as returned by get_usb_devices, the error that made
+             the daemon unusable or None). The client is closed after
+             an error and must not be used again.
+    """
+    if client is not None:
+        try:
+            devices = client.list()
+        except (OSError, ValueError) as e:
+            _daemon_lost(client, e)
+            return get_usb_devices(sysfs_root, inventory), e
+        if inventory is not None and client.serials is not None:
+            inventory.record(devices, client.serials)
+        return devices, None
+    return get_usb_devices(sysfs_root, inventory), None
+
+
+def change_usb_devices_state(requests: list, client=None,
+                             sysfs_root: str = USB_SYSFS_ROOT,
+                             report=None) -> tuple:
+    """
+    set_usb_devices_state through usb_controld.py, or directly when
+    there is no client or the daemon fails.
+
+    :param requests: List of (device tuple, action)
+    :param client: UsbControlClient or None
+    :param sysfs_root: Root of the USB sysfs tree
+    :param report: See set_usb_devices_state
+    :return: (True if every write succeeded, the error that made the
+             daemon unusable or None). The client is closed after an
+             error and must not be used again.
+    """
+    if client is not None:
+        try:
+            return client.set_state(requests, report=report), None
+        except (OSError, ValueError) as e:
+            _daemon_lost(client, e)
+            return set_usb_devices_state(requests, sysfs_root,
+                                         report=report), e
+    return set_usb_devices_state(requests, sysfs_root, report=report), None
+
+
+class UsbControlClient(object):
+    """
+    Client for the optional usb_controld.py daemon. The daemon keeps
+    the device list cached and does bind/unbind as root, so clients
+    need neither a sysfs scan nor sudo.
+    """
+
+    def __init__(self, _path: str = USB_CONTROL_SOCKET,
+                 timeout: float = 5.0):
+        self.path = _path
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        try:
+            self.sock.connect(_path)
+        except OSError:
+            self.sock.close()
+            raise
+        self._file = self.sock.makefile('r', encoding='utf-8')
+        # Port: serial number of the devices in the last list(), or
+        # None if the daemon does not report them
+        self.serials = None
+
+    @classmethod
+    def connect(cls, _path: str = USB_CONTROL_SOCKET):
+        """
+        Connects to the daemon if it is running.
+
+        :param _path: Daemon socket path
+        :return: UsbControlClient, or None if the daemon is not
+                 available
+        """
+        try:
+            return cls(_path)
+        except OSError:
+            return None
+
+    def request(self, **message) -> dict:
+        """
+        Sends one request and waits for the reply.
+
+        :param message: Request fields, e.g. cmd='list'
+        :return: Decoded reply
+        """
+        self.sock.sendall(json.dumps(message).encode('utf-8') + b'\n')
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("usb_controld closed the connection")
+        reply = json.loads(line)
+        if not isinstance(reply, dict):
+            raise ValueError(f"Unexpected reply from usb_controld: {line}")
+        return reply
+
+    def list(self) -> list:
+        """
+        :return: List of tuples as returned by get_usb_devices
+        """
+        reply = self.request(cmd='list')
+        devices = reply.get('devices')
+        if not isinstance(devices, list) or \
+                not all(isinstance(d, list) and len(d) == 4 for d in devices):
+            raise ValueError(f"Unexpected device list from usb_controld: "
+                             f"{devices}")
+        self.serials = reply.get('serials')
+        return [tuple(d) for d in devices]
+
+    def set_state(self, requests: list, report=None) -> bool:
+        """
+        Same as set_usb_devices_state, carried out by the daemon.
+
+        :param requests: List of (device tuple, action)
+        :param report: Called as report(action, device tuple, error,
+                       seconds) for each write the daemon made
+        :return: True if every write succeeded, False otherwise
+        """
+        known = {d[2]: d for d, _ in requests}
+        reply = self.request(cmd='set',
+                             requests=[(d[2], a) for d, a in requests])
+        if 'ok' not in reply:
+            raise ValueError(f"Unexpected reply from usb_controld: {reply}")
+        if 'error' in reply:
+            print(f"ERROR: {reply['error']}", file=sys.stderr)
+        try:
+            for r in reply.get('results', []):
+                if report:
+                    report(r['action'], known[r['device']], r['error'],
+                           r['seconds'])
+        except (KeyError, TypeError):
+            raise ValueError(f"Unexpected results from usb_controld: "
+                             f"{reply['results']}") from None
+        return bool(reply['ok'])
+
+    def subscribe(self):
+        """
+        Turns this connection into a hotplug event source that a
+        UsbEventWatcher can wait on. No other requests can be made on
+        the connection afterwards.
+
+        :return: DaemonEventSource
+        """
+        self.sock.sendall(json.dumps({'cmd': 'subscribe'}).encode('utf-8') +
+                          b'\n')
+        return DaemonEventSource(self)
+
+    def close(self):
+        self._file.close()
+        self.sock.close()
+
+
+class DaemonEventSource(object):
+    """
+    Event source fed by usb_controld.py change notifications. Each
+    notification is reported as a single 'change' UsbEvent.
+    """
+
+    def __init__(self, client: UsbControlClient):
+        self.client = client
+        self.client.sock.setblocking(False)
+        self._buffer = b''
+
+    def fileno(self) -> int:
+        return self.client.sock.fileno()
+
+    def read(self) -> list:
+        try:
+            data = self.client.sock.recv(65536)
+        except (BlockingIOError, InterruptedError):
+            return []
+        if not data:
+            raise EOFError("usb_controld closed the connection")
+        self._buffer += data
+        from usb_events import UsbEvent
+        events = []
+        while b'\n' in self._buffer:
+            _, self._buffer = self._buffer.split(b'\n', 1)
+            events.append(UsbEvent('change', None, self.client.path))
+        return events
+
+    def close(self):
+        self.client.close()
+
+
 def sigint_handler(sig, frame):
     print(f"Signal handler caught {sig} {frame}")
     root.quit()
@@ -321,44 +2046,168 @@ if __name__ == "__main__":
                         version=f"Version: {__version__}")
     parser.add_argument("-l", "--list", action='store_true',
                         help="list available non-hub USB devices")
-    parser.add_argument("-b", "--bind",
+    parser.add_argument("--telemetry", action='store_true',
+                        help="add power and traffic columns (runtime power "
+                             "state, maximum power, speed, USB requests per "
+                             "second and share of time powered up) to the "
+                             "-l list and the GUI")
+    output_group = parser.add_mutually_exclusive_group()
+    output_group.add_argument("--json", action='store_true',
+                              help="with -l, print the devices and their "
+                                   "telemetry as one line of JSON. With "
+                                   "--list-inventory, print the inventory "
+                                   "as JSON")
+    output_group.add_argument("--csv", action='store_true',
+                              help="with -l or --list-inventory, print CSV "
+                                   "instead of a table")
+    parser.add_argument("--watch", action='store_true',
+                        help="with -l, print the list again every "
+                             "--interval seconds until interrupted")
+    parser.add_argument("--interval", type=float, default=1.0,
+                        metavar="SECONDS",
+                        help="telemetry sampling interval for --watch and "
+                             "the GUI's --telemetry columns")
+    parser.add_argument("-b", "--bind", action='append',
                         type=str, metavar="STRING",
                         help="bind (enable) a usb device containing "
-                             "STRING (case-insensitive) in 'lsusb' "
-                             "output ID or Tag fields")
-    parser.add_argument("-u", "--unbind",
+                             "STRING (case-insensitive) in device "
+                             "ID, Tag or serial number. Can be repeated. "
+                             "STRING '-' reads strings from stdin, one "
+                             "per line")
+    parser.add_argument("-u", "--unbind", action='append',
                         type=str, metavar="STRING",
                         help="unbind (disable) a usb device containing "
-                             "STRING (case-insensitive) in 'lsusb' "
-                             "output ID or Tag fields")
+                             "STRING (case-insensitive) in device "
+                             "ID, Tag or serial number. Can be repeated. "
+                             "STRING '-' reads strings from stdin, one "
+                             "per line")
+    parser.add_argument("-a", "--all", action='store_true',
+                        help="apply -b/-u to every device containing "
+                             "STRING rather than only the first one")
+    parser.add_argument("--bind-all-matching",
+                        type=str, metavar="REGEX",
+                        help="bind (enable) every usb device whose ID, "
+                             "Tag or serial number matches regular "
+                             "expression REGEX "
+                             "(case-insensitive)")
+    parser.add_argument("--unbind-all-matching",
+                        type=str, metavar="REGEX",
+                        help="unbind (disable) every usb device whose ID, "
+                             "Tag or serial number matches regular "
+                             "expression REGEX "
+                             "(case-insensitive)")
+    parser.add_argument("--watchdog", action='append', type=str,
+                        metavar="STRING",
+                        help="keep running and recover (unbind and bind "
+                             "again) the device containing STRING when "
+                             "it disappears, loses its sound card or "
+                             "serial port, or fails the --probe. Can be "
+                             "repeated")
+    parser.add_argument("--probe", type=str, metavar="COMMAND",
+                        help="--watchdog shell command that must succeed "
+                             "for each watched device. USB_DEVICE, USB_ID, "
+                             "USB_TAG, USB_SERIAL, USB_CARDS and USB_TTYS "
+                             "are set in its environment")
+    parser.add_argument("--check-interval", type=float, default=5.0,
+                        metavar="SECONDS",
+                        help="--watchdog device check interval")
+    parser.add_argument("--max-recoveries", type=int, default=6,
+                        metavar="N",
+                        help="--watchdog recovers a device at most N times "
+                             "an hour")
+    parser.add_argument("--reset-hub", action='store_true',
+                        help="--watchdog unbinds and binds the hub a "
+                             "device disappeared from. This also resets "
+                             "the other devices on that hub")
+    parser.add_argument("--inventory", type=str, default=USB_INVENTORY,
+                        metavar="FILE",
+                        help="file in which the devices seen are kept, "
+                             "so that a device can be found by serial "
+                             "number and after it is moved to another "
+                             "port")
+    parser.add_argument("--list-inventory", action='store_true',
+                        help="list every device in the inventory "
+                             "FILE, including unplugged devices, with "
+                             "the port it was last seen on")
+    parser.add_argument("--socket", type=str, default=USB_CONTROL_SOCKET,
+                        help="usb_controld.py daemon socket. The daemon "
+                             "is used if it is running")
+    parser.add_argument("--ui-latency", type=float, nargs='?', const=100,
+                        metavar="MS",
+                        help="in the GUI, print every stall of the user "
+                             "interface lasting MS (default 100) "
+                             "milliseconds or more, and a summary on exit")
+    parser.add_argument("--benchmark", type=int, metavar="RUNS",
+                        help=argparse.SUPPRESS)
+    parser.add_argument("--privileged-helper", action='store_true',
+                        help=argparse.SUPPRESS)
+    parser.add_argument("--sysfs-root", type=str, default=USB_SYSFS_ROOT,
+                        help=argparse.SUPPRESS)
     arg_info = parser.parse_args()
     if not sys.platform.startswith('linux'):
         print(f"ERROR: This application only works on Linux", file=sys.stderr)
         sys.exit(1)
-    if arg_info.list:
-        dev_list = get_usb_devices()
-        if dev_list:
-            try:
-                from tabulate import tabulate
-            except ModuleNotFoundError:
-                print("ERROR: Python3 'tabulate' module required. Run 'sudo "
-                      "apt update && sudo apt install python3-tabulate' "
-                      "to install it.", file=sys.stderr)
-                sys.exit(1)
-            else:
-                print(tabulate(dev_list, headers=["ID", "Tag", "Device", "State"]))
-                sys.exit(0)
-        else:
-            print("No non-hub USB devices found", file=sys.stderr)
-            sys.exit(0)
-    if arg_info.bind:
-        answer = find_usb_device(arg_info.bind, "bind")
-        if answer:
+    if arg_info.privileged_helper:
+        _privileged_helper(arg_info.sysfs_root)
+        sys.exit(0)
+    if arg_info.benchmark:
+        _benchmark(arg_info.benchmark, arg_info.sysfs_root,
+                   arg_info.inventory)
+        sys.exit(0)
+    output = 'json' if arg_info.json else 'csv' if arg_info.csv \
+        else 'table'
+    if output != 'table' and not (arg_info.list or arg_info.list_inventory):
+        parser.error("--json and --csv require -l/--list or "
+                     "--list-inventory")
+    if arg_info.watch and not arg_info.list:
+        parser.error("--watch requires -l/--list")
+    if '-' in (arg_info.bind or []) and '-' in (arg_info.unbind or []):
+        parser.error("stdin ('-') can only be read for one of -b and -u")
+    if arg_info.list or arg_info.list_inventory:
+        inventory = UsbInventory.load(arg_info.inventory)
+        daemon = _daemon_client(arg_info)
+        dev_list, lost = list_usb_devices(daemon, arg_info.sysfs_root,
+                                          inventory)
+        if lost:
+            daemon = None
+        inventory.save()
+        if arg_info.list_inventory:
+            _print_inventory(inventory, output)
             sys.exit(0)
-        else:
-            sys.exit(1)
-    if arg_info.unbind:
-        answer = find_usb_device(arg_info.unbind, "unbind")
+        telemetry = None
+        if output == 'json' or arg_info.telemetry:
+            telemetry = UsbTelemetry(arg_info.sysfs_root, arg_info.interval)
+        header = True
+        try:
+            while True:
+                _print_devices(dev_list, telemetry, output, header)
+                if not arg_info.watch:
+                    break
+                # CSV is one stream with a single header line
+                header = output != 'csv'
+                time.sleep(arg_info.interval)
+                dev_list, lost = list_usb_devices(
+                    daemon, arg_info.sysfs_root,
+                    None if daemon else inventory)
+                if lost:
+                    daemon = None
+        except (KeyboardInterrupt, BrokenPipeError):
+            pass
+        sys.exit(0)
+    if arg_info.watchdog:
+        watchdog = UsbWatchdog(arg_info.watchdog, arg_info.probe,
+                               arg_info.check_interval,
+                               arg_info.max_recoveries, arg_info.reset_hub,
+                               UsbInventory.load(arg_info.inventory),
+                               arg_info.sysfs_root)
+        import signal
+        signal.signal(signal.SIGTERM, watchdog.stop)
+        signal.signal(signal.SIGINT, watchdog.stop)
+        watchdog.run()
+        sys.exit(0)
+    if arg_info.bind or arg_info.unbind or arg_info.bind_all_matching \
+            or arg_info.unbind_all_matching:
+        answer = _batch_usb_action(arg_info)
         if answer:
             sys.exit(0)
         else:
@@ -372,6 +2221,9 @@ if __name__ == "__main__":
         sys.exit(1)
         # os.environ.__setitem__('DISPLAY', ':0.0')
 
+    import signal
+    import tkinter as tk
+    from usb_events import open_event_source
     root = tk.Tk()
     root.resizable(width=True, height=True)
     signal.signal(signal.SIGINT, sigint_handler)
@@ -380,6 +2232,25 @@ if __name__ == "__main__":
     # Stop program if window is closed at OS level ('X' in upper right
     # corner or red dot in upper left on Mac)
     root.protocol("WM_DELETE_WINDOW", lambda: root.quit())
-    UsbWindow(root)
+    client = _daemon_client(arg_info)
+    events = None
+    if client:
+        try:
+            events = UsbControlClient(arg_info.socket).subscribe()
+        except OSError as e:
+            _daemon_lost(client, e)
+            client = None
+    if events is None:
+        events = open_event_source()
+    window = UsbWindow(root, events, client,
+                       UsbTelemetry(interval=arg_info.interval)
+                       if arg_info.telemetry else None)
+    probe = None
+    if arg_info.ui_latency is not None:
+        probe = UiLatencyProbe(root, arg_info.ui_latency)
+        probe.start()
     root.mainloop()
+    window.close()
+    if probe:
+        print(probe.summary(), file=sys.stderr)
     sys.exit(0)
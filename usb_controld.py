@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+import sys
+import os
+import json
+import time
+import signal
+import socket
+import selectors
+from nexus_socket import listen_socket
+from usb_events import NetlinkEventSource
+from usb_control import get_usb_devices, set_usb_devices_state, \
+    UsbInventory, USB_SYSFS_ROOT, USB_CONTROL_SOCKET
+
+__author__ = "Steve Magnuson AG7GN"
+__copyright__ = "Copyright 2020, Steve Magnuson"
+__credits__ = ["Steve Magnuson"]
+__license__ = "GPL"
+__version__ = "1.0.3"
+__maintainer__ = "Steve Magnuson"
+__email__ = "ag7gn@arrl.net"
+__status__ = "Production"
+
+class UsbControlDaemon(object):
+    """
+    Root helper that keeps the USB device list in memory and performs
+    bind/unbind on behalf of usb_control.py clients. Clients talk to it
+    over a Unix domain socket, one JSON object per line:
+
+        {"cmd": "list"}
+            -> {"ok": true, "devices": [[ID, Tag, Device, State], ...]}
+        {"cmd": "set", "requests": [[Device, "bind|unbind"], ...]}
+            -> {"ok": true|false, "results": [{"action": ..., "device":
+                ..., "error": ..., "seconds": ...}, ...]}
+        {"cmd": "subscribe"}
+            -> {"event": "devices", "devices": [...]} now and again
+               every time the device list changes
+
+    The device list is rescanned when the kernel reports a USB
+    hotplug event, or every poll_interval seconds if the uevent socket
+    cannot be opened.
+    """
+    # Time (s) to let a burst of hotplug events settle before rescanning
+    settle_time = 0.05
+    # Rescan interval (s) when no hotplug events are available
+    poll_interval = 1.0
+    # Largest request line accepted from a client
+    max_request = 65536
+
+    def __init__(self, listener: socket.socket,
+                 sysfs_root: str = USB_SYSFS_ROOT):
+        self.listener = listener
+        self.sysfs_root = sysfs_root
+        self.selector = selectors.DefaultSelector()
+        self.clients = {}
+        self.subscribers = set()
+        # Keeps rescans to the attributes of changed devices
+        self.inventory = UsbInventory()
+        self.devices = get_usb_devices(sysfs_root, self.inventory)
+        self.running = True
+        self._rescan_at = None
+        self._stop_r, self._stop_w = os.pipe()
+        self.selector.register(self._stop_r, selectors.EVENT_READ,
+                               lambda _: None)
+        listener.setblocking(False)
+        self.selector.register(listener, selectors.EVENT_READ,
+                               self._accept)
+        try:
+            self.events = NetlinkEventSource()
+        except OSError as e:
+            print(f"WARNING: No USB hotplug events ({e}). Polling every "
+                  f"{self.poll_interval} s", file=sys.stderr)
+            self.events = None
+        else:
+            self.selector.register(self.events, selectors.EVENT_READ,
+                                   self._hotplug)
+
+    def run(self):
+        """
+        Serves clients until stop() is called.
+
+        :return: None
+        """
+        while self.running:
+            if self.events is None:
+                timeout = self.poll_interval
+            elif self._rescan_at is not None:
+                timeout = max(0.0, self._rescan_at - time.monotonic())
+            else:
+                timeout = None
+            for key, _ in self.selector.select(timeout):
+                key.data(key.fileobj)
+            if self.events is None or (
+                    self._rescan_at is not None and
+                    time.monotonic() >= self._rescan_at):
+                self._rescan()
+        for conn in list(self.clients):
+            self._drop(conn)
+        self.selector.close()
+        self.listener.close()
+
+    def stop(self, *_):
+        """
+        Makes run() return. Safe to call from a signal handler.
+
+        :return: None
+        """
+        self.running = False
+        os.write(self._stop_w, b'.')
+
+    def _accept(self, listener: socket.socket):
+        try:
+            conn, _ = listener.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        conn.setblocking(False)
+        self.clients[conn] = b''
+        self.selector.register(conn, selectors.EVENT_READ, self._read)
+
+    def _drop(self, conn: socket.socket):
+        self.selector.unregister(conn)
+        self.clients.pop(conn, None)
+        self.subscribers.discard(conn)
+        conn.close()
+
+    def _send(self, conn: socket.socket, message: dict):
+        """
+        Sends one reply or notification. Messages are small, so a
+        client that cannot take a whole message is not reading and is
+        dropped.
+        """
+        data = json.dumps(message).encode('utf-8') + b'\n'
+        try:
+            if conn.send(data) == len(data):
+                return
+        except OSError:
+            pass
+        self._drop(conn)
+
+    def _read(self, conn: socket.socket):
+        try:
+            data = conn.recv(65536)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self._drop(conn)
+            return
+        buffer = self.clients[conn] + data
+        while b'\n' in buffer and conn in self.clients:
+            line, buffer = buffer.split(b'\n', 1)
+            self._handle(conn, line)
+        if conn in self.clients:
+            if len(buffer) > self.max_request:
+                self._drop(conn)
+            else:
+                self.clients[conn] = buffer
+
+    def _handle(self, conn: socket.socket, line: bytes):
+        try:
+            request = json.loads(line)
+            cmd = request['cmd']
+        except (ValueError, KeyError, TypeError):
+            self._send(conn, {"ok": False, "error": "malformed request"})
+            return
+        if cmd == 'list':
+            self._send(conn, {"ok": True, "devices": self.devices,
+                              "serials": self.inventory.serials()})
+        elif cmd == 'subscribe':
+            self.subscribers.add(conn)
+            self._send(conn, {"event": "devices", "devices": self.devices})
+        elif cmd == 'set':
+            requests = request.get('requests', [])
+            if not isinstance(requests, list) or \
+                    not all(isinstance(r, list) and len(r) == 2 and
+                            isinstance(r[0], str) and
+                            r[1] in ('bind', 'unbind') for r in requests):
+                self._send(conn, {"ok": False,
+                                  "error": "requests must be a list of "
+                                           "[device, \"bind\"|\"unbind\"] "
+                                           "pairs"})
+                return
+            self._set(conn, requests)
+        else:
+            self._send(conn, {"ok": False,
+                              "error": f"unknown command '{cmd}'"})
+
+    def _set(self, conn: socket.socket, requests: list):
+        known = {d[2]: d for d in self.devices}
+        batch = []
+        for _device, _action in requests:
+            if _device not in known:
+                self._send(conn, {"ok": False,
+                                  "error": f"unknown device '{_device}'"})
+                return
+            batch.append((known[_device], _action))
+        results = []
+
+        def _report(_action, d, _error, seconds):
+            results.append({"action": _action, "device": d[2],
+                            "error": _error, "seconds": seconds})
+
+        ok = set_usb_devices_state(batch, self.sysfs_root, report=_report)
+        self._send(conn, {"ok": ok, "results": results})
+        self._rescan()
+
+    def _hotplug(self, source):
+        if source.read() and self._rescan_at is None:
+            self._rescan_at = time.monotonic() + self.settle_time
+
+    def _rescan(self):
+        self._rescan_at = None
+        devices = get_usb_devices(self.sysfs_root, self.inventory)
+        if devices != self.devices:
+            self.devices = devices
+            for conn in list(self.subscribers):
+                self._send(conn, {"event": "devices", "devices": devices})
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(prog='usb_controld.py',
+                                     description="USB Device Control daemon")
+    parser.add_argument('-v', '--version', action='version',
+                        version=f"Version: {__version__}")
+    parser.add_argument("-s", "--socket", type=str,
+                        default=USB_CONTROL_SOCKET,
+                        help="Unix domain socket to listen on (ignored "
+                             "when started by systemd socket activation)")
+    parser.add_argument("-g", "--group", type=str, default="sudo",
+                        help="group allowed to use the socket")
+    arg_info = parser.parse_args()
+    if not sys.platform.startswith('linux'):
+        print(f"ERROR: This application only works on Linux", file=sys.stderr)
+        sys.exit(1)
+    daemon = UsbControlDaemon(listen_socket(arg_info.socket, arg_info.group))
+    signal.signal(signal.SIGTERM, daemon.stop)
+    signal.signal(signal.SIGINT, daemon.stop)
+    daemon.run()
+    sys.exit(0)
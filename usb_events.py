@@ -0,0 +1,334 @@
+import os
+import sys
+import socket
+import select
+import struct
+import ctypes
+import ctypes.util
+import threading
+import queue
+import time
+import collections
+
+__author__ = "Steve Magnuson AG7GN"
+__copyright__ = "Copyright 2020, Steve Magnuson"
+__credits__ = ["Steve Magnuson"]
+__license__ = "GPL"
+__version__ = "1.1.0"
+__maintainer__ = "Steve Magnuson"
+__email__ = "ag7gn@arrl.net"
+__status__ = "Production"
+
+NETLINK_KOBJECT_UEVENT = 15
+UEVENT_KERNEL_GROUP = 1
+USB_DEV_ROOT = "/dev/bus/usb"
+USB_ACTIONS = ('add', 'remove', 'bind', 'unbind')
+
+# inotify(7) constants
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_inotify_event = struct.Struct('iIII')
+
+UsbEvent = collections.namedtuple('UsbEvent', ['action', 'device', 'devpath'])
+UsbEvent.__doc__ = """\
+A USB hotplug event. action is one of add|remove|bind|unbind, or
+change when the source only knows that something changed. device
+is the sysfs device name (e.g. '1-1.3') or None if the source does not
+know it, and devpath is the kernel or /dev path that triggered it."""
+
+
+def parse_uevent(_data: bytes):
+    """
+    Parses a kernel uevent netlink message.
+
+    :param _data: Raw message as received from the netlink socket
+    :return: UsbEvent if the message describes a USB device
+             add|remove|bind|unbind, None otherwise
+    """
+    fields = _data.split(b'\0')
+    env = {}
+    for f in fields[1:]:
+        key, sep, value = f.partition(b'=')
+        if sep:
+            env[key.decode('utf-8', 'replace')] = \
+                value.decode('utf-8', 'replace')
+    if env.get('SUBSYSTEM') != 'usb' or \
+            env.get('DEVTYPE') != 'usb_device':
+        return None
+    action = env.get('ACTION', '')
+    if action not in USB_ACTIONS:
+        return None
+    devpath = env.get('DEVPATH', '')
+    return UsbEvent(action, os.path.basename(devpath), devpath)
+
+
+class NetlinkEventSource(object):
+    """
+    Receives USB uevents directly from the kernel via a
+    NETLINK_KOBJECT_UEVENT socket. No privileges are required.
+    """
+
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM,
+                                  NETLINK_KOBJECT_UEVENT)
+        try:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF,
+                                 1024 * 1024)
+            self.sock.bind((0, UEVENT_KERNEL_GROUP))
+        except OSError:
+            self.sock.close()
+            raise
+        self.sock.setblocking(False)
+
+    def fileno(self) -> int:
+        return self.sock.fileno()
+
+    def read(self) -> list:
+        """
+        Reads every pending uevent message.
+
+        :return: List of UsbEvent
+        """
+        events = []
+        while True:
+            try:
+                _data = self.sock.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                break
+            event = parse_uevent(_data)
+            if event:
+                events.append(event)
+        return events
+
+    def close(self):
+        self.sock.close()
+
+
+class InotifyEventSource(object):
+    """
+    Fallback for systems where the uevent socket is unavailable.
+    Watches the device nodes in /dev/bus/usb with inotify, so it
+    reports add and remove but cannot see bind/unbind.
+    """
+
+    def __init__(self, dev_root: str = USB_DEV_ROOT):
+        _libc_name = ctypes.util.find_library('c')
+        if not _libc_name:
+            raise OSError("libc not found")
+        self._libc = ctypes.CDLL(_libc_name, use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.dev_root = dev_root
+        self._watches = {}
+        try:
+            self._add_watch(dev_root)
+            for _bus in os.listdir(dev_root):
+                self._add_watch(os.path.join(dev_root, _bus))
+        except OSError:
+            os.close(self.fd)
+            raise
+
+    def _add_watch(self, _path: str):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(_path),
+                                          IN_CREATE | IN_DELETE)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"Cannot watch {_path}")
+        self._watches[wd] = _path
+
+    def fileno(self) -> int:
+        return self.fd
+
+    def read(self) -> list:
+        """
+        Reads every pending inotify event.
+
+        :return: List of UsbEvent
+        """
+        events = []
+        while True:
+            try:
+                _data = os.read(self.fd, 4096)
+            except (BlockingIOError, InterruptedError):
+                break
+            if not _data:
+                break
+            offset = 0
+            while offset < len(_data):
+                wd, mask, _, length = _inotify_event.unpack_from(_data,
+                                                                 offset)
+                offset += _inotify_event.size
+                name = _data[offset:offset + length].rstrip(b'\0')
+                offset += length
+                _path = os.path.join(self._watches.get(wd, self.dev_root),
+                                     os.fsdecode(name))
+                if mask & IN_ISDIR:
+                    # A new bus appeared
+                    if mask & IN_CREATE:
+                        try:
+                            self._add_watch(_path)
+                        except OSError:
+                            pass
+                    continue
+                action = 'add' if mask & IN_CREATE else 'remove'
+                events.append(UsbEvent(action, None, _path))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FakeEventSource(object):
+    """
+    Replays a scripted list of (delay, UsbEvent) pairs, where delay is
+    the number of seconds after the previous event. Used to exercise
+    the watcher and GUI without USB hardware.
+    """
+
+    def __init__(self, script):
+        self._script = list(script)
+        self._pending = collections.deque()
+        self._lock = threading.Lock()
+        self._r, self._w = os.pipe()
+        os.set_blocking(self._r, False)
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._replay, daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_file(cls, _file):
+        """
+        Builds a FakeEventSource from a file with one event per line:
+        'delay action device', e.g. '0.5 add 1-1.3'. Blank lines and
+        lines starting with '#' are ignored.
+
+        :param _file: Open text file
+        :return: FakeEventSource
+        """
+        script = []
+        for line in _file:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            delay, action, device = line.split()[:3]
+            script.append((float(delay), UsbEvent(action, device, device)))
+        return cls(script)
+
+    def _replay(self):
+        for delay, event in self._script:
+            if self._closed.wait(delay):
+                return
+            with self._lock:
+                self._pending.append(event)
+            os.write(self._w, b'.')
+
+    def fileno(self) -> int:
+        return self._r
+
+    def read(self) -> list:
+        try:
+            os.read(self._r, 4096)
+        except BlockingIOError:
+            pass
+        with self._lock:
+            events = list(self._pending)
+            self._pending.clear()
+        return events
+
+    def close(self):
+        self._closed.set()
+        os.close(self._r)
+        os.close(self._w)
+
+
+def open_event_source():
+    """
+    Returns the best available hotplug event source: the kernel uevent
+    socket if possible, otherwise inotify on /dev/bus/usb.
+
+    :return: Event source object, or None if neither is available
+    """
+    for source in (NetlinkEventSource, InotifyEventSource):
+        try:
+            return source()
+        except (OSError, AttributeError) as e:
+            print(f"WARNING: {source.__name__} unavailable: {e}",
+                  file=sys.stderr)
+    return None
+
+
+class UsbEventWatcher(threading.Thread):
+    """
+    Background thread that waits on an event source and puts each
+    UsbEvent on a thread-safe queue for the Tk thread to collect. The
+    thread sleeps in select() and uses no CPU while the bus is idle.
+    """
+
+    def __init__(self, source, event_queue: queue.Queue = None,
+                 wakeup=None):
+        """
+        :param source: Event source, e.g. from open_event_source()
+        :param event_queue: Queue to put the events on
+        :param wakeup: Called from the thread each time events are
+                       queued and when it ends, so that an event loop
+                       can call drain() at once instead of polling
+        """
+        super().__init__(daemon=True)
+        self.source = source
+        self.queue = event_queue if event_queue is not None \
+            else queue.Queue()
+        self.wakeup = wakeup
+        # Set once the source is closed, before the last wakeup
+        self.finished = False
+        self._stop_r, self._stop_w = os.pipe()
+
+    def run(self):
+        try:
+            while True:
+                ready, _, _ = select.select([self.source, self._stop_r],
+                                            [], [])
+                if self._stop_r in ready:
+                    break
+                _now = time.monotonic()
+                try:
+                    events = self.source.read()
+                except EOFError:
+                    break
+                for event in events:
+                    self.queue.put((_now, event))
+                if events and self.wakeup:
+                    self.wakeup()
+        finally:
+            self.source.close()
+            os.close(self._stop_r)
+            self.finished = True
+            if self.wakeup:
+                self.wakeup()
+
+    def stop(self):
+        """
+        Stops the thread and closes the event source.
+
+        :return: None
+        """
+        try:
+            os.write(self._stop_w, b'.')
+            os.close(self._stop_w)
+        except OSError:
+            pass
+
+    def drain(self) -> list:
+        """
+        Removes and returns all queued events without blocking.
+
+        :return: List of (timestamp, UsbEvent) tuples
+        """
+        events = []
+        while True:
+            try:
+                events.append(self.queue.get_nowait())
+            except queue.Empty:
+                return events
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+
+# Extracts the VNC Server and DWService connection events of the past
+# 24 hours and prints the report that vnc-server-activity.sh mails via
+# patmail.sh. vnc-server-activity.sh uses this script instead of its
+# own grep/date loop when it is installed.
+
+import argparse
+import calendar
+import glob
+import gzip
+import os
+import re
+import sys
+import tempfile
+import time
+
+__author__ = "Steve Magnuson AG7GN"
+__copyright__ = "Copyright 2020, Steve Magnuson"
+__credits__ = ["Steve Magnuson"]
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Steve Magnuson"
+__email__ = "ag7gn@arrl.net"
+__status__ = "Production"
+
+VNC_LOG = "/var/log/user.log"
+DWAGENT_LOG = "/usr/share/dwagent/dwagent.log"
+DEFAULT_AGE = 24
+_MONTHS = {m: n for n, m in enumerate(calendar.month_abbr) if m}
+_ISO_RE = re.compile(r"^(\d{4})-(\d\d)-(\d\d)[T ](\d\d):(\d\d):(\d\d)")
+
+
+class LocalTimeParser(object):
+    """
+    Converts local log timestamps to epoch seconds. mktime() is only
+    called once per hour of log, and the result is cached, so that
+    daylight saving changes are still handled.
+
+    Syslog timestamps have no year. Like vnc-server-activity.sh, a
+    timestamp that would be in the future is taken to be from the
+    previous year, which is what a December entry read in January is.
+    Unlike vnc-server-activity.sh, the previous year's own length is
+    used, not the current one's.
+    """
+
+    def __init__(self, now: float):
+        self.now = now
+        self.year = time.localtime(now).tm_year
+        self._hours = {}
+
+    def _hour(self, year: int, month: int, day: int, hour: int):
+        key = (year, month, day, hour)
+        try:
+            return self._hours[key]
+        except KeyError:
+            pass
+        if 1 <= month <= 12 and \
+                1 <= day <= calendar.monthrange(year, month)[1] and \
+                hour < 24:
+            base = time.mktime((year, month, day, hour, 0, 0, 0, 0, -1))
+        else:
+            base = None
+        self._hours[key] = base
+        return base
+
+    def epoch(self, year, month: int, day: int, hour: int, minute: int,
+              second: int):
+        """
+        :param year: Year, or None if the log does not say
+        :return: Epoch seconds, or None if the timestamp is not a valid
+                 date
+        """
+        if minute > 59 or second > 60:
+            return None
+        base = self._hour(year or self.year, month, day, hour)
+        if base is None:
+            return None
+        _epoch = base + minute * 60 + second
+        if year is None and _epoch > self.now:
+            base = self._hour(self.year - 1, month, day, hour)
+            if base is None:
+                return None
+            _epoch = base + minute * 60 + second
+        return _epoch
+
+    def syslog(self, line: str):
+        """
+        :param line: Log line starting with 'Mon DD HH:MM:SS' or an
+                     RFC 3339 timestamp
+        :return: Epoch seconds, or None
+        """
+        fields = line.split(None, 3)
+        try:
+            if len(fields) >= 3 and fields[0] in _MONTHS:
+                hour, minute, second = fields[2].split(':')
+                return self.epoch(None, _MONTHS[fields[0]], int(fields[1]),
+                                  int(hour), int(minute), int(second))
+        except ValueError:
+            return None
+        return self.iso(line)
+
+    def iso(self, line: str):
+        """
+        :param line: Log line starting with 'YYYY-MM-DD HH:MM:SS'
+        :return: Epoch seconds, or None
+        """
+        match = _ISO_RE.match(line)
+        if not match:
+            return None
+        return self.epoch(*(int(g) for g in match.groups()))
+
+
+def rotated_logs(_path: str) -> list:
+    """
+    :param _path: Log file, e.g. /var/log/user.log
+    :return: The log and its rotated copies (.1, .2.gz, ...), newest
+             first
+    """
+    def _rotation(p):
+        suffix = p[len(_path):].lstrip('.').split('.')[0]
+        return int(suffix) if suffix.isdigit() else 0 if not suffix else -1
+    logs = [p for p in glob.glob(glob.escape(_path) + '*')
+            if _rotation(p) >= 0]
+    return sorted(logs, key=_rotation)
+
+
+def recent_lines(_path: str, keyword: bytes, timestamp, since: float,
+                 until: float):
+    """
+    Yields the lines of a log and its rotated copies that contain
+    keyword and were logged within [since, until]. Rotated copies are
+    read newest first, and plain or gzipped. Reading stops at the
+    first copy last written before since, because everything in it
+    and in the older copies is too old.
+
+    :param _path: Log file
+    :param keyword: Only lines containing this are parsed
+    :param timestamp: Function returning a line's epoch seconds
+    :param since: Oldest epoch seconds wanted
+    :param until: Newest epoch seconds wanted
+    """
+    for log in rotated_logs(_path):
+        try:
+            if os.stat(log).st_mtime < since:
+                break
+            opener = gzip.open if log.endswith('.gz') else open
+            with opener(log, 'rb') as f:
+                for raw in f:
+                    if keyword not in raw:
+                        continue
+                    line = raw.decode('utf-8', 'replace').rstrip('\n')
+                    _epoch = timestamp(line)
+                    if _epoch is not None and since <= _epoch <= until:
+                        yield line
+        except (OSError, EOFError) as e:
+            print(f"WARNING: {log}: {e}", file=sys.stderr)
+
+
+def _fields(line: str, keep) -> str:
+    # tr -s ' ' | cut -d' ' -f...
+    fields = re.sub(' +', ' ', line).split(' ')
+    if len(fields) == 1:
+        return line
+    return ' '.join(f for ix, f in enumerate(fields) if keep(ix + 1))
+
+
+def section(title: str, _path: str, keyword: bytes, timestamp, keep,
+            since: float, until: float, name: str) -> list:
+    """
+    :return: Report lines for one log, as vnc-server-activity.sh
+             wrote them
+    """
+    if not (os.path.isfile(_path) and os.path.getsize(_path) > 0):
+        return [f"No {_path} log", f"     No {name} activity."]
+    events = sorted(set(_fields(line, keep) for line in
+                        recent_lines(_path, keyword, timestamp, since,
+                                     until)))
+    return [title] + (events or [f"     No {name} activity."])
+
+
+def report(now: float, hours: float = DEFAULT_AGE, vnc_log: str = VNC_LOG,
+           dwagent_log: str = DWAGENT_LOG) -> str:
+    """
+    :param now: Epoch seconds the report ends at
+    :param hours: Length of the report period
+    :return: Report text
+    """
+    parser = LocalTimeParser(now)
+    since = now - hours * 3600
+    # Events in the year rollover's "future" are moved back a year, so
+    # the window ends at now
+    vnc = section("VNC Activity", vnc_log, b"Connections", parser.syslog,
+                  lambda f: f <= 3 or f >= 7, since, now, "VNC")
+    dwservice = section("DWService Activity", dwagent_log, b"session",
+                        parser.iso, lambda f: f <= 2 or f >= 5, since, now,
+                        "DWService")
+    return '\n'.join(vnc + [''] + dwservice) + '\n'
+
+
+def _benchmark(lines: int, hours: float):
+    # Generates a user.log spanning a week that ends now, mostly
+    # unrelated messages with some VNC connections, and times report()
+    now = time.time()
+    step = 7 * 86400 / lines
+    with tempfile.TemporaryDirectory() as tmpdir:
+        _path = os.path.join(tmpdir, "user.log")
+        with open(_path, 'w') as f:
+            for n in range(lines):
+                stamp = time.strftime("%b %e %H:%M:%S",
+                                      time.localtime(now - 7 * 86400 +
+                                                     n * step))
+                if n % 50 == 0:
+                    f.write(f"{stamp} nexus vncserver-x11[402]: Connections: "
+                            f"connected: 192.168.1.{n % 250}::{n % 60000} "
+                            f"(TCP)\n")
+                else:
+                    f.write(f"{stamp} nexus pulseaudio[812]: E: [alsa-sink] "
+                            f"snd_pcm_avail() returned a value {n}\n")
+        start = time.perf_counter()
+        text = report(now, hours, _path, os.path.join(tmpdir, "none"))
+        elapsed = time.perf_counter() - start
+    print(f"{lines} lines ({lines // 50} VNC events) in {elapsed:.3f} s, "
+          f"{len(text.splitlines()) - 5} events reported", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog='vnc_server_activity.py',
+        description="Prints the VNC Server and DWService connection "
+                    "events logged in the past hours",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('-v', '--version', action='version',
+                        version=f"Version: {__version__}")
+    parser.add_argument("--hours", type=float, default=DEFAULT_AGE,
+                        help="Report period in hours")
+    parser.add_argument("--vnc_log", type=str, default=VNC_LOG,
+                        help="Syslog file with the VNC Server messages")
+    parser.add_argument("--dwagent_log", type=str, default=DWAGENT_LOG,
+                        help="DWService agent log file")
+    parser.add_argument("--now", type=float,
+                        help="End the report at this epoch time rather "
+                             "than now")
+    parser.add_argument("--benchmark", type=int, metavar="LINES",
+                        help=argparse.SUPPRESS)
+    arg_info = parser.parse_args()
+    if arg_info.benchmark:
+        _benchmark(arg_info.benchmark, arg_info.hours)
+        sys.exit(0)
+    sys.stdout.write(report(arg_info.now or time.time(), arg_info.hours,
+                            arg_info.vnc_log, arg_info.dwagent_log))
+    sys.exit(0)
@@ -11,7 +11,7 @@
 #  CLI mode is suited for say a Raspberry Pi running the Jessie LITE version
 #      where it will run from the CLI w/o requiring Xwindows - uses screen
 
-VERSION="2.2.1"
+VERSION="2.3.1"
 
 RUNMODE=AUTO
 
@@ -85,6 +85,13 @@ function GUI {
 export PATH=/usr/local/bin:$PATH
 export XDG_RUNTIME_DIR=/run/user/`id -u`
 
+TNC_SUPERVISOR_PY="$(dirname "$0")/tnc_supervisor.py"
+if [[ -x $TNC_SUPERVISOR_PY && ${1,,} =~ ^(digiigate|digi|igate)$ ]]
+then # Watches Direwolf and rotates $LOGFILE itself.  Exits at once if already running.
+   # RUNMODE does not apply: Direwolf runs without a terminal window or screen session.
+   exec $TNC_SUPERVISOR_PY ${1,,}
+fi
+
 # Check log file size.  Delete it if it's too big
 find /tmp -type f -name tnc.log -size +100k -delete  2>/dev/null
 